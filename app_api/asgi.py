@@ -4,4 +4,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app_api.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Importado após o setup do Django (usa settings e simplejwt)
+from tasks.events import sse_app  # noqa: E402
+
+EVENTS_PATH = '/api/events/'
+
+
+async def application(scope, receive, send):
+    # O stream de eventos fica fora do Django: conexões longas e ociosas
+    # não devem ocupar threads nem passar pelo middleware a cada evento
+    if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        return await sse_app(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,30 @@
+"""
+Apoio às views assíncronas (modo ASGI, ver gunicorn.conf.py).
+
+No ASGI o Django roda todo código síncrono (ORM inclusive) em UMA thread
+por processo, compartilhada entre as requisições. `in_thread` executa uma
+função síncrona em uma thread do pool do asyncio, para que consultas lentas
+de requisições diferentes rodem em paralelo sem bloquear o event loop.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+def in_thread(func):
+    """
+    Versão awaitable de `func`, executada fora da thread única do Django.
+    As threads do pool mantêm a própria conexão com o banco; conexões velhas
+    (CONN_MAX_AGE) ou com erro são descartadas antes e depois, como o Django
+    faz ao fim de cada requisição.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(wrapper, thread_sensitive=False)
@@ -1,6 +1,9 @@
 from __future__ import absolute_import, unicode_literals
 import os
+import time
 from celery import Celery
+from celery.signals import before_task_publish
+from kombu import Queue
 
 # Define o módulo de configurações padrão do Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app_api.settings')
@@ -10,9 +13,36 @@ app = Celery('easypython')
 # Lê as configurações do arquivo settings.py usando o prefixo CELERY_
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
+# Uma fila por Task.priority. execute_task é roteada pela prioridade da
+# tarefa no envio (tasks.tasks.enqueue_task e agendamentos do beat); as
+# tarefas de manutenção vão para 'low'.
+PRIORITY_QUEUES = ('high', 'medium', 'low')
+DEFAULT_QUEUE = 'medium'
+
+app.conf.task_queues = [Queue(name) for name in PRIORITY_QUEUES]
+app.conf.task_default_queue = DEFAULT_QUEUE
+app.conf.task_routes = {
+    'tasks.tasks.cleanup_old_logs': {'queue': 'low'},
+    'tasks.tasks.archive_old_logs': {'queue': 'low'},
+}
+# Cada processo reserva uma mensagem por vez: uma tarefa baixa já buscada
+# não fica na frente de uma alta que chegou depois
+app.conf.worker_prefetch_multiplier = 1
+
 # Descobre tarefas automaticamente nos apps instalados
 app.autodiscover_tasks()
 
+@before_task_publish.connect
+def stamp_enqueued_at(headers=None, **kwargs):
+    """
+    Marca o horário de envio na mensagem, para medir o tempo de espera na fila.
+    """
+    if headers is not None:
+        headers.setdefault('enqueued_at', time.time())
+
+# Sinais do Celery com as métricas de fila, duração e consultas das tarefas
+from . import metrics  # noqa: E402,F401
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
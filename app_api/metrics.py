@@ -0,0 +1,261 @@
+"""
+Métricas Prometheus da API e dos workers, expostas em /metrics.
+
+Com PROMETHEUS_MULTIPROC_DIR definido (ver Dockerfile), cada processo
+(workers do gunicorn, processos do worker do Celery) grava os valores em
+arquivos mmap no diretório, e a coleta soma os arquivos de todos os
+processos: qualquer worker do gunicorn responde /metrics com o total do
+servidor. O diretório é local a cada container; o worker do Celery expõe
+o próprio total em METRICS_WORKER_PORT. Sem a variável, cada processo tem
+só as próprias métricas (ex.: runserver).
+
+/metrics só responde aos endereços de METRICS_ALLOWED_IPS (IPs ou redes);
+para os demais é 404.
+
+Medidas:
+- requisições da API por view: latência, consultas ao banco e tempo no banco
+- tarefas do Celery (sinais task_prerun/task_postrun): espera na fila,
+  duração e consultas ao banco por tarefa
+- execute_task: duração por tipo, prioridade e status
+- gravação dos logs (TaskLog e trechos de saída)
+"""
+import contextvars
+import ipaddress
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from celery.signals import task_postrun, task_prerun, worker_init, worker_process_shutdown
+from django.db.backends.signals import connection_created
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+logger = logging.getLogger(__name__)
+
+# Mesmas faixas de tasks/stats.py (DURATION_BUCKETS), mais as de requisições rápidas
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+REQUEST_LATENCY = Histogram(
+    'easypython_http_request_duration_seconds', 'Latência das requisições', ['view', 'method', 'status'],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    'easypython_http_request_db_queries', 'Consultas ao banco por requisição', ['view'], buckets=QUERY_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    'easypython_http_request_db_seconds', 'Tempo no banco por requisição', ['view'], buckets=LATENCY_BUCKETS,
+)
+QUEUE_WAIT = Histogram(
+    'easypython_celery_queue_wait_seconds', 'Espera na fila, do envio ao início da tarefa', ['task', 'queue'],
+    buckets=LATENCY_BUCKETS,
+)
+CELERY_TASK_DURATION = Histogram(
+    'easypython_celery_task_duration_seconds', 'Duração das tarefas do Celery', ['task', 'state'],
+    buckets=LATENCY_BUCKETS,
+)
+CELERY_TASK_QUERIES = Histogram(
+    'easypython_celery_task_db_queries', 'Consultas ao banco por tarefa do Celery', ['task'], buckets=QUERY_BUCKETS,
+)
+RUN_DURATION = Histogram(
+    'easypython_task_run_duration_seconds', 'Duração das execuções de Task', ['task_type', 'priority', 'status'],
+    buckets=LATENCY_BUCKETS,
+)
+LOG_WRITE = Histogram(
+    'easypython_log_write_seconds', 'Latência das gravações de log', ['operation'], buckets=LATENCY_BUCKETS,
+)
+
+
+class QueryStats:
+    __slots__ = ('count', 'seconds', 'parent')
+
+    def __init__(self, parent=None):
+        self.count = 0
+        self.seconds = 0.0
+        # Contagem de fora (ex.: tarefa eager dentro de uma requisição), que também soma
+        self.parent = parent
+
+
+# Consultas da requisição ou tarefa atual. Uma ContextVar, e não a conexão,
+# porque as views assíncronas consultam o banco em outras threads
+# (app_api.async_utils.in_thread), que herdam o contexto.
+_queries = contextvars.ContextVar('metrics_queries', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    stats = _queries.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        while stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+            stats = stats.parent
+
+
+@contextmanager
+def track_queries():
+    """
+    Conta as consultas feitas dentro do bloco (inclusive em threads de
+    in_thread); blocos aninhados também somam no de fora.
+    """
+    stats = QueryStats(_queries.get())
+    token = _queries.set(stats)
+    try:
+        yield stats
+    finally:
+        _queries.reset(token)
+
+
+def install_query_counter(connection, **kwargs):
+    # Ligado em toda conexão aberta; a lista sobrevive às reconexões
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+connection_created.connect(install_query_counter)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else '<unresolved>'
+
+
+class MetricsMiddleware:
+    """
+    Latência, consultas e tempo no banco de cada requisição, por view.
+    Síncrono e assíncrono, para não custar uma troca de thread no ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with track_queries() as stats:
+            response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with track_queries() as stats:
+            response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started, stats)
+        return response
+
+    @staticmethod
+    def observe(request, response, elapsed, stats):
+        view = view_name(request)
+        if view == 'metrics':
+            return
+        REQUEST_LATENCY.labels(view, request.method, response.status_code).observe(elapsed)
+        REQUEST_QUERIES.labels(view).observe(stats.count)
+        REQUEST_DB_TIME.labels(view).observe(stats.seconds)
+
+
+def registry():
+    """Registro a expor: o agregado do diretório multiprocesso, ou o do processo."""
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+def allowed(address):
+    """Se `address` (REMOTE_ADDR) está em alguma das redes de METRICS_ALLOWED_IPS."""
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    for network in settings.METRICS_ALLOWED_IPS:
+        try:
+            if address in ipaddress.ip_network(network, strict=False):
+                return True
+        except ValueError:
+            logger.warning(f"Invalid network in METRICS_ALLOWED_IPS: {network}")
+    return False
+
+
+def metrics_view(request):
+    if not allowed(request.META.get('REMOTE_ADDR', '')):
+        raise Http404
+    return HttpResponse(generate_latest(registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+def observe_run(task_type, priority, status, duration):
+    RUN_DURATION.labels(task_type, priority or 'none', status).observe(duration)
+
+
+def log_write(operation):
+    """Context manager que mede uma gravação de log (`operation`: create, finish, chunks, batch)."""
+    return LOG_WRITE.labels(operation).time()
+
+
+@task_prerun.connect
+def start_task_metrics(task=None, **kwargs):
+    request = task.request
+    request.metrics_started = time.perf_counter()
+    request.metrics_queries = QueryStats(_queries.get())
+    request.metrics_token = _queries.set(request.metrics_queries)
+    # Carimbado no envio por app_api.celery.stamp_enqueued_at
+    enqueued_at = getattr(request, 'enqueued_at', None)
+    if enqueued_at:
+        queue = (request.delivery_info or {}).get('routing_key') or 'none'
+        QUEUE_WAIT.labels(task.name, queue).observe(max(time.time() - enqueued_at, 0))
+
+
+@task_postrun.connect
+def finish_task_metrics(task=None, state=None, **kwargs):
+    request = task.request
+    started = getattr(request, 'metrics_started', None)
+    if started is None:
+        return
+    try:
+        _queries.reset(request.metrics_token)
+    except ValueError:
+        # Token de outro contexto (ex.: tarefa eager chamada dentro de outra)
+        _queries.set(None)
+    CELERY_TASK_DURATION.labels(task.name, state or 'none').observe(time.perf_counter() - started)
+    CELERY_TASK_QUERIES.labels(task.name).observe(request.metrics_queries.count)
+
+
+@worker_init.connect
+def start_worker_metrics_server(**kwargs):
+    """Expõe as métricas do worker (todos os processos) em METRICS_WORKER_PORT."""
+    from django.conf import settings
+
+    if not settings.METRICS_WORKER_PORT:
+        return
+    try:
+        start_http_server(settings.METRICS_WORKER_PORT, registry=registry())
+    except OSError as e:
+        logger.error(f"Failed to start metrics server on port {settings.METRICS_WORKER_PORT}: {e}")
+
+
+@worker_process_shutdown.connect
+def mark_worker_process_dead(pid=None, **kwargs):
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -1,34 +1,38 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.response import Response
-from rest_framework.decorators import api_view
+from adrf.decorators import api_view
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
+from .metrics import metrics_view
 from .views import index, UserViewSet
-from tasks.views import TaskViewSet, TaskLogViewSet, dashboard_stats
+from tasks.views import TaskViewSet, TaskLogViewSet, WorkflowViewSet, WorkflowRunViewSet, dashboard_stats, events_ticket
 
 # Router Principal
 router = DefaultRouter()
 router.register(r'tasks', TaskViewSet)
 router.register(r'logs', TaskLogViewSet)
+router.register(r'workflows', WorkflowViewSet)
+router.register(r'workflow-runs', WorkflowRunViewSet)
 router.register(r'users', UserViewSet)
 
 @api_view(['GET'])
-def health_check(request):
+async def health_check(request):
     """
     Endpoint para verificar a saúde do sistema e dependências.
     """
     import os
     import sys
+    from .async_utils import in_thread
     
     # Verifica conexão com DB
     try:
         from django.db import connection
-        connection.ensure_connection()
+        await in_thread(connection.ensure_connection)()
         db_status = "ok"
     except Exception as e:
         db_status = f"error: {str(e)}"
@@ -66,8 +70,10 @@ urlpatterns = [
     path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
     
     path('health/', health_check),
+    path('metrics', metrics_view, name='metrics'),  # Prometheus
     path('', index),
     path('api/stats/', dashboard_stats), # Nova rota de stats
+    path('api/events/ticket/', events_ticket),  # Ticket do stream SSE (/api/events/)
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/', include(router.urls)),
@@ -0,0 +1,129 @@
+"""
+Tarefas 'command' de I/O: executor síncrono em processos (prefork) contra o
+executor asyncio (COMMAND_EXECUTOR=async) em um único processo.
+
+    DJANGO_SETTINGS_MODULE=benchmarks.settings python benchmarks/command_executors.py --jobs 400 --workers 8 --concurrency 64
+
+O comando padrão (`--command`) só espera, como um curl ou rsync lento. No
+modo prefork, `--workers` processos executam execute_task um de cada vez,
+como o worker padrão do Celery. No modo async, um processo com
+`--concurrency` threads (o pool de threads do Celery) executa os comandos
+no event loop compartilhado, com o mesmo limite no semáforo. Para cada
+modo: execuções por segundo, latência por execução e a memória (soma do
+pico de RSS dos processos que executam as tarefas, sem os comandos). O
+resultado sai em JSON no stdout.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+
+from tasks.models import Task, TaskLog  # noqa: E402
+from tasks.tasks import execute_task, run_kwargs  # noqa: E402
+
+
+def run_once(task_id, kwargs):
+    start = time.perf_counter()
+    execute_task.apply(args=[task_id], kwargs=kwargs)
+    elapsed = (time.perf_counter() - start) * 1000
+    connections.close_all()
+    return elapsed
+
+
+def prefork_worker(task_id, runs):
+    connections.close_all()
+    kwargs = run_kwargs(Task.objects.get(id=task_id))
+    timings = [run_once(task_id, kwargs) for _ in range(runs)]
+    # ru_maxrss em KB no Linux
+    return timings, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(mode, jobs, workers, concurrency, command):
+    """Roda no processo filho, com COMMAND_EXECUTOR do modo atual."""
+    call_command('migrate', verbosity=0)
+    user, _ = User.objects.get_or_create(username='bench')
+    task = Task.objects.create(title=f'command executor {mode}', task_type='command', code=command, created_by=user)
+    connections.close_all()
+
+    started = time.perf_counter()
+    if mode == 'prefork':
+        share = [jobs // workers + (1 if i < jobs % workers else 0) for i in range(workers)]
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            results = pool.starmap(prefork_worker, [(task.id, runs) for runs in share])
+        timings = [t for result, _ in results for t in result]
+        rss_kb = sum(rss for _, rss in results)
+        processes = workers
+    else:
+        kwargs = run_kwargs(task)
+        with ThreadPoolExecutor(concurrency) as pool:
+            timings = list(pool.map(lambda _: run_once(task.id, kwargs), range(jobs)))
+        rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        processes = 1
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    written = TaskLog.objects.filter(task=task, status='success').count()
+    return {
+        'jobs': jobs,
+        'processes': processes,
+        'elapsed_s': round(elapsed, 2),
+        'jobs_per_second': round(jobs / elapsed, 1),
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 2),
+        'rss_mb': round(rss_kb / 1024, 1),
+        'lost_logs': jobs - written,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--jobs', type=int, default=400)
+    parser.add_argument('--workers', type=int, default=8, help='Processos no modo prefork')
+    parser.add_argument('--concurrency', type=int, default=64, help='Comandos simultâneos no modo async')
+    parser.add_argument('--command', default='sleep 0.2; echo ok')
+    parser.add_argument('--child', choices=['prefork', 'async'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        settings.COMMAND_EXECUTOR = 'sync' if args.child == 'prefork' else 'async'
+        settings.COMMAND_ASYNC_CONCURRENCY = args.concurrency
+        print(json.dumps(measure(args.child, args.jobs, args.workers, args.concurrency, args.command)))
+        return
+
+    report = {'command': args.command, 'workers': args.workers, 'concurrency': args.concurrency}
+    # Cada modo roda em um processo novo, para o pico de RSS não se misturar
+    for mode in ('prefork', 'async'):
+        output = subprocess.run(
+            [
+                sys.executable, __file__, '--child', mode, '--jobs', str(args.jobs),
+                '--workers', str(args.workers), '--concurrency', str(args.concurrency), '--command', args.command,
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        report[mode] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Carga de execute_task concorrente: vários processos gravando logs ao mesmo tempo.
+
+    DJANGO_SETTINGS_MODULE=benchmarks.settings python benchmarks/concurrent_writes.py --workers 8 --runs 50
+
+Cada processo simula um worker do Celery executando `--runs` vezes uma
+tarefa curta (INSERT do log, trechos de saída, UPDATE final e estatísticas).
+No SQLite, mede o banco sem ajustes (journal DELETE, lock só na escrita) e
+com os ajustes de app_api/database.py (WAL, synchronous=NORMAL, IMMEDIATE);
+com BENCH_DATABASE_URL apontando para um PostgreSQL, mede só ele.
+Execuções cujo log não chegou ao banco (ex.: "database is locked") contam
+como perdidas. O resultado sai em JSON no stdout.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+
+from tasks.models import Task, TaskLog  # noqa: E402
+from tasks.tasks import execute_task, run_kwargs  # noqa: E402
+
+
+def worker(task_id, runs):
+    connections.close_all()
+    task = Task.objects.get(id=task_id)
+    kwargs = run_kwargs(task)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        execute_task.apply(args=[task_id], kwargs=kwargs)
+        timings.append((time.perf_counter() - start) * 1000)
+    connections.close_all()
+    return timings
+
+
+def measure(workers, runs):
+    """Roda no processo filho, com as configurações de banco do modo atual."""
+    call_command('migrate', verbosity=0)
+    if connection.vendor == 'sqlite' and os.environ.get('BENCH_SQLITE_TUNING', '1') != '1':
+        # O modo WAL fica gravado no arquivo: volta ao journal padrão
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=DELETE')
+
+    user, _ = User.objects.get_or_create(username='bench')
+    task = Task.objects.create(title='concurrent writes', task_type='command', code='echo ok; echo warn >&2', created_by=user)
+    connections.close_all()
+
+    started = time.perf_counter()
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        results = pool.starmap(worker, [(task.id, runs)] * workers)
+    elapsed = time.perf_counter() - started
+
+    timings = sorted(t for result in results for t in result)
+    expected = workers * runs
+    written = TaskLog.objects.filter(task=task, status='success').count()
+    return {
+        'runs': expected,
+        'elapsed_s': round(elapsed, 2),
+        'runs_per_second': round(expected / elapsed, 1),
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 2),
+        'max_ms': round(timings[-1], 2),
+        'lost_logs': expected - written,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--runs', type=int, default=50, help='Execuções por processo')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.workers, args.runs)))
+        return
+
+    # Cada modo roda em um processo novo, para as configurações de banco
+    # valerem desde a primeira conexão
+    modes = {'default': {}}
+    if connection.vendor == 'sqlite':
+        modes = {'sqlite_plain': {'BENCH_SQLITE_TUNING': '0'}, 'sqlite_tuned': {'BENCH_SQLITE_TUNING': '1'}}
+
+    report = {'vendor': connection.vendor, 'workers': args.workers}
+    for mode, env in modes.items():
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', '--workers', str(args.workers), '--runs', str(args.runs)],
+            env={**os.environ, **env},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        report[mode] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
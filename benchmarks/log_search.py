@@ -0,0 +1,151 @@
+"""
+Busca na saída dos logs: índice textual (FTS5/tsvector) contra `icontains`.
+
+    DJANGO_SETTINGS_MODULE=benchmarks.settings python benchmarks/log_search.py --mb 2048
+
+Popula o banco de benchmark até `--mb` megabytes de saída (logs de tamanho
+variado, com vocabulário de logs reais e alguns termos raros), mede a
+listagem de /api/logs/?search= com cada backend e a busca ordenada por
+relevância. O resultado sai em JSON no stdout.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models import Sum  # noqa: E402
+from django.db.models.functions import Length  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from tasks import search  # noqa: E402
+from tasks.models import Task, TaskLog  # noqa: E402
+
+WORDS = (
+    'INFO DEBUG WARNING starting finished request response connected database query rows '
+    'processed batch upload download retry cache hit miss worker queue message payload '
+    'user report export import sync backup file bytes seconds elapsed status ok done'
+).split()
+RARE = ['ConnectionRefusedError', 'TimeoutExpired', 'PermissionDenied', 'checksum_mismatch']
+TERMS = {
+    'common': 'database',
+    'rare': 'ConnectionRefusedError',
+    'prefix': 'Timeout',
+    'two_terms': 'backup checksum',
+    'missing': 'inexistente',
+}
+
+
+def make_output(lines):
+    out = []
+    for i in range(lines):
+        words = random.choices(WORDS, k=random.randint(4, 12))
+        if random.random() < 0.001:
+            words.append(random.choice(RARE))
+        out.append(f"[{i:05d}] " + ' '.join(words))
+    return '\n'.join(out)
+
+
+def corpus_mb():
+    total = TaskLog.objects.aggregate(size=Sum(Length('output')))['size'] or 0
+    return total / 1024 / 1024
+
+
+def seed(megabytes, tasks, batch_size=2000):
+    user, _ = User.objects.get_or_create(username='bench')
+    existing = Task.objects.count()
+    if existing < tasks:
+        Task.objects.bulk_create(
+            [Task(title=f'bench {i}', code='print(1)', created_by=user) for i in range(existing, tasks)],
+            batch_size=5000,
+        )
+    task_ids = list(Task.objects.values_list('id', flat=True))
+
+    current = corpus_mb()
+    now = timezone.now()
+    adapt = connection.ops.adapt_datetimefield_value
+    table = TaskLog._meta.db_table
+    while current < megabytes:
+        values = []
+        for _ in range(batch_size):
+            status = 'error' if random.random() < 0.2 else 'success'
+            output = make_output(random.choice([5, 20, 50, 200]))
+            error = make_output(3) if status == 'error' else ''
+            created = adapt(now - timedelta(seconds=random.randint(0, 90 * 86400)))
+            values.append((random.choice(task_ids), status, output, error, random.random() * 10, created))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} (task_id, status, output, error, duration, created_at, output_blob, error_blob) VALUES (%s, %s, %s, %s, %s, %s, '', '')",
+                values,
+            )
+        current += sum(len(v[2]) for v in values) / 1024 / 1024
+        print(f"seeded {current:.0f}/{megabytes} MB", file=sys.stderr)
+
+
+def timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'p50_ms': round(statistics.median(timings), 3),
+        'max_ms': round(timings[-1], 3),
+    }
+
+
+def page(text):
+    # Mesma consulta da primeira página de /api/logs/?search=
+    queryset = TaskLog.objects.select_related('task').order_by('-created_at', '-id')
+    return list(search.filter_logs(queryset, text)[:10])
+
+
+def measure(repeat):
+    results = {}
+    for name, text in TERMS.items():
+        results[name] = {'indexed': timed(lambda: page(text), repeat)}
+        results[name]['ranked'] = timed(lambda: search.ranked_logs(text, 20), repeat)
+        with override_settings(TASK_LOG_SEARCH_BACKEND='none'):
+            results[name]['icontains'] = timed(lambda: page(text), max(1, repeat // 5))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mb', type=int, default=512, help='Tamanho da saída a popular, em MB')
+    parser.add_argument('--tasks', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    seed(args.mb, args.tasks)
+
+    report = {
+        'rows': TaskLog.objects.count(),
+        'output_mb': round(corpus_mb(), 1),
+        'vendor': connection.vendor,
+        'backend': search.backend(),
+        'terms': TERMS,
+        'results': measure(args.repeat),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Celery Beat com muitos agendamentos: DatabaseScheduler contra HeapScheduler.
+
+    DJANGO_SETTINGS_MODULE=benchmarks.settings python benchmarks/scheduler.py --schedules 100000 --due 2000
+
+Cria `--schedules` PeriodicTask com crons variados (hora '*', para que o
+filtro por hora do DatabaseScheduler não descarte nenhum), dos quais
+`--due` estão vencidos no início. Cada scheduler roda em um processo novo
+e mede: carga inicial, memória (pico de RSS), tempo até enviar todos os
+vencidos e o atraso de cada envio (a partir do início do beat), custo de
+um tick sem nada vencido e de um tick logo após alterar um agendamento.
+As mensagens vão para o broker em memória e nenhuma tarefa é executada.
+O resultado sai em JSON no stdout.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from celery.signals import before_task_publish  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from django.utils.module_loading import import_string  # noqa: E402
+from django_celery_beat.models import CrontabSchedule, PeriodicTask  # noqa: E402
+
+from app_api.celery import app  # noqa: E402
+
+SCHEDULERS = {
+    'database': 'django_celery_beat.schedulers.DatabaseScheduler',
+    'heap': 'tasks.scheduler.HeapScheduler',
+}
+# Tarefa não registrada: o beat só publica a mensagem
+TASK = 'benchmarks.noop'
+MINUTES = ['*/5', '*/10', '*/15', '0', '30', '7,37', '0-59/20']
+WEEKDAYS = ['*', '1-5', 'sat,sun']
+
+
+def populate(schedules, due):
+    call_command('migrate', verbosity=0)
+    PeriodicTask.objects.filter(task=TASK).delete()
+    crontabs = [
+        CrontabSchedule.objects.get_or_create(minute=minute, hour='*', day_of_month='*', month_of_year='*', day_of_week=weekday)[0]
+        for minute in MINUTES
+        for weekday in WEEKDAYS
+    ]
+    every_minute = CrontabSchedule.objects.get_or_create(
+        minute='*', hour='*', day_of_month='*', month_of_year='*', day_of_week='*'
+    )[0]
+    now = timezone.now()
+    batch = []
+    for i in range(schedules):
+        is_due = i < due
+        batch.append(PeriodicTask(
+            name=f'{"due" if is_due else "bench"}-{i}',
+            task=TASK,
+            args=json.dumps([i]),
+            crontab=every_minute if is_due else random.choice(crontabs),
+            last_run_at=now,
+        ))
+        if len(batch) == 5000:
+            PeriodicTask.objects.bulk_create(batch)
+            batch = []
+    PeriodicTask.objects.bulk_create(batch)
+
+
+def measure(name, due, ticks):
+    """Roda no processo filho: um scheduler, do início do beat ao último vencido enviado."""
+    warnings.simplefilter('ignore')
+    PeriodicTask.objects.filter(name__startswith='due-').update(last_run_at=timezone.now() - timedelta(minutes=5))
+    sent = []
+
+    @before_task_publish.connect(weak=False)
+    def record(**kwargs):
+        sent.append(time.perf_counter())
+
+    started = time.perf_counter()
+    scheduler = import_string(SCHEDULERS[name])(app=app)
+    scheduler.tick()
+    loaded = time.perf_counter() - started
+    while len(sent) < due and time.perf_counter() - started < 600:
+        scheduler.tick()
+    dispatched = time.perf_counter() - started
+    lags = sorted(t - started for t in sent[:due])
+
+    # Sem nada vencido: custo do tick em si
+    idle = []
+    for _ in range(ticks):
+        tick_started = time.perf_counter()
+        scheduler.tick()
+        idle.append((time.perf_counter() - tick_started) * 1000)
+
+    # Um agendamento alterado (como pelo TaskSerializer): o próximo tick aplica a mudança
+    changed = PeriodicTask.objects.filter(task=TASK, name__startswith='bench-').first()
+    changed.crontab = CrontabSchedule.objects.get_or_create(
+        minute='45', hour='*', day_of_month='*', month_of_year='*', day_of_week='*'
+    )[0]
+    changed.save()
+    time.sleep(getattr(scheduler, 'poll_interval', 0))
+    tick_started = time.perf_counter()
+    scheduler.tick()
+    change_ms = (time.perf_counter() - tick_started) * 1000
+    scheduler.close()
+
+    return {
+        'load_s': round(loaded, 2),
+        'rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'dispatched': len(lags),
+        'dispatch_all_s': round(dispatched, 2),
+        'lag_p50_s': round(statistics.median(lags), 3) if lags else None,
+        'lag_p95_s': round(lags[int(len(lags) * 0.95) - 1], 3) if lags else None,
+        'lag_max_s': round(lags[-1], 3) if lags else None,
+        'idle_tick_ms': round(statistics.median(idle), 3),
+        'tick_after_change_ms': round(change_ms, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--schedules', type=int, default=100000)
+    parser.add_argument('--due', type=int, default=2000, help='Agendamentos vencidos no início')
+    parser.add_argument('--ticks', type=int, default=50, help='Ticks medidos sem nada vencido')
+    parser.add_argument('--child', choices=list(SCHEDULERS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.due, args.ticks)))
+        return
+
+    started = time.perf_counter()
+    populate(args.schedules, args.due)
+    report = {'schedules': args.schedules, 'due': args.due, 'populate_s': round(time.perf_counter() - started, 1)}
+    # Cada scheduler roda em um processo novo, para o pico de RSS não se misturar
+    for name in SCHEDULERS:
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', name, '--due', str(args.due), '--ticks', str(args.ticks)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        report[name] = json.loads(output.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""
+Gerador de dados para a suíte de benchmarks (benchmarks/suite.py).
+
+    DJANGO_SETTINGS_MODULE=benchmarks.settings python benchmarks/seed.py --tasks 10000 --logs 10000000
+
+Popula o banco da suíte (BENCH_DB, padrão /tmp/easypython_suite.sqlite3)
+com volumes de produção: tarefas com a mistura de tipos, prioridades e
+agendamentos do uso real, e logs distribuídos em `--days` dias, com
+poucas tarefas concentrando a maior parte das execuções, ~12% de erros e
+~3% de timeouts, durações log-normais e saídas de tamanho variado. Depois
+recalcula TaskStatsHourly a partir dos logs, como se cada execução tivesse
+passado por stats.record_run, para que /api/stats/ leia agregados
+coerentes com a tabela de logs.
+
+Só adiciona o que falta: rodar de novo com os mesmos números não muda o
+banco. Com o mesmo `--seed` o conteúdo gerado é o mesmo; as datas são
+relativas ao momento da carga. O resumo sai em JSON no stdout.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import timedelta, timezone as dt_timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+# Banco próprio: os outros benchmarks acrescentam logs ao banco padrão
+os.environ.setdefault('BENCH_DB', '/tmp/easypython_suite.sqlite3')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.db.models import Case, Count, IntegerField, Sum, Value, When  # noqa: E402
+from django.db.models.functions import TruncHour  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from django_celery_beat.models import CrontabSchedule, PeriodicTask  # noqa: E402
+
+from tasks.models import Task, TaskLog, TaskStatsHourly  # noqa: E402
+from tasks.stats import DURATION_BUCKETS  # noqa: E402
+from tasks.tasks import queue_for  # noqa: E402
+
+WORDS = (
+    'INFO DEBUG WARNING starting finished request response connected database query rows '
+    'processed batch upload download retry cache hit miss worker queue message payload '
+    'user report export import sync backup file bytes seconds elapsed status ok done'
+).split()
+ERRORS = [
+    'Traceback (most recent call last):\n  File "<task>", line 3, in <module>\nConnectionRefusedError: [Errno 111] Connection refused',
+    'Traceback (most recent call last):\n  File "<task>", line 8, in <module>\nKeyError: \'id\'',
+    'curl: (28) Operation timed out after 30001 milliseconds',
+    'rsync error: some files/attrs were not transferred (code 23)',
+    'PermissionDenied: /var/backups/report.csv',
+]
+SCRIPTS = [
+    "import json\nrows = [{'id': i, 'ok': i % 7 != 0} for i in range(200)]\nprint(json.dumps(rows[:3]))",
+    "total = 0\nfor i in range(10000):\n    total += i * i\nprint('total', total)",
+    "import datetime\nprint('report', datetime.date.today())",
+]
+COMMANDS = [
+    'curl -fsS https://example.com/health',
+    'rsync -a /data/ /backup/data/',
+    'pg_dump app | gzip > /backup/app.sql.gz',
+    'echo sync done',
+]
+CRONS = ['*/5 * * * *', '0 * * * *', '30 2 * * *', '0 9 * * 1-5', '*/15 8-18 * * *', '0 0 1 * *']
+# Linhas de saída por execução: a maioria imprime pouco
+OUTPUT_LINES = {0: 15, 1: 35, 3: 30, 10: 15, 50: 4, 200: 1}
+# Status das execuções finalizadas: ~85% sucesso, ~12% erro, ~3% timeout
+STATUSES = ['success'] * 85 + ['error'] * 12 + ['timeout'] * 3
+
+
+def pick(rng, weighted):
+    """Escolhe uma chave de {valor: peso}."""
+    return rng.choices(list(weighted), weights=list(weighted.values()))[0]
+
+
+def make_lines(rng, count=5000):
+    """Linhas de log variadas; as saídas são sorteadas delas (gerar palavra a palavra domina a carga)."""
+    return [f"{rng.choice(WORDS[:3])} " + ' '.join(rng.choices(WORDS[3:], k=rng.randint(4, 12))) for _ in range(count)]
+
+
+def seed_tasks(count, rng):
+    """Cria as tarefas que faltam para `count`; ~20% com agendamento cron."""
+    user, _ = User.objects.get_or_create(username='bench')
+    existing = Task.objects.count()
+    if existing < count:
+        tasks = []
+        for i in range(existing, count):
+            task_type = pick(rng, {'script': 7, 'command': 3})
+            tasks.append(Task(
+                title=f'bench {task_type} {i}',
+                description='Gerada por benchmarks/seed.py' if rng.random() < 0.5 else None,
+                task_type=task_type,
+                priority=pick(rng, {'low': 2, 'medium': 6, 'high': 2}),
+                concurrency_policy=pick(rng, {'allow': 85, 'skip': 10, 'queue_one': 3, 'replace': 2}),
+                code=rng.choice(SCRIPTS if task_type == 'script' else COMMANDS),
+                enabled=rng.random() < 0.9,
+                timeout=rng.choice([None, None, None, 60, 300, 1800]),
+                created_by=user,
+            ))
+        created = Task.objects.bulk_create(tasks, batch_size=5000)
+
+        crontabs = {}
+        for expression in CRONS:
+            minute, hour, day_of_month, month_of_year, day_of_week = expression.split()
+            crontabs[expression] = CrontabSchedule.objects.get_or_create(
+                minute=minute, hour=hour, day_of_month=day_of_month, month_of_year=month_of_year, day_of_week=day_of_week
+            )[0]
+        scheduled = [task for task in created if rng.random() < 0.2]
+        schedules = PeriodicTask.objects.bulk_create(
+            [
+                PeriodicTask(
+                    name=f'task_{task.id}_{task.title}',
+                    task='tasks.tasks.execute_task',
+                    args=json.dumps([task.id]),
+                    crontab=crontabs[rng.choice(CRONS)],
+                    queue=queue_for(task.priority),
+                    enabled=task.enabled,
+                )
+                for task in scheduled
+            ],
+            batch_size=5000,
+        )
+        for task, schedule in zip(scheduled, schedules):
+            task.schedule = schedule
+        Task.objects.bulk_update(scheduled, ['schedule'], batch_size=5000)
+    return list(Task.objects.order_by('id').values_list('id', flat=True))
+
+
+def seed_logs(rows, task_ids, days, rng, batch_size=20000):
+    """Acrescenta logs finalizados até `rows`. Retorna quantos foram criados."""
+    missing = rows - TaskLog.objects.count()
+    if missing <= 0:
+        return 0
+    # Poucas tarefas concentram a maior parte das execuções (cauda de Pareto)
+    weights = [rng.paretovariate(1.2) for _ in task_ids]
+    lines = make_lines(rng)
+    now = timezone.now()
+    adapt = connection.ops.adapt_datetimefield_value
+    table = TaskLog._meta.db_table
+    created = 0
+    while created < missing:
+        size = min(batch_size, missing - created)
+        values = []
+        for task_id in rng.choices(task_ids, weights=weights, k=size):
+            status = rng.choice(STATUSES)
+            if status == 'timeout':
+                duration = rng.choice([60.0, 300.0, 1800.0])
+            else:
+                duration = min(rng.lognormvariate(-0.5, 1.5), 3600)
+            output = '\n'.join(rng.choices(lines, k=pick(rng, OUTPUT_LINES)))
+            error = rng.choice(ERRORS) if status == 'error' else ''
+            created_at = adapt(now - timedelta(seconds=rng.randint(0, days * 86400)))
+            values.append((task_id, status, output, error, duration, created_at))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} (task_id, status, output, error, duration, created_at, output_blob, error_blob) "
+                "VALUES (%s, %s, %s, %s, %s, %s, '', '')",
+                values,
+            )
+        created += size
+        print(f"seeded {created}/{missing} logs", file=sys.stderr)
+    return created
+
+
+def rebuild_stats(batch_size=5000):
+    """
+    Recalcula TaskStatsHourly a partir dos logs finalizados: contagens por
+    status, soma e histograma das durações (faixas de stats.DURATION_BUCKETS).
+    """
+    bucket = Case(
+        When(duration__isnull=True, then=Value(0)),
+        *[When(duration__lte=limit, then=Value(i)) for i, limit in enumerate(DURATION_BUCKETS)],
+        default=Value(len(DURATION_BUCKETS)),
+        output_field=IntegerField(),
+    )
+    groups = (
+        TaskLog.objects.exclude(status='running')
+        .annotate(hour=TruncHour('created_at', tzinfo=dt_timezone.utc), bucket=bucket)
+        .values('task_id', 'hour', 'status', 'bucket')
+        .annotate(runs=Count('id'), seconds=Sum('duration'))
+        .order_by('task_id', 'hour')
+    )
+
+    TaskStatsHourly.objects.all().delete()
+    batch = []
+    row = None
+    for group in groups.iterator(chunk_size=batch_size):
+        if row is None or (row.task_id, row.hour) != (group['task_id'], group['hour']):
+            if row is not None:
+                batch.append(row)
+            if len(batch) >= batch_size:
+                TaskStatsHourly.objects.bulk_create(batch)
+                batch = []
+            row = TaskStatsHourly(
+                task_id=group['task_id'], hour=group['hour'], duration_histogram=[0] * (len(DURATION_BUCKETS) + 1)
+            )
+        field = {'success': 'success_count', 'timeout': 'timeout_count'}.get(group['status'], 'error_count')
+        setattr(row, field, getattr(row, field) + group['runs'])
+        row.duration_sum += group['seconds'] or 0
+        row.duration_histogram[group['bucket']] += group['runs']
+    if row is not None:
+        batch.append(row)
+    TaskStatsHourly.objects.bulk_create(batch)
+    return TaskStatsHourly.objects.count()
+
+
+def seed(tasks, logs, days=90, seed_value=42):
+    """Popula o banco até `tasks` tarefas e `logs` logs. Retorna o resumo do banco."""
+    call_command('migrate', verbosity=0)
+    rng = random.Random(seed_value)
+    started = time.perf_counter()
+    task_ids = seed_tasks(tasks, rng)
+    created = seed_logs(logs, task_ids, days, rng)
+    if created or not TaskStatsHourly.objects.exists():
+        rebuild_stats()
+    return {
+        'tasks': len(task_ids),
+        'logs': TaskLog.objects.count(),
+        'stats_rows': TaskStatsHourly.objects.count(),
+        'vendor': connection.vendor,
+        'seed_s': round(time.perf_counter() - started, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--logs', type=int, default=10_000_000)
+    parser.add_argument('--days', type=int, default=90, help='Período coberto pelos logs')
+    parser.add_argument('--seed', type=int, default=42, help='Semente do gerador aleatório')
+    args = parser.parse_args()
+    print(json.dumps(seed(args.tasks, args.logs, args.days, args.seed), indent=2))
+
+
+if __name__ == '__main__':
+    main()
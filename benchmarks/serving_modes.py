@@ -0,0 +1,174 @@
+"""
+Vazão e latência da API nos modos de servidor WSGI (sync) e ASGI (uvicorn).
+
+    DJANGO_SETTINGS_MODULE=benchmarks.settings python benchmarks/serving_modes.py --workers 2 --concurrency 32
+
+Sobe o gunicorn com gunicorn.conf.py em cada modo (SERVER_MODE=wsgi|asgi),
+com o mesmo número de processos, e dispara `--concurrency` clientes por
+`--duration` segundos contra os endpoints de leitura (listagem e busca de
+logs, estatísticas e health check). O resultado (RPS, p50 e p99 por
+endpoint) sai em JSON no stdout.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework_simplejwt.tokens import AccessToken  # noqa: E402
+
+from tasks.models import Task, TaskLog  # noqa: E402
+
+ENDPOINTS = {
+    'logs_page': '/api/logs/?limit=50',
+    'logs_search': '/api/logs/?search=database',
+    'stats': '/api/stats/?window=7d',
+    'health': '/health/',
+}
+WORDS = 'INFO request database query rows worker queue backup report sync done'.split()
+
+
+def seed(rows):
+    user, _ = User.objects.get_or_create(username='bench')
+    if not Task.objects.exists():
+        Task.objects.bulk_create([Task(title=f'bench {i}', code='print(1)', created_by=user) for i in range(100)])
+    task_ids = list(Task.objects.values_list('id', flat=True))
+    missing = rows - TaskLog.objects.count()
+    now = timezone.now()
+    adapt = connection.ops.adapt_datetimefield_value
+    while missing > 0:
+        size = min(missing, 10000)
+        values = [
+            (
+                random.choice(task_ids),
+                random.choice(['success', 'success', 'error']),
+                '\n'.join(' '.join(random.choices(WORDS, k=8)) for _ in range(random.randint(1, 40))),
+                '',
+                random.random() * 10,
+                adapt(now - timedelta(seconds=random.randint(0, 30 * 86400))),
+            )
+            for _ in range(size)
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {TaskLog._meta.db_table} (task_id, status, output, error, duration, created_at, output_blob, error_blob) VALUES (%s, %s, %s, %s, %s, %s, '', '')",
+                values,
+            )
+        missing -= size
+    return user
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/health/')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn não respondeu a tempo')
+
+
+def client(port, token, stop_at, results):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    headers = {'Authorization': f'Bearer {token}'}
+    names = list(ENDPOINTS)
+    while time.monotonic() < stop_at:
+        name = random.choice(names)
+        start = time.perf_counter()
+        try:
+            conn.request('GET', ENDPOINTS[name], headers=headers)
+            response = conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            ok = False
+        results.append((name, (time.perf_counter() - start) * 1000, ok))
+    conn.close()
+
+
+def run_mode(mode, workers, concurrency, duration, token):
+    port = free_port()
+    env = {**os.environ, 'SERVER_MODE': mode, 'GUNICORN_WORKERS': str(workers), 'PYTHONPATH': str(ROOT)}
+    server = subprocess.Popen(
+        ['gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{port}', '--access-logfile', '/dev/null'],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(port)
+        results = []
+        stop_at = time.monotonic() + duration
+        threads = [threading.Thread(target=client, args=(port, token, stop_at, results)) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    report = {'requests': len(results), 'rps': round(len(results) / duration, 1), 'errors': sum(1 for r in results if not r[2])}
+    for name in ENDPOINTS:
+        timings = sorted(t for n, t, _ in results if n == name)
+        if timings:
+            report[name] = {
+                'p50_ms': round(statistics.median(timings), 2),
+                'p99_ms': round(timings[max(int(len(timings) * 0.99) - 1, 0)], 2),
+            }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=2, help='Processos do gunicorn em cada modo')
+    parser.add_argument('--concurrency', type=int, default=32, help='Clientes simultâneos')
+    parser.add_argument('--duration', type=int, default=15, help='Segundos de carga por modo')
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    user = seed(args.rows)
+    token = str(AccessToken.for_user(user))
+    connection.close()
+
+    report = {'rows': args.rows, 'workers': args.workers, 'concurrency': args.concurrency}
+    for mode in ('wsgi', 'asgi'):
+        report[mode] = run_mode(mode, args.workers, args.concurrency, args.duration, token)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
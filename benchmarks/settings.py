@@ -0,0 +1,26 @@
+"""
+Configurações para os benchmarks: banco separado do db.sqlite3 do projeto.
+Uso: DJANGO_SETTINGS_MODULE=benchmarks.settings python benchmarks/<script>.py
+
+BENCH_DATABASE_URL aponta para outro banco (ex.: um PostgreSQL de teste);
+BENCH_SQLITE_TUNING=0 desliga WAL/IMMEDIATE para comparação.
+"""
+import os
+
+from app_api.database import database_config
+from app_api.settings import *  # noqa: F401,F403
+from app_api.settings import BASE_DIR
+
+DATABASES = {
+    'default': database_config(
+        os.environ.get('BENCH_DATABASE_URL', 'sqlite:///' + os.environ.get('BENCH_DB', '/tmp/easypython_bench.sqlite3')),
+        BASE_DIR,
+        sqlite_tuning=os.environ.get('BENCH_SQLITE_TUNING', '1') == '1',
+        sqlite_wal=os.environ.get('BENCH_SQLITE_TUNING', '1') == '1',
+    )
+}
+
+CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+CELERY_BROKER_URL = 'memory://'
+CELERY_TASK_ALWAYS_EAGER = True
+EVENTS_ENABLED = False
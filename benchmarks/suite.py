@@ -0,0 +1,268 @@
+"""
+Suíte de benchmarks para comparar commits: serializers, consultas da API e
+vazão do execute_task, sobre o banco populado por benchmarks/seed.py.
+
+    DJANGO_SETTINGS_MODULE=benchmarks.settings python benchmarks/suite.py --output bench-$(git rev-parse --short HEAD).json
+    DJANGO_SETTINGS_MODULE=benchmarks.settings python benchmarks/suite.py --compare bench-abc1234.json
+
+Popula o banco da suíte se preciso (`--tasks`/`--logs`, 10k tarefas e 10M
+logs por padrão; a primeira carga é demorada) e mede cada benchmark
+`--repeat` vezes depois de `--warmup` execuções descartadas:
+
+- serializer.*: TaskSerializer (página da listagem e validação de um
+  script com cron) e TaskLogPreviewSerializer, sem banco no tempo medido
+- api.*: requisições pelo Client do Django (middlewares, autenticação
+  JWT, views), com o cache de respostas limpo antes de cada uma, para
+  medir o caminho até o banco: /api/tasks/, /api/stats/ e /api/logs/ com
+  filtros, busca e busca ordenada
+- engine.*: execute_task no modo eager (broker em memória), scripts no
+  pool de interpretadores e comandos, em execuções por segundo
+
+O resultado (JSON no stdout, ou em `--output`) traz o commit, a versão do
+Python/Django, o banco, o tamanho dos dados e, por benchmark, p50/p95/média
+em ms, operações por segundo e consultas ao banco por operação. Com
+`--compare`, compara o p50 com um resultado anterior e sai com código 1 se
+algum benchmark ficou mais de `--threshold` mais lento.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+# Mesmo banco de benchmarks/seed.py
+os.environ.setdefault('BENCH_DB', '/tmp/easypython_suite.sqlite3')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models import Count  # noqa: E402
+from django.test import Client  # noqa: E402
+from rest_framework_simplejwt.tokens import RefreshToken  # noqa: E402
+
+from app_api.metrics import track_queries  # noqa: E402
+from benchmarks.seed import seed  # noqa: E402
+from tasks.models import Task, TaskLog  # noqa: E402
+from tasks.runner import close_pool  # noqa: E402
+from tasks.serializers import TaskLogPreviewSerializer, TaskSerializer  # noqa: E402
+from tasks.tasks import execute_task, run_kwargs  # noqa: E402
+from tasks.views import TaskViewSet, with_preview  # noqa: E402
+
+REPO = Path(__file__).resolve().parent.parent
+# Termos da busca: comum nas saídas geradas e presente só nos erros
+SEARCH_TERMS = {'common': 'database', 'rare': 'ConnectionRefusedError'}
+
+
+def git_info():
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=REPO, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {'commit': git('rev-parse', 'HEAD'), 'branch': git('rev-parse', '--abbrev-ref', 'HEAD'), 'dirty': bool(status)}
+
+
+def measure(func, repeat, warmup, before=None):
+    """Tempos de `func` em ms; `before` roda antes de cada chamada, fora do tempo medido."""
+    for _ in range(warmup):
+        if before:
+            before()
+        func()
+    # Consultas ao banco de uma chamada (fora das medidas de tempo)
+    if before:
+        before()
+    with track_queries() as queries:
+        func()
+    timings = []
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    mean = statistics.fmean(timings)
+    return {
+        'runs': repeat,
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[max(int(len(timings) * 0.95) - 1, 0)], 3),
+        'mean_ms': round(mean, 3),
+        'ops_per_s': round(1000 / mean, 1) if mean else None,
+        'queries': queries.count,
+    }
+
+
+def serializer_benchmarks(user):
+    # Página da listagem já carregada (mesma consulta de TaskViewSet): só a serialização
+    tasks = list(TaskViewSet(action='list').get_queryset()[:100])
+    logs = list(with_preview(TaskLog.objects.select_related('task').order_by('-created_at'))[:50])
+    payload = {
+        'title': 'bench serializer',
+        'task_type': 'script',
+        'priority': 'high',
+        'code': "import json\nrows = [{'id': i} for i in range(100)]\nprint(json.dumps(rows))",
+        'cron_expression': '*/5 * * * *',
+        'timeout': 60,
+    }
+    return {
+        'serializer.task_list_page': lambda: TaskSerializer(tasks, many=True).data,
+        'serializer.task_validate': lambda: TaskSerializer(data=payload).is_valid(raise_exception=True),
+        'serializer.tasklog_preview_page': lambda: TaskLogPreviewSerializer(logs, many=True).data,
+    }
+
+
+def api_benchmarks(client):
+    # Tarefa com mais logs: o pior caso dos filtros por tarefa
+    busiest = TaskLog.objects.values('task_id').annotate(runs=Count('id')).order_by('-runs').first()
+    task_id = busiest['task_id'] if busiest else Task.objects.values_list('id', flat=True).first()
+
+    def get(url):
+        def call():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {url}: {response.status_code} {response.content[:200]!r}")
+        return call
+
+    benchmarks = {
+        'api.task_list': get('/api/tasks/'),
+        'api.task_logs': get(f'/api/tasks/{task_id}/logs/'),
+        'api.dashboard_stats': get('/api/stats/'),
+        'api.dashboard_stats_24h': get('/api/stats/?window=24h'),
+        'api.dashboard_stats_breakdown': get('/api/stats/?window=7d&breakdown=1'),
+        'api.dashboard_stats_task': get(f'/api/stats/?task={task_id}'),
+        'api.logs_list': get('/api/logs/'),
+        'api.logs_filter_status': get('/api/logs/?status=error'),
+        'api.logs_filter_task': get(f'/api/logs/?task={task_id}'),
+        'api.logs_filter_type_status': get('/api/logs/?task__task_type=command&status=timeout'),
+    }
+    for name, term in SEARCH_TERMS.items():
+        benchmarks[f'api.logs_search_{name}'] = get(f'/api/logs/?search={term}')
+        benchmarks[f'api.logs_ranked_search_{name}'] = get(f'/api/logs/search/?q={term}')
+    return benchmarks
+
+
+def engine_benchmarks(user, created):
+    tasks = {
+        'engine.execute_task_script': Task.objects.create(
+            title='bench suite script', task_type='script', code="total = sum(range(1000))\nprint(total)", created_by=user
+        ),
+        'engine.execute_task_command': Task.objects.create(
+            title='bench suite command', task_type='command', code='echo ok', created_by=user
+        ),
+    }
+
+    def run(task):
+        kwargs = run_kwargs(task)
+
+        def call():
+            result = execute_task.apply(args=[task.id], kwargs=kwargs).get()
+            if not result.endswith('success'):
+                raise RuntimeError(result)
+        return call
+
+    created.extend(tasks.values())
+    return {name: run(task) for name, task in tasks.items()}
+
+
+def run_suite(repeat, warmup, only=None):
+    user, _ = User.objects.get_or_create(username='bench')
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    engine_tasks = []
+    groups = [
+        (lambda: serializer_benchmarks(user), None),
+        # Respostas em cache (tasks/caching.py) mediriam só o cache
+        (lambda: api_benchmarks(client), cache.clear),
+        # Por último: as tarefas criadas aqui não entram nas listagens medidas acima
+        (lambda: engine_benchmarks(user, engine_tasks), None),
+    ]
+    results = {}
+    try:
+        for factory, before in groups:
+            for name, func in factory().items():
+                if only and not any(name.startswith(prefix) for prefix in only):
+                    continue
+                print(f"running {name}", file=sys.stderr)
+                results[name] = measure(func, repeat, warmup, before)
+    finally:
+        close_pool()
+        # Os logs das execuções não ficam no banco da suíte
+        for task in engine_tasks:
+            task.delete()
+    return results
+
+
+def compare(report, baseline, threshold):
+    """Variação do p50 de cada benchmark em relação a `baseline`; regressões acima de `threshold`."""
+    changes = {}
+    regressions = []
+    for name, result in report['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if not before or not before.get('p50_ms'):
+            continue
+        change = result['p50_ms'] / before['p50_ms'] - 1
+        changes[name] = {'baseline_p50_ms': before['p50_ms'], 'p50_ms': result['p50_ms'], 'change': round(change, 3)}
+        if change > threshold:
+            regressions.append(name)
+    return {
+        'baseline_commit': baseline.get('meta', {}).get('commit'),
+        'threshold': threshold,
+        'changes': changes,
+        'regressions': regressions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--logs', type=int, default=10_000_000)
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', help='Prefixos separados por vírgula (ex.: api.logs,engine)')
+    parser.add_argument('--output', help='Arquivo para o resultado em JSON (além do stdout)')
+    parser.add_argument('--compare', help='Resultado anterior (JSON) para comparar')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Piora do p50 considerada regressão')
+    args = parser.parse_args()
+
+    dataset = seed(args.tasks, args.logs)
+    started = time.perf_counter()
+    results = run_suite(args.repeat, args.warmup, args.only.split(',') if args.only else None)
+    report = {
+        'meta': {
+            **git_info(),
+            'timestamp': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': {key: dataset[key] for key in ('tasks', 'logs', 'stats_rows')},
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+            'elapsed_s': round(time.perf_counter() - started, 1),
+        },
+        'results': results,
+    }
+    if args.compare:
+        report['comparison'] = compare(report, json.loads(Path(args.compare).read_text()), args.threshold)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    print(output)
+    if args.compare and report['comparison']['regressions']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
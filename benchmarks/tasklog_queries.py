@@ -0,0 +1,133 @@
+"""
+Latência das consultas quentes sobre TaskLog com e sem os índices compostos.
+
+    DJANGO_SETTINGS_MODULE=benchmarks.settings python benchmarks/tasklog_queries.py --rows 10000000
+
+Popula o banco de benchmark (se ainda não tiver `--rows` logs), mede cada
+consulta com os índices da migração 0006 e, com --compare, repete sem eles.
+O resultado sai em JSON no stdout.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from tasks.models import Task, TaskLog  # noqa: E402
+
+STATUSES = ['success'] * 8 + ['error'] * 2
+
+
+def seed(rows, tasks, batch_size=50000):
+    user, _ = User.objects.get_or_create(username='bench')
+    existing = Task.objects.count()
+    if existing < tasks:
+        Task.objects.bulk_create(
+            [Task(title=f'bench {i}', code='print(1)', created_by=user) for i in range(existing, tasks)],
+            batch_size=5000,
+        )
+    task_ids = list(Task.objects.values_list('id', flat=True))
+
+    missing = rows - TaskLog.objects.count()
+    now = timezone.now()
+    adapt = connection.ops.adapt_datetimefield_value
+    table = TaskLog._meta.db_table
+    while missing > 0:
+        size = min(batch_size, missing)
+        values = [
+            (
+                random.choice(task_ids),
+                random.choice(STATUSES),
+                'line\n' * random.randint(0, 20),
+                '',
+                random.random() * 10,
+                adapt(now - timedelta(seconds=random.randint(0, 90 * 86400))),
+            )
+            for _ in range(size)
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} (task_id, status, output, error, duration, created_at, output_blob, error_blob) VALUES (%s, %s, %s, %s, %s, %s, '', '')",
+                values,
+            )
+        missing -= size
+        print(f"seeded {rows - missing}/{rows}", file=sys.stderr)
+    return task_ids
+
+
+def queries(task_ids):
+    cutoff = timezone.now() - timedelta(days=30)
+    return {
+        'task_history': lambda: list(TaskLog.objects.filter(task_id=random.choice(task_ids))[:50]),
+        'status_page': lambda: list(TaskLog.objects.filter(status='error').order_by('-created_at')[:10]),
+        'global_page': lambda: list(TaskLog.objects.order_by('-created_at')[:10]),
+        'retention_count': lambda: TaskLog.objects.filter(created_at__lt=cutoff).count(),
+        'oldest_log': lambda: TaskLog.objects.order_by('created_at').values_list('created_at', flat=True).first(),
+    }
+
+
+def measure(task_ids, repeat):
+    results = {}
+    for name, query in queries(task_ids).items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            query()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        results[name] = {
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 3),
+            'max_ms': round(timings[-1], 3),
+        }
+    return results
+
+
+def set_indexes(enabled):
+    with connection.schema_editor() as editor:
+        for index in TaskLog._meta.indexes:
+            if enabled:
+                editor.add_index(TaskLog, index)
+            else:
+                editor.remove_index(TaskLog, index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--tasks', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--compare', action='store_true', help='Mede também sem os índices compostos')
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    task_ids = seed(args.rows, args.tasks)
+
+    report = {'rows': TaskLog.objects.count(), 'vendor': connection.vendor, 'indexed': measure(task_ids, args.repeat)}
+    if args.compare:
+        set_indexes(False)
+        try:
+            report['unindexed'] = measure(task_ids, args.repeat)
+        finally:
+            set_indexes(True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
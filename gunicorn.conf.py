@@ -1,4 +1,5 @@
 import multiprocessing
+import os
 
 # Gunicorn configuration file
 # https://docs.gunicorn.org/en/stable/configure.html#configuration-file
@@ -6,9 +7,22 @@ import multiprocessing
 # Server socket
 bind = "0.0.0.0:80"
 
+# Modo do servidor (SERVER_MODE):
+# - "wsgi": workers síncronos, um request por processo por vez (padrão)
+# - "asgi": workers uvicorn sobre app_api/asgi.py; um processo atende vários
+#   requests ao mesmo tempo e serve o stream de eventos (/api/events/)
+server_mode = os.environ.get("SERVER_MODE", "wsgi")
+
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+if server_mode == "asgi":
+    wsgi_app = "app_api.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+    default_workers = multiprocessing.cpu_count() + 1
+else:
+    wsgi_app = "app_api.wsgi:application"
+    worker_class = "sync"
+    default_workers = multiprocessing.cpu_count() * 2 + 1
+workers = int(os.environ.get("GUNICORN_WORKERS", default_workers))
 
 # Logging
 accesslog = "-"  # Print to stdout
@@ -21,3 +35,11 @@ keepalive = 5
 
 # Process naming
 proc_name = "django_app"
+
+
+def child_exit(server, worker):
+    # Métricas Prometheus no modo multiprocesso (app_api/metrics.py)
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,5 +1,28 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 class TasksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tasks'
+
+    def ready(self):
+        from django_celery_beat.models import ClockedSchedule, CrontabSchedule, IntervalSchedule, PeriodicTask, SolarSchedule
+
+        from .caching import invalidate_schedules, invalidate_tasks
+        from .models import Task
+        from .scheduler import record_change, record_schedule_change
+        from .search import ensure_index
+
+        post_migrate.connect(ensure_index, sender=self)
+
+        # Respostas em cache da API (ver tasks/caching.py)
+        for signal in (post_save, post_delete):
+            signal.connect(invalidate_tasks, sender=Task)
+            signal.connect(invalidate_schedules, sender=PeriodicTask)
+            signal.connect(invalidate_schedules, sender=CrontabSchedule)
+
+        # Mudanças nos agendamentos, aplicadas uma a uma pelo HeapScheduler
+        for signal in (post_save, post_delete):
+            signal.connect(record_change, sender=PeriodicTask)
+        for model in (CrontabSchedule, IntervalSchedule, SolarSchedule, ClockedSchedule):
+            post_save.connect(record_schedule_change, sender=model)
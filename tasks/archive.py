@@ -0,0 +1,115 @@
+"""
+Arquivamento de logs antigos em tabelas mensais.
+
+Logs mais antigos que TASK_LOG_ARCHIVE_AFTER_DAYS saem da tabela quente
+(tasks_tasklog) em lotes por faixa de id e vão para uma tabela por mês
+(tasks_tasklog_archive_AAAAMM). Expirar um mês inteiro passa a ser um
+DROP TABLE, em vez de um DELETE gigante. Os trechos de saída
+(TaskLogChunk) e os blobs não são arquivados; fica a cópia em
+TaskLog.output (os blobs sem referência saem em cleanup_old_logs).
+"""
+import logging
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+
+from .models import TaskLog, TaskLogChunk
+
+logger = logging.getLogger(__name__)
+
+TABLE_PREFIX = 'tasks_tasklog_archive_'
+TABLE_PATTERN = re.compile(rf'^{TABLE_PREFIX}(\d{{4}})(\d{{2}})$')
+COLUMNS = ('id', 'task_id', 'status', 'output', 'error', 'duration', 'created_at')
+
+
+def month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(value):
+    return value.replace(year=value.year + 1, month=1) if value.month == 12 else value.replace(month=value.month + 1)
+
+
+def partition_name(month):
+    return f"{TABLE_PREFIX}{month:%Y%m}"
+
+
+def list_partitions():
+    """Retorna {mês (datetime UTC): nome da tabela} das partições existentes."""
+    partitions = {}
+    for name in connection.introspection.table_names():
+        match = TABLE_PATTERN.match(name)
+        if match:
+            month = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=dt_timezone.utc)
+            partitions[month] = name
+    return partitions
+
+
+def ensure_partition(month):
+    name = partition_name(month)
+    if name not in connection.introspection.table_names():
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(c) for c in COLUMNS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {quote(name)} AS SELECT {columns} FROM {quote(TaskLog._meta.db_table)} WHERE 1 = 0"
+            )
+            cursor.execute(f"CREATE INDEX {quote(name + '_task')} ON {quote(name)} ({quote('task_id')}, {quote('created_at')})")
+    return name
+
+
+def archive_logs(before, batch_size=5000):
+    """
+    Move os logs criados antes de `before` para as partições mensais.
+    Cada lote (faixa de ids) é copiado e removido na mesma transação.
+    Retorna o total de logs movidos.
+    """
+    quote = connection.ops.quote_name
+    adapt = connection.ops.adapt_datetimefield_value
+    source = quote(TaskLog._meta.db_table)
+    columns = ', '.join(quote(c) for c in COLUMNS)
+    moved = 0
+
+    oldest = TaskLog.objects.filter(created_at__lt=before).order_by('created_at').values_list('created_at', flat=True).first()
+    if oldest is None:
+        return 0
+
+    month = month_start(oldest)
+    while month < before:
+        end = min(next_month(month), before)
+        logs = TaskLog.objects.filter(created_at__gte=month, created_at__lt=end)
+        bounds = logs.order_by('id').values_list('id', flat=True)
+        low = bounds.first()
+        if low is not None:
+            target = quote(ensure_partition(month))
+            high = logs.order_by('-id').values_list('id', flat=True).first()
+            while low <= high:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(
+                        f"INSERT INTO {target} ({columns}) SELECT {columns} FROM {source} "
+                        f"WHERE id >= %s AND id < %s AND created_at >= %s AND created_at < %s",
+                        [low, low + batch_size, adapt(month), adapt(end)],
+                    )
+                    count = cursor.rowcount
+                    batch = TaskLog.objects.filter(id__gte=low, id__lt=low + batch_size, created_at__gte=month, created_at__lt=end)
+                    TaskLogChunk.objects.filter(log__in=batch.values('id'))._raw_delete(connection.alias)
+                    batch._raw_delete(connection.alias)
+                moved += max(count, 0)
+                low += batch_size
+        logger.info(f"Archived logs up to {end:%Y-%m-%d} ({moved} total)")
+        month = next_month(month)
+    return moved
+
+
+def drop_partitions(before):
+    """
+    Remove (DROP TABLE) as partições de meses inteiramente anteriores a `before`.
+    """
+    dropped = []
+    for month, name in sorted(list_partitions().items()):
+        if next_month(month) <= before:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
+            dropped.append(name)
+    return dropped
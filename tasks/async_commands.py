@@ -0,0 +1,179 @@
+"""
+Execução assíncrona das tarefas 'command' (COMMAND_EXECUTOR='async').
+
+No modo padrão ('sync'), cada comando ocupa um processo do worker
+(streaming.run_command) que passa quase todo o tempo esperando o comando
+(curl, rsync...). Com 'async', os comandos de um processo rodam em um
+único event loop asyncio, em uma thread dedicada: os processos são
+criados com asyncio.create_subprocess_shell, stdout/stderr são lidos sem
+bloquear e o tempo limite é controlado no próprio loop. Um
+asyncio.Semaphore limita os comandos simultâneos do processo em
+COMMAND_ASYNC_CONCURRENCY; os excedentes esperam a vez.
+
+Cada comando roda em uma sessão própria e, no tempo limite ou no
+cancelamento, o grupo de processos inteiro é encerrado: o loop espera os
+pipes fecharem, e um filho do shell que ficasse vivo (ex.: `sleep`)
+seguraria a execução até terminar.
+
+O worker roda com o pool de threads do Celery (CELERY_WORKER_POOL=threads
+e CELERY_WORKER_CONCURRENCY alto, ver Dockerfile). Cada thread só espera o
+seu comando e grava a saída recebida do loop no LogStreamWriter, que usa
+o banco e por isso fica fora do loop.
+"""
+import asyncio
+import codecs
+import functools
+import os
+import queue
+import signal
+import threading
+
+from django.conf import settings
+
+from .streaming import _limit_resources
+
+# Espera máxima pelo fim do processo depois de encerrado o grupo
+KILL_WAIT_SECONDS = 5
+
+
+class CommandExecutor:
+    """
+    Event loop em uma thread própria que executa os comandos do processo,
+    no máximo `concurrency` ao mesmo tempo.
+    """
+
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._thread = threading.Thread(target=self._run_loop, name='async-commands', daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, command, writer, timeout=None, cancel=None, cpu_seconds=None, max_memory=None, env=None):
+        """
+        Mesmo contrato de streaming.run_command: grava a saída em `writer`
+        e retorna o código de saída ou None (tempo limite ou `cancel`).
+        """
+        messages = queue.SimpleQueue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._execute(command, messages, timeout, cpu_seconds, max_memory, env), self.loop
+        )
+        try:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    # O loop mata o processo e ainda envia 'done'
+                    future.cancel()
+                try:
+                    message = messages.get(timeout=writer.flush_interval)
+                except queue.Empty:
+                    if future.done():
+                        # Cancelada antes de começar: o 'done' não vem
+                        return None
+                    writer.tick()
+                    continue
+                if message[0] == 'done':
+                    return None if future.cancelled() else message[1]
+                writer.write(message[0], message[1])
+        except BaseException:
+            # Ex.: SoftTimeLimitExceeded do Celery no meio da espera
+            future.cancel()
+            raise
+
+    async def _execute(self, command, messages, timeout, cpu_seconds, max_memory, env):
+        returncode = None
+        try:
+            async with self._semaphore:
+                returncode = await self._spawn(command, messages, timeout, cpu_seconds, max_memory, env)
+        finally:
+            messages.put(('done', returncode))
+
+    async def _spawn(self, command, messages, timeout, cpu_seconds, max_memory, env):
+        preexec_fn = None
+        if cpu_seconds or max_memory:
+            preexec_fn = functools.partial(_limit_resources, cpu_seconds, max_memory)
+        process = await asyncio.create_subprocess_shell(
+            command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            preexec_fn=preexec_fn,
+            start_new_session=True,
+            env={**os.environ, **env} if env else None,
+        )
+        try:
+            return await asyncio.wait_for(self._communicate(process, messages), timeout or None)
+        except asyncio.TimeoutError:
+            await _kill(process)
+            return None
+        except BaseException:
+            await _kill(process)
+            raise
+
+    async def _communicate(self, process, messages):
+        await asyncio.gather(
+            _pump(process.stdout, 'stdout', messages),
+            _pump(process.stderr, 'stderr', messages),
+        )
+        return await process.wait()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+async def _pump(reader, stream, messages):
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    while data := await reader.read(65536):
+        messages.put((stream, decoder.decode(data)))
+    messages.put((stream, decoder.decode(b'', final=True)))
+
+
+async def _kill(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    try:
+        # Um processo que saiu do grupo (setsid) ainda pode segurar os pipes
+        await asyncio.wait_for(process.wait(), KILL_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        pass
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Retorna o executor do processo atual, criando-o a partir das configurações."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = CommandExecutor(settings.COMMAND_ASYNC_CONCURRENCY)
+        return _executor
+
+
+def run_command(command, writer, **kwargs):
+    return get_executor().run(command, writer, **kwargs)
+
+
+def close_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.close()
+            _executor = None
+
+
+def _reset_after_fork():
+    # A thread do loop não existe no processo filho
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,107 @@
+"""
+Armazenamento da saída grande das execuções fora do banco.
+
+Ao fim de execute_task, o stream (stdout/stderr) com pelo menos
+TASK_LOG_BLOB_MIN_BYTES vai inteiro para o blob store e o TaskLog guarda
+só o hash (sha256, que também é a chave do blob) e o tamanho; os trechos
+desse stream saem do banco. Saídas iguais viram um único arquivo.
+
+O backend é configurável (TASK_LOG_BLOB_BACKEND) e implementa BlobStore.
+O padrão, LocalBlobStore, grava arquivos em TASK_LOG_BLOB_DIR e permite
+que /api/logs/{id}/raw/ sirva o arquivo direto (sendfile). Blobs que
+nenhum log referencia são removidos por cleanup_old_logs
+(ver retention.collect_blobs).
+"""
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BlobStore:
+    """Interface dos backends. `digest` é o sha256 (hex) do conteúdo."""
+
+    def put(self, digest, fileobj):
+        """Grava o conteúdo de `fileobj` (binário, a partir da posição atual)."""
+        raise NotImplementedError
+
+    def open(self, digest):
+        """Retorna um arquivo binário com suporte a seek."""
+        raise NotImplementedError
+
+    def path(self, digest):
+        """Caminho local do blob (para sendfile) ou None se não há um."""
+        return None
+
+    def delete(self, digest):
+        raise NotImplementedError
+
+    def list(self):
+        """Gera (digest, mtime) de todos os blobs."""
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """Um arquivo por blob em `root`/ab/cd/<digest>."""
+
+    def __init__(self, root=None):
+        self.root = str(root or settings.TASK_LOG_BLOB_DIR)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put(self, digest, fileobj):
+        target = self.path(digest)
+        if os.path.exists(target):
+            # Já existe (mesma saída): renova o mtime para o GC não levar o blob
+            os.utime(target)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while block := fileobj.read(1048576):
+                    out.write(block)
+            os.replace(temp, target)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+    def open(self, digest):
+        return open(self.path(digest), 'rb')
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def list(self):
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.startswith('.tmp-'):
+                    continue
+                try:
+                    yield name, os.stat(os.path.join(directory, name)).st_mtime
+                except FileNotFoundError:
+                    continue
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = import_string(settings.TASK_LOG_BLOB_BACKEND)()
+        return _store
+
+
+def is_recent(mtime):
+    """Blob gravado há pouco: o log que o referencia pode ainda não estar no banco."""
+    return time.time() - mtime < settings.TASK_LOG_BLOB_GC_GRACE_SECONDS
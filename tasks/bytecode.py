@@ -0,0 +1,113 @@
+"""
+Cache de bytecode dos scripts (task_type='script').
+
+O código de uma tarefa é compilado uma vez por conteúdo: a chave é o
+sha256 do código junto com a versão do bytecode do interpretador
+(importlib.util.MAGIC_NUMBER), então trocar de versão do Python invalida
+o cache sozinho. Dois níveis:
+
+    memória  LRU em cada processo do pool de scripts (tasks/script_worker.py)
+    disco    um arquivo marshal por chave em SCRIPT_BYTECODE_CACHE_DIR,
+             compartilhado pelos processos (e workers) que veem o diretório
+
+Cada entrada guarda o tempo que a compilação levou, para estimar o tempo
+economizado em cada acerto (estatísticas em /api/stats/). O
+TaskSerializer compila o código ao salvar e já deixa o bytecode no disco.
+
+Sem Django: o módulo é importado pelos processos filhos do pool.
+"""
+import hashlib
+import importlib.util
+import marshal
+import os
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+
+FILENAME = '<script>'
+
+# Cabeçalho do arquivo em disco: segundos gastos na compilação original
+HEADER = struct.Struct('<d')
+
+
+def digest(source):
+    return hashlib.sha256(importlib.util.MAGIC_NUMBER + source.encode('utf-8')).hexdigest()
+
+
+def compile_source(source):
+    """Compila o script. Retorna (code, segundos); SyntaxError/ValueError propagam."""
+    started = time.perf_counter()
+    code = compile(source, FILENAME, 'exec')
+    return code, time.perf_counter() - started
+
+
+class BytecodeCache:
+    """`directory` vazio desliga o nível em disco; `size` é o tamanho do LRU."""
+
+    def __init__(self, directory=None, size=128):
+        self.directory = directory or None
+        self.size = size
+        self._memory = OrderedDict()
+
+    def get(self, source):
+        """
+        Retorna (code, origem, segundos): a origem é 'memory', 'disk' ou
+        'miss'. Num 'miss', os segundos são os gastos agora na compilação;
+        nos acertos, os que a compilação original levou (economizados).
+        """
+        key = digest(source)
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return entry[0], 'memory', entry[1]
+
+        entry = self._load(key)
+        origin = 'disk'
+        if entry is None:
+            entry = compile_source(source)
+            origin = 'miss'
+            self._store(key, *entry)
+        self._remember(key, entry)
+        return entry[0], origin, entry[1]
+
+    def put(self, source, code, seconds):
+        """Grava um código já compilado (ex.: ao salvar a tarefa)."""
+        self._store(digest(source), code, seconds)
+
+    def _remember(self, key, entry):
+        if not self.size:
+            return
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.bin')
+
+    def _load(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+            (seconds,) = HEADER.unpack_from(data)
+            return marshal.loads(data[HEADER.size:]), seconds
+        except (OSError, EOFError, ValueError, TypeError, struct.error):
+            # Ausente ou corrompido: compila de novo
+            return None
+
+    def _store(self, key, code, seconds):
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(seconds) + marshal.dumps(code))
+            os.replace(temp, path)
+        except OSError:
+            # O cache em disco é opcional; a execução segue com o bytecode em memória
+            pass
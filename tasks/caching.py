@@ -0,0 +1,202 @@
+"""
+Cache das respostas de leitura da API (listagem de tarefas, logs recentes e
+estatísticas do dashboard), no cache do Django (Redis, ver CACHE_URL).
+
+Cada grupo de respostas ('tasks', 'logs', 'stats') tem um contador de
+geração que faz parte da chave. Salvar uma tarefa ou gravar um log
+incrementa os contadores afetados: as chaves antigas deixam de ser lidas e
+expiram sozinhas pelo TTL. A chave também leva o usuário e a URL completa.
+
+Toda resposta em cache tem um ETag; uma requisição com If-None-Match igual
+recebe 304 sem consultar o banco. Com o Redis fora do ar, as views
+respondem sem cache.
+"""
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from app_api.async_utils import in_thread
+
+logger = logging.getLogger(__name__)
+
+GROUPS = ('tasks', 'logs', 'stats')
+
+# Após uma falha do cache, espera este tempo antes de tentar de novo
+RETRY_AFTER = 30
+
+_unavailable_until = 0
+
+
+def _available():
+    return time.monotonic() >= _unavailable_until
+
+
+def _failed(operation, error):
+    global _unavailable_until
+    _unavailable_until = time.monotonic() + RETRY_AFTER
+    logger.warning(f"Cache {operation} failed, bypassing cache for {RETRY_AFTER}s: {error}")
+
+
+def _generation_key(group):
+    return f"gen:{group}"
+
+
+def generations(groups):
+    """
+    Geração atual de cada grupo, como texto para compor chaves (ex.: '17.3').
+    Um contador ausente (primeiro uso ou removido pelo Redis) começa no
+    horário atual em ms, para não repetir uma geração já usada.
+    """
+    keys = [_generation_key(group) for group in groups]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, time.time_ns() // 1_000_000, None)
+            values[key] = cache.get(key)
+    return '.'.join(str(values[key]) for key in keys)
+
+
+def invalidate(*groups):
+    """
+    Descarta as respostas em cache dos grupos informados. Falhas são apenas
+    registradas: nunca interrompem quem gravou os dados.
+    """
+    if not _available():
+        return
+    for group in groups:
+        key = _generation_key(group)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Contador ainda não existe: nenhuma resposta foi guardada com ele
+            pass
+        except Exception as e:
+            _failed('invalidation', e)
+            return
+
+
+def invalidate_tasks(sender, **kwargs):
+    """
+    Receptor de post_save/post_delete de Task: a tarefa aparece na listagem,
+    no título dos logs e nas contagens do dashboard.
+    """
+    invalidate('tasks', 'logs', 'stats')
+
+
+def invalidate_schedules(sender, **kwargs):
+    """Receptor dos agendamentos do beat, exibidos na listagem de tarefas."""
+    invalidate('tasks')
+
+
+def get_or_set(key, groups, compute, timeout):
+    """
+    Valor de `key` na geração atual de `groups`, calculado por `compute` na
+    ausência. Usado pelos agregados compartilhados entre usuários (stats).
+    """
+    if not _available():
+        return compute()
+    try:
+        key = f"{key}:{generations(groups)}"
+        value = cache.get(key)
+    except Exception as e:
+        _failed('read', e)
+        return compute()
+    if value is None:
+        value = compute()
+        try:
+            cache.set(key, value, timeout)
+        except Exception as e:
+            _failed('write', e)
+    return value
+
+
+def _etag(data):
+    digest = hashlib.md5(json.dumps(data, cls=JSONEncoder, sort_keys=True).encode(), usedforsecurity=False)
+    return f'"{digest.hexdigest()}"'
+
+
+def _not_modified(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return etag in (value.strip().removeprefix('W/') for value in header.split(','))
+
+
+def _response(request, data, etag, hit):
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache', 'X-Cache': 'HIT' if hit else 'MISS'}
+    if _not_modified(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(data, headers=headers)
+
+
+def _lookup(request, groups):
+    """Chave da resposta e o conteúdo guardado (etag, data), se houver."""
+    if not settings.RESPONSE_CACHE_ENABLED or not _available():
+        return None, None
+    path = hashlib.md5(request.get_full_path().encode(), usedforsecurity=False).hexdigest()
+    try:
+        key = f"resp:{request.user.pk}:{generations(groups)}:{path}"
+        return key, cache.get(key)
+    except Exception as e:
+        _failed('read', e)
+        return None, None
+
+
+def _store(request, key, response):
+    """Guarda uma resposta 200 e devolve a versão com ETag (ou 304)."""
+    if response.status_code != status.HTTP_200_OK or response.exception:
+        return response
+    data = response.data
+    etag = _etag(data)
+    if key is not None:
+        try:
+            cache.set(key, (etag, data), settings.RESPONSE_CACHE_TTL)
+        except Exception as e:
+            _failed('write', e)
+    return _response(request, data, etag, hit=False)
+
+
+def _request(args):
+    # View de função (request, ...) ou método de ViewSet (self, request, ...)
+    return args[0] if isinstance(args[0], Request) else args[1]
+
+
+def cached_response(*groups):
+    """
+    Decorator de views GET (funções ou ações de ViewSet, síncronas ou
+    assíncronas) cujas respostas dependem apenas dos dados de `groups`.
+    """
+    assert all(group in GROUPS for group in groups), groups
+
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                request = _request(args)
+                key, cached = await in_thread(_lookup)(request, groups)
+                if cached is not None:
+                    return _response(request, cached[1], cached[0], hit=True)
+                response = await view(*args, **kwargs)
+                return await in_thread(_store)(request, key, response)
+
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            request = _request(args)
+            key, cached = _lookup(request, groups)
+            if cached is not None:
+                return _response(request, cached[1], cached[0], hit=True)
+            return _store(request, key, view(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,46 @@
+"""
+Compressão da saída gravada em TaskLogChunk e corte início+fim do texto
+guardado em TaskLog.output/error.
+
+Só trechos a partir de TASK_LOG_COMPRESS_MIN_BYTES são comprimidos (zlib,
+da biblioteca padrão); abaixo disso o ganho não compensa o custo. Um
+trecho que não diminui pelo menos 10% fica em texto.
+"""
+import zlib
+
+from django.conf import settings
+
+# Nível do zlib: 6 é o padrão, bom equilíbrio entre tempo e tamanho
+LEVEL = 6
+
+TRUNCATED_MARKER = "\n[... {omitted} caracteres omitidos; conteúdo completo em /api/logs/{id}/raw/ ...]\n"
+
+
+def compress(text, min_bytes=None):
+    """Retorna os bytes comprimidos de `text` ou None se não vale a pena."""
+    min_bytes = settings.TASK_LOG_COMPRESS_MIN_BYTES if min_bytes is None else min_bytes
+    if not min_bytes or len(text) < min_bytes:
+        return None
+    raw = text.encode('utf-8')
+    packed = zlib.compress(raw, LEVEL)
+    if len(packed) > len(raw) * 0.9:
+        return None
+    return packed
+
+
+def decompress(packed):
+    return zlib.decompress(bytes(packed)).decode('utf-8')
+
+
+def head_tail(text, limit=None, tail=None, log_id=''):
+    """
+    Corta `text` em até `limit` caracteres: o início, o aviso e os
+    últimos `tail` caracteres (onde costuma estar o erro).
+    """
+    limit = settings.TASK_LOG_INLINE_MAX_CHARS if limit is None else limit
+    tail = settings.TASK_LOG_INLINE_TAIL_CHARS if tail is None else min(tail, limit)
+    if len(text) <= limit:
+        return text
+    head = limit - tail
+    marker = TRUNCATED_MARKER.format(omitted=len(text) - limit, id=log_id)
+    return text[:head] + marker + (text[-tail:] if tail else '')
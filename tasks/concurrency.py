@@ -0,0 +1,202 @@
+"""
+Controle de execuções sobrepostas da mesma tarefa (Task.concurrency_policy).
+
+    allow      sem controle (padrão)
+    skip       uma execução que encontra outra em andamento é ignorada
+    queue_one  espera a atual terminar; no máximo uma fica esperando
+    replace    interrompe a execução atual e assume o lugar dela
+
+A execução em andamento segura uma trava no Redis com TTL
+(TASK_LOCK_TTL), renovada por uma thread a cada
+TASK_LOCK_HEARTBEAT_SECONDS: se o worker morrer, a trava expira sozinha.
+No `replace`, a nova execução toma a trava; a antiga percebe na próxima
+renovação e é interrompida (as duas podem se sobrepor por até um ciclo).
+
+Nos disparos pela API (run, run_bulk), uma tarefa com política diferente
+de `allow` que já tem uma mensagem pendente na fila não é enviada de novo
+(`admit`); se o envio falhar, a marca é desfeita (`withdraw`). Com o
+Redis fora do ar, tudo roda sem controle.
+"""
+import logging
+import os
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Decisões de RunGuard.enter
+RUN = 'run'
+SKIP = 'skip'
+MERGE = 'merge'
+WAIT = 'wait'
+REPLACE = 'replace'
+
+# Após uma falha do Redis, espera este tempo antes de tentar de novo
+RETRY_AFTER = 30
+
+# Renova a trava se ainda é nossa ou se expirou sem dono; 0 se outra execução a tomou
+RENEW_SCRIPT = """
+local current = redis.call('get', KEYS[1])
+if current == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+elseif not current then
+    redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Remove a chave apenas se o valor ainda é o informado
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_client = None
+_client_lock = threading.Lock()
+_scripts = {}
+_unavailable_until = 0
+
+
+def _get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = redis.Redis.from_url(settings.REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+            _scripts['renew'] = _client.register_script(RENEW_SCRIPT)
+            _scripts['release'] = _client.register_script(RELEASE_SCRIPT)
+        return _client
+
+
+def _reset_after_fork():
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+    _scripts.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _available():
+    return time.monotonic() >= _unavailable_until
+
+
+def _failed(operation, error):
+    global _unavailable_until
+    _unavailable_until = time.monotonic() + RETRY_AFTER
+    logger.warning(f"Concurrency {operation} failed, running without control for {RETRY_AFTER}s: {error}")
+
+
+def _key(task_id, name):
+    return f"easypython:task:{task_id}:{name}"
+
+
+def admit(task_obj):
+    """
+    Marca uma mensagem pendente da tarefa. Retorna False se já havia uma
+    (a nova é descartada) e True se a mensagem deve ser enviada.
+    """
+    if task_obj.concurrency_policy == 'allow' or not _available():
+        return True
+    try:
+        return bool(_get_client().set(_key(task_obj.id, 'pending'), 1, nx=True, ex=settings.TASK_PENDING_TTL))
+    except Exception as e:
+        _failed('admission', e)
+        return True
+
+
+def withdraw(tasks):
+    """
+    Desfaz o `admit` de tarefas cuja mensagem não chegou a ser enviada
+    (falha no broker ou no banco), para que o próximo disparo não seja
+    descartado até a marca expirar.
+    """
+    keys = [_key(task_obj.id, 'pending') for task_obj in tasks if task_obj.concurrency_policy != 'allow']
+    if not keys or not _available():
+        return
+    try:
+        _get_client().delete(*keys)
+    except Exception as e:
+        _failed('withdrawal', e)
+
+
+class RunGuard:
+    """
+    Aplica a política de concorrência a uma execução de execute_task.
+    `token` identifica a execução (id da mensagem do Celery); `cancelled`
+    é sinalizado quando uma execução mais recente (replace) toma a trava.
+    """
+
+    def __init__(self, task_id, policy, token):
+        self.task_id = task_id
+        self.policy = policy
+        self.token = str(token)
+        self.cancelled = threading.Event()
+        self._held = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enter(self):
+        """Retorna RUN, REPLACE (roda), SKIP, MERGE (descarta) ou WAIT (tenta mais tarde)."""
+        if self.policy == 'allow' or not _available():
+            return RUN
+        lock = _key(self.task_id, 'lock')
+        ttl = settings.TASK_LOCK_TTL * 1000
+        try:
+            client = _get_client()
+            if client.set(lock, self.token, nx=True, px=ttl):
+                decision = RUN
+                # Era a execução que estava esperando (queue_one): libera a vaga
+                _scripts['release'](keys=[_key(self.task_id, 'waiting')], args=[self.token])
+            elif self.policy == 'skip':
+                decision = SKIP
+            elif self.policy == 'queue_one':
+                waiting = _key(self.task_id, 'waiting')
+                claimed = client.set(waiting, self.token, nx=True, ex=settings.TASK_PENDING_TTL)
+                decision = WAIT if claimed or client.get(waiting) == self.token.encode() else MERGE
+            else:
+                client.set(lock, self.token, px=ttl)
+                decision = REPLACE
+            if decision != WAIT:
+                # A mensagem saiu da fila: o próximo disparo pela API volta a ser aceito
+                client.delete(_key(self.task_id, 'pending'))
+        except Exception as e:
+            _failed('lock', e)
+            return RUN
+
+        if decision in (RUN, REPLACE):
+            self._held = True
+            self._thread = threading.Thread(target=self._heartbeat, name=f'task-lock-{self.task_id}', daemon=True)
+            self._thread.start()
+        return decision
+
+    def _heartbeat(self):
+        lock = _key(self.task_id, 'lock')
+        ttl = settings.TASK_LOCK_TTL * 1000
+        while not self._stop.wait(settings.TASK_LOCK_HEARTBEAT_SECONDS):
+            try:
+                renewed = _scripts['renew'](keys=[lock], args=[self.token, ttl])
+            except Exception as e:
+                # Sem Redis a trava expira; a execução continua
+                logger.warning(f"Failed to renew lock of task {self.task_id}: {e}")
+                continue
+            if not renewed:
+                logger.info(f"Task {self.task_id} run {self.token} replaced by a newer run")
+                self.cancelled.set()
+                return
+
+    def exit(self):
+        if not self._held:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        try:
+            _scripts['release'](keys=[_key(self.task_id, 'lock')], args=[self.token])
+        except Exception as e:
+            logger.warning(f"Failed to release lock of task {self.task_id}: {e}")
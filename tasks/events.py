@@ -0,0 +1,274 @@
+"""
+Eventos em tempo real (mudanças de estado e saída das tarefas).
+
+O worker publica eventos em um canal Redis (pub/sub). Cada processo ASGI
+mantém UMA assinatura nesse canal e repassa as mensagens aos clientes
+conectados via Server-Sent Events, cada um com sua fila limitada: um
+cliente lento perde eventos (e recebe um `resync`) em vez de segurar os
+demais.
+
+O stream é aberto com um ticket (`issue_ticket`, servido em
+/api/events/ticket/) em vez do JWT: a URL fica nos logs de acesso, e o
+ticket só vale para este endpoint e por EVENTS_TICKET_TTL segundos (nunca
+além do JWT que o emitiu). Quando ele expira, o servidor envia `expired`
+e encerra o stream; o cliente pede outro ticket e reconecta.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import parse_qs
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.core import signing
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'easypython:events'
+
+# Separa as assinaturas dos tickets das de outros usos da SECRET_KEY
+TICKET_SALT = 'tasks.events.ticket'
+
+# Após uma falha de publicação, espera este tempo antes de tentar de novo
+RETRY_AFTER = 30
+
+_client = None
+_client_lock = threading.Lock()
+_unavailable_until = 0
+
+
+def _get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = redis.Redis.from_url(settings.REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+        return _client
+
+
+def _reset_after_fork():
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def publish(event_type, **data):
+    """
+    Publica um evento. Falhas são apenas registradas: eventos nunca devem
+    interromper a execução de uma tarefa.
+    """
+    global _unavailable_until
+    if not settings.EVENTS_ENABLED or time.monotonic() < _unavailable_until:
+        return
+    try:
+        _get_client().publish(CHANNEL, json.dumps({'type': event_type, **data}, default=str))
+    except Exception as e:
+        _unavailable_until = time.monotonic() + RETRY_AFTER
+        logger.warning(f"Failed to publish event {event_type}, pausing events for {RETRY_AFTER}s: {e}")
+
+
+def publish_state(log, task_id=None):
+    publish(
+        'task.state',
+        task=task_id or log.task_id,
+        log=log.id,
+        status=log.status,
+        created_at=log.created_at,
+        duration=log.duration,
+    )
+
+
+def publish_output(log, stream, offset, data):
+    # Trechos grandes vão sem conteúdo: o cliente busca em /api/logs/{id}/output/
+    if len(data) > settings.EVENTS_MAX_OUTPUT_CHARS:
+        data = None
+    publish('log.output', task=log.task_id, log=log.id, stream=stream, offset=offset, data=data)
+
+
+class Subscription:
+    def __init__(self, task_id=None, types=None, queue_size=100):
+        self.task_id = task_id
+        self.types = types
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def wants(self, event):
+        if self.types and event.get('type') not in self.types:
+            return False
+        return self.task_id is None or event.get('task') == self.task_id
+
+    def offer(self, event, payload):
+        if self.overflowed or not self.wants(event):
+            return
+        try:
+            self.queue.put_nowait((event['type'], payload))
+        except asyncio.QueueFull:
+            # Descarta o que estava pendente e pede ao cliente para recarregar
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(('resync', '{}'))
+
+
+class Broadcaster:
+    """
+    Uma assinatura Redis por processo, distribuída para todos os clientes.
+    """
+
+    def __init__(self, url, channel=CHANNEL):
+        self.url = url
+        self.channel = channel
+        self.subscribers = set()
+        self._listener = None
+
+    def subscribe(self, **kwargs):
+        subscription = Subscription(queue_size=settings.EVENTS_CLIENT_QUEUE_SIZE, **kwargs)
+        self.subscribers.add(subscription)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def dispatch(self, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        for subscription in list(self.subscribers):
+            subscription.offer(event, payload)
+
+    async def _listen(self):
+        delay = 1
+        while self.subscribers:
+            try:
+                client = aioredis.Redis.from_url(self.url)
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    delay = 1
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self.dispatch(message['data'].decode('utf-8'))
+                        if not self.subscribers:
+                            break
+                await client.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Event subscription lost, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+
+broadcaster = None
+
+
+def issue_ticket(user, token_expires=None):
+    """
+    Ticket assinado para abrir o stream de eventos. Expira em
+    EVENTS_TICKET_TTL segundos ou em `token_expires` (exp do JWT), o que
+    vier antes. Retorna (ticket, expira_em) com expira_em em epoch.
+    """
+    expires = int(time.time()) + settings.EVENTS_TICKET_TTL
+    if token_expires:
+        expires = min(expires, int(token_expires))
+    ticket = signing.Signer(salt=TICKET_SALT).sign_object({'user': user.pk, 'exp': expires})
+    return ticket, expires
+
+
+def _authenticate(query):
+    """Retorna o instante (epoch) em que o ticket de `?ticket=` expira, ou None se inválido."""
+    ticket = query.get('ticket', [None])[0]
+    if not ticket:
+        return None
+    try:
+        expires = signing.Signer(salt=TICKET_SALT).unsign_object(ticket)['exp']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+    return expires if expires > time.time() else None
+
+
+async def sse_app(scope, receive, send):
+    """
+    Endpoint ASGI de Server-Sent Events.
+
+    EventSource não envia cabeçalhos, então a autenticação vai em
+    `?ticket=` (ver issue_ticket). Filtros opcionais: `task=<id>` e
+    `types=task.state,log.output`.
+    """
+    global broadcaster
+
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    expires = _authenticate(query)
+    if expires is None:
+        await send({'type': 'http.response.start', 'status': 401, 'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Unauthorized'})
+        return
+
+    try:
+        task_id = int(query['task'][0]) if 'task' in query else None
+    except ValueError:
+        task_id = None
+    types = set(query['types'][0].split(',')) if 'types' in query else None
+
+    if broadcaster is None:
+        broadcaster = Broadcaster(settings.REDIS_URL)
+    subscription = broadcaster.subscribe(task_id=task_id, types=types)
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        while not disconnected.done():
+            remaining = expires - time.time()
+            if remaining <= 0:
+                await send({'type': 'http.response.body', 'body': b'event: expired\ndata: {}\n\n'})
+                break
+            getter = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait(
+                {getter, disconnected},
+                timeout=min(settings.EVENTS_HEARTBEAT_SECONDS, remaining),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if getter not in done:
+                getter.cancel()
+                if not done and expires > time.time():
+                    await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+                continue
+
+            event_type, payload = getter.result()
+            if event_type == 'resync':
+                subscription.overflowed = False
+            await send({
+                'type': 'http.response.body',
+                'body': f"event: {event_type}\ndata: {payload}\n\n".encode('utf-8'),
+                'more_body': True,
+            })
+    except OSError:
+        pass
+    finally:
+        broadcaster.unsubscribe(subscription)
+        disconnected.cancel()
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
@@ -0,0 +1,207 @@
+"""
+Gravação agrupada dos TaskLogs no worker (TASK_LOG_WRITER_FLUSH_MS > 0).
+
+Em vez de um INSERT no início e um UPDATE no fim de cada execução (mais
+os INSERTs dos trechos de saída), as gravações vão para uma fila em
+memória e uma thread por processo do worker as grava a cada N ms, em uma
+única transação: bulk_create dos logs novos, bulk_update dos finalizados e
+bulk_create dos trechos. Uma execução que termina antes do próximo flush
+vira um único INSERT já com o estado final.
+
+Custo: o log só aparece no banco (e nos eventos) até N ms depois, e o que
+estiver na fila se perde se o processo morrer sem o flush final.
+"""
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+
+from app_api import metrics
+
+from . import caching, events
+from .models import Task, TaskLog, TaskLogChunk
+
+logger = logging.getLogger(__name__)
+
+FINAL_FIELDS = ['status', 'output', 'error', 'duration', 'output_blob', 'output_size', 'error_blob', 'error_size']
+
+
+class CoalescingLogWriter:
+    def __init__(self, interval_ms):
+        self.interval = interval_ms / 1000
+        self._cond = threading.Condition()
+        self._inserts = []
+        self._updates = {}
+        self._chunks = []
+        self._drops = []
+        self._inflight = set()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name='tasklog-writer', daemon=True)
+        self._thread.start()
+
+    def start(self, **fields):
+        """Cria o log da execução; o INSERT fica para o próximo flush."""
+        log = TaskLog(**fields)
+        with self._cond:
+            self._inserts.append(log)
+        return log
+
+    def finish(self, log, **fields):
+        """
+        Registra o estado final. Se o INSERT ainda não foi feito, ele já
+        sai com esses valores; senão, entra no próximo bulk_update.
+        """
+        with self._cond:
+            # Não altera um log que está sendo gravado neste momento
+            self._cond.wait_for(lambda: id(log) not in self._inflight)
+            for name, value in fields.items():
+                setattr(log, name, value)
+            if log.pk is not None:
+                self._updates[log.pk] = log
+
+    def add_chunks(self, chunks):
+        with self._cond:
+            self._chunks.extend(chunks)
+
+    def drop_chunks(self, log, streams):
+        """
+        Descarta os trechos desses streams do log: os pendentes saem da
+        fila e os já gravados são removidos no próximo flush.
+        """
+        with self._cond:
+            self._chunks = [chunk for chunk in self._chunks if chunk.log is not log or chunk.stream not in streams]
+            self._drops.append((log, streams))
+
+    def wait(self, log, timeout=None):
+        """Espera o log ser gravado (para quem precisa do id)."""
+        with self._cond:
+            return self._cond.wait_for(lambda: log.pk is not None, timeout=timeout)
+
+    def flush(self):
+        with self._cond:
+            inserts, self._inserts = self._inserts, []
+            updates, self._updates = list(self._updates.values()), {}
+            # Trechos de um log cujo INSERT falhou não têm onde ser gravados
+            chunks = [chunk for chunk in self._chunks if chunk.log.pk is not None or chunk.log in inserts]
+            self._chunks = []
+            # Um log ainda sem INSERT não tem trechos gravados para remover
+            drops = [(log, streams) for log, streams in self._drops if log.pk is not None or log in inserts]
+            self._drops = []
+            self._inflight = {id(log) for log in inserts + updates}
+        if not (inserts or updates or chunks or drops):
+            return
+
+        try:
+            try:
+                self._write(inserts, updates, chunks, drops)
+            except IntegrityError:
+                # Tarefa removida durante a execução (com snapshot, execute_task
+                # não a leu do banco): descarta os logs dela e grava o resto
+                remaining = self._without_removed_tasks(inserts, updates, chunks, drops)
+                if remaining is None:
+                    raise
+                inserts, updates, chunks, drops = remaining
+                self._write(inserts, updates, chunks, drops)
+        except Exception as e:
+            logger.error(f"Failed to write {len(inserts)} new, {len(updates)} finished logs and {len(chunks)} chunks: {e}")
+            for log in inserts:
+                log.pk = None
+            inserts = updates = chunks = []
+        finally:
+            with self._cond:
+                self._inflight = set()
+                self._cond.notify_all()
+
+        if inserts or updates:
+            caching.invalidate('tasks', 'logs')
+        for log in inserts + updates:
+            events.publish_state(log)
+        for chunk in chunks:
+            events.publish_output(chunk.log, chunk.stream, chunk.offset, chunk.text)
+
+    def _write(self, inserts, updates, chunks, drops):
+        with metrics.log_write('batch'), transaction.atomic():
+            if inserts:
+                TaskLog.objects.bulk_create(inserts)
+            if updates:
+                TaskLog.objects.bulk_update(updates, FINAL_FIELDS)
+            if chunks:
+                TaskLogChunk.objects.bulk_create(chunks)
+            for log, streams in drops:
+                TaskLogChunk.objects.filter(log=log, stream__in=streams).delete()
+
+    def _without_removed_tasks(self, inserts, updates, chunks, drops):
+        logs = inserts + updates
+        existing = set(Task.objects.filter(id__in={log.task_id for log in logs}).values_list('id', flat=True))
+        removed = [log for log in logs if log.task_id not in existing]
+        if not removed:
+            return None
+        logger.warning(f"Dropping {len(removed)} logs of removed tasks: {sorted({log.task_id for log in removed})}")
+        # A transação desfeita não gravou nada: os ids atribuídos não valem
+        for log in inserts:
+            log.pk = None
+        for chunk in chunks:
+            chunk.pk = None
+            if chunk.log.pk is None:
+                # Reatribuir copia o id (agora vazio) do log para log_id
+                chunk.log = chunk.log
+        return (
+            [log for log in inserts if log.task_id in existing],
+            [log for log in updates if log.task_id in existing],
+            [chunk for chunk in chunks if chunk.log.task_id in existing],
+            [(log, streams) for log, streams in drops if log.task_id in existing],
+        )
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait(self.interval)
+                closed = self._closed
+            close_old_connections()
+            self.flush()
+            if closed:
+                connection.close()
+                return
+
+    def close(self):
+        """Grava o que estiver pendente e encerra a thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=10)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_log_writer():
+    """
+    Escritor do processo atual, ou None se o modo agrupado está desativado.
+    """
+    global _writer
+    if not settings.TASK_LOG_WRITER_FLUSH_MS:
+        return None
+    with _writer_lock:
+        if _writer is None:
+            _writer = CoalescingLogWriter(settings.TASK_LOG_WRITER_FLUSH_MS)
+        return _writer
+
+
+def close_log_writer():
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+
+def _reset_after_fork():
+    global _writer, _writer_lock
+    _writer = None
+    _writer_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
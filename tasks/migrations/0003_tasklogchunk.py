@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0002_task_priority"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskLogChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "stream",
+                    models.CharField(
+                        choices=[("stdout", "Saída"), ("stderr", "Erro")], max_length=10
+                    ),
+                ),
+                ("offset", models.BigIntegerField()),
+                ("data", models.TextField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "log",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunks",
+                        to="tasks.tasklog",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["offset"],
+                "indexes": [
+                    models.Index(
+                        fields=["log", "stream", "offset"],
+                        name="tasks_taskl_log_id_d7da06_idx",
+                    )
+                ],
+            },
+        ),
+    ]
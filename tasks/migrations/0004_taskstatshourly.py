@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0003_tasklogchunk"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskStatsHourly",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hour", models.DateTimeField(help_text="Início da hora (UTC)")),
+                ("success_count", models.PositiveIntegerField(default=0)),
+                ("error_count", models.PositiveIntegerField(default=0)),
+                ("duration_sum", models.FloatField(default=0)),
+                (
+                    "duration_histogram",
+                    models.JSONField(
+                        default=list,
+                        help_text="Contagem de execuções por faixa de duração (stats.DURATION_BUCKETS)",
+                    ),
+                ),
+                (
+                    "task",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="hourly_stats",
+                        to="tasks.task",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["hour"], name="tasks_tasks_hour_287c73_idx")
+                ],
+                "unique_together": {("task", "hour")},
+            },
+        ),
+    ]
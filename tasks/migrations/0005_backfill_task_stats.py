@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:36
+
+import bisect
+
+from django.db import migrations
+
+# Cópia de tasks.stats.DURATION_BUCKETS no momento desta migração
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def backfill(apps, schema_editor):
+    """
+    Gera os agregados por hora a partir dos logs já existentes.
+    """
+    TaskLog = apps.get_model("tasks", "TaskLog")
+    TaskStatsHourly = apps.get_model("tasks", "TaskStatsHourly")
+
+    rows = {}
+    logs = TaskLog.objects.exclude(status="running").values_list(
+        "task_id", "status", "duration", "created_at"
+    )
+    for task_id, status, duration, created_at in logs.iterator(chunk_size=5000):
+        hour = created_at.replace(minute=0, second=0, microsecond=0)
+        row = rows.get((task_id, hour))
+        if row is None:
+            row = rows[(task_id, hour)] = TaskStatsHourly(
+                task_id=task_id,
+                hour=hour,
+                duration_histogram=[0] * (len(DURATION_BUCKETS) + 1),
+            )
+        if status == "success":
+            row.success_count += 1
+        else:
+            row.error_count += 1
+        row.duration_sum += duration or 0
+        row.duration_histogram[bisect.bisect_left(DURATION_BUCKETS, duration or 0)] += 1
+
+    TaskStatsHourly.objects.bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0004_taskstatshourly"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0005_backfill_task_stats"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="tasklog",
+            index=models.Index(
+                fields=["task", "-created_at"], name="tasks_taskl_task_id_f65401_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tasklog",
+            index=models.Index(
+                fields=["status", "-created_at"], name="tasks_taskl_status_5f588f_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tasklog",
+            index=models.Index(
+                fields=["created_at"], name="tasks_taskl_created_cfbd67_idx"
+            ),
+        ),
+    ]
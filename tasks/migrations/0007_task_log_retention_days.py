@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0006_tasklog_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="log_retention_days",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Dias de retenção dos logs (vazio = padrão)",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:05
+
+from django.db import migrations
+
+# Cópia do schema de tasks.search no momento desta migração
+FTS_TABLE = "tasks_tasklog_fts"
+
+SQLITE_FORWARD = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(output, error, prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON tasks_tasklog BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, output, error) VALUES (new.id, new.output, new.error);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF output, error ON tasks_tasklog BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, output, error) VALUES (new.id, new.output, new.error);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON tasks_tasklog BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"INSERT INTO {FTS_TABLE}(rowid, output, error) SELECT id, output, error FROM tasks_tasklog",
+]
+SQLITE_BACKWARD = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRES_FORWARD = [
+    "CREATE INDEX IF NOT EXISTS tasks_tasklog_search_idx ON tasks_tasklog "
+    "USING GIN (to_tsvector('simple', output || ' ' || error))",
+]
+POSTGRES_BACKWARD = ["DROP INDEX IF EXISTS tasks_tasklog_search_idx"]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, []):
+            schema_editor.execute(statement)
+
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0007_task_log_retention_days"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({"sqlite": SQLITE_FORWARD, "postgresql": POSTGRES_FORWARD}),
+            run({"sqlite": SQLITE_BACKWARD, "postgresql": POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:47
+
+from django.db import migrations, models
+
+
+def route_schedules(apps, schema_editor):
+    """
+    Agendamentos existentes passam a usar a fila da prioridade da tarefa.
+    """
+    Task = apps.get_model("tasks", "Task")
+    PeriodicTask = apps.get_model("django_celery_beat", "PeriodicTask")
+    for schedule_id, priority in Task.objects.filter(
+        schedule__isnull=False
+    ).values_list("schedule_id", "priority"):
+        PeriodicTask.objects.filter(id=schedule_id).update(queue=priority)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0008_tasklog_search"),
+        ("django_celery_beat", "0019_alter_periodictasks_options"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueueStatsHourly",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("queue", models.CharField(max_length=50)),
+                ("hour", models.DateTimeField(help_text="Início da hora (UTC)")),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("wait_sum", models.FloatField(default=0)),
+                (
+                    "wait_histogram",
+                    models.JSONField(
+                        default=list,
+                        help_text="Contagem de execuções por faixa de espera (stats.DURATION_BUCKETS)",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["hour"], name="tasks_queue_hour_4001dd_idx")
+                ],
+                "unique_together": {("queue", "hour")},
+            },
+        ),
+        migrations.RunPython(route_schedules, migrations.RunPython.noop),
+    ]
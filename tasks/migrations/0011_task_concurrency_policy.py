@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0010_taskbatch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="concurrency_policy",
+            field=models.CharField(
+                choices=[
+                    ("allow", "Permitir"),
+                    ("skip", "Ignorar se em execução"),
+                    ("queue_one", "Enfileirar uma"),
+                    ("replace", "Substituir a atual"),
+                ],
+                default="allow",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="taskstatshourly",
+            name="merged_count",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Descartadas: já havia uma pendente"
+            ),
+        ),
+        migrations.AddField(
+            model_name="taskstatshourly",
+            name="replaced_count",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Interrompidas por uma execução mais recente"
+            ),
+        ),
+        migrations.AddField(
+            model_name="taskstatshourly",
+            name="skipped_count",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Ignoradas: já havia uma em execução"
+            ),
+        ),
+    ]
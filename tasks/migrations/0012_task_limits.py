@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0011_task_concurrency_policy"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="cpu_seconds",
+            field=models.PositiveIntegerField(
+                blank=True, help_text="Tempo máximo de CPU em segundos", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="max_memory_mb",
+            field=models.PositiveIntegerField(
+                blank=True, help_text="Memória máxima em MB", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="timeout",
+            field=models.PositiveIntegerField(
+                blank=True, help_text="Tempo limite em segundos (tempo real)", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="taskstatshourly",
+            name="timeout_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="tasklog",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("running", "Rodando"),
+                    ("success", "Sucesso"),
+                    ("error", "Erro"),
+                    ("timeout", "Tempo esgotado"),
+                ],
+                default="running",
+                max_length=20,
+            ),
+        ),
+    ]
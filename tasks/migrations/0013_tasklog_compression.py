@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0012_task_limits"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tasklogchunk",
+            name="compressed",
+            field=models.BinaryField(
+                blank=True, help_text="Conteúdo comprimido com zlib", null=True
+            ),
+        ),
+        migrations.AlterField(
+            model_name="tasklogchunk",
+            name="data",
+            field=models.TextField(blank=True),
+        ),
+    ]
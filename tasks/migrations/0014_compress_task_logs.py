@@ -0,0 +1,127 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:14
+
+import zlib
+
+from django.conf import settings
+from django.db import migrations, transaction
+from django.db.models import Q
+from django.db.models.functions import Length
+
+BATCH_SIZE = 200
+
+# Cópias de tasks.compression no momento desta migração
+LEVEL = 6
+TRUNCATED_MARKER = "\n[... {omitted} caracteres omitidos; conteúdo completo em /api/logs/{id}/raw/ ...]\n"
+
+
+def _compress(text):
+    min_bytes = settings.TASK_LOG_COMPRESS_MIN_BYTES
+    if not min_bytes or len(text) < min_bytes:
+        return None
+    raw = text.encode("utf-8")
+    packed = zlib.compress(raw, LEVEL)
+    if len(packed) > len(raw) * 0.9:
+        return None
+    return packed
+
+
+def _text(chunk):
+    if chunk.compressed is None:
+        return chunk.data
+    return zlib.decompress(bytes(chunk.compressed)).decode("utf-8")
+
+
+def compress_chunks(apps, schema_editor):
+    """
+    Comprime os trechos já gravados, em lotes por id (uma transação por lote).
+    """
+    TaskLogChunk = apps.get_model("tasks", "TaskLogChunk")
+    last = 0
+    while True:
+        batch = list(
+            TaskLogChunk.objects.filter(id__gt=last, compressed__isnull=True)
+            .order_by("id")
+            .only("id", "data")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last = batch[-1].id
+        changed = []
+        for chunk in batch:
+            packed = _compress(chunk.data)
+            if packed is not None:
+                chunk.data, chunk.compressed = "", packed
+                changed.append(chunk)
+        with transaction.atomic():
+            TaskLogChunk.objects.bulk_update(changed, ["data", "compressed"])
+
+
+def cap_outputs(apps, schema_editor):
+    """
+    Corta output/error maiores que TASK_LOG_INLINE_MAX_CHARS em início + fim.
+    Logs anteriores ao streaming (sem trechos) têm o conteúdo completo
+    guardado antes em um trecho comprimido, para continuar em /raw/.
+    """
+    TaskLog = apps.get_model("tasks", "TaskLog")
+    TaskLogChunk = apps.get_model("tasks", "TaskLogChunk")
+    limit = settings.TASK_LOG_INLINE_MAX_CHARS
+    tail = min(settings.TASK_LOG_INLINE_TAIL_CHARS, limit)
+    large = TaskLog.objects.alias(
+        output_length=Length("output"), error_length=Length("error")
+    ).filter(Q(output_length__gt=limit) | Q(error_length__gt=limit))
+
+    last = 0
+    while True:
+        ids = list(
+            large.filter(id__gt=last)
+            .order_by("id")
+            .values_list("id", flat=True)[:BATCH_SIZE]
+        )
+        if not ids:
+            break
+        last = ids[-1]
+        with transaction.atomic():
+            for log in TaskLog.objects.filter(id__in=ids):
+                for stream, field in (("stdout", "output"), ("stderr", "error")):
+                    text = getattr(log, field)
+                    if len(text) <= limit:
+                        continue
+                    chunks = TaskLogChunk.objects.filter(
+                        log=log, stream=stream
+                    ).order_by("offset")
+                    if chunks.exists():
+                        total, end = 0, ""
+                        for chunk in chunks.iterator(chunk_size=50):
+                            data = _text(chunk)
+                            total += len(data)
+                            end = (end + data)[-tail:] if tail else ""
+                    else:
+                        packed = _compress(text)
+                        TaskLogChunk.objects.create(
+                            log=log,
+                            stream=stream,
+                            offset=0,
+                            data="" if packed is not None else text,
+                            compressed=packed,
+                        )
+                        total, end = len(text), text[-tail:] if tail else ""
+                    marker = TRUNCATED_MARKER.format(
+                        omitted=max(total - limit, 0), id=log.id
+                    )
+                    setattr(log, field, text[: limit - tail] + marker + end)
+                log.save(update_fields=["output", "error"])
+
+
+class Migration(migrations.Migration):
+
+    # Cada lote é uma transação: tabelas grandes não ficam presas em uma só
+    atomic = False
+
+    dependencies = [
+        ("tasks", "0013_tasklog_compression"),
+    ]
+
+    operations = [
+        migrations.RunPython(compress_chunks, migrations.RunPython.noop),
+        migrations.RunPython(cap_outputs, migrations.RunPython.noop),
+    ]
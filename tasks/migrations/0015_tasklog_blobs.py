@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0014_compress_task_logs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tasklog",
+            name="error_blob",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="tasklog",
+            name="error_size",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="tasklog",
+            name="output_blob",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="tasklog",
+            name="output_size",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0016_workflows"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="taskstatshourly",
+            name="bytecode_hits",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Execuções com bytecode já em cache (memória ou disco)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="taskstatshourly",
+            name="bytecode_misses",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Execuções que precisaram compilar o código"
+            ),
+        ),
+        migrations.AddField(
+            model_name="taskstatshourly",
+            name="compile_seconds",
+            field=models.FloatField(
+                default=0, help_text="Tempo gasto compilando nas execuções sem cache"
+            ),
+        ),
+        migrations.AddField(
+            model_name="taskstatshourly",
+            name="compile_seconds_saved",
+            field=models.FloatField(
+                default=0,
+                help_text="Tempo de compilação evitado pelos acertos do cache",
+            ),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0017_bytecode_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScheduleChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("periodic_task_id", models.IntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ScheduleStatsHourly",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "hour",
+                    models.DateTimeField(help_text="Início da hora (UTC)", unique=True),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("lag_sum", models.FloatField(default=0)),
+                ("lag_max", models.FloatField(default=0)),
+                (
+                    "lag_histogram",
+                    models.JSONField(
+                        default=list,
+                        help_text="Contagem de envios por faixa de atraso (stats.DURATION_BUCKETS)",
+                    ),
+                ),
+            ],
+        ),
+    ]
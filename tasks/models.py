@@ -1,6 +1,8 @@
+import codecs
 from django.db import models
 from django.contrib.auth.models import User
 from django_celery_beat.models import PeriodicTask, IntervalSchedule
+from . import blobstore, compression
 
 class Task(models.Model):
     TASK_TYPES = [
@@ -13,17 +15,34 @@ class Task(models.Model):
         ('medium', 'Média'),
         ('high', 'Alta'),
     ]
+
+    # Execuções sobrepostas da mesma tarefa (ver tasks/concurrency.py)
+    CONCURRENCY_CHOICES = [
+        ('allow', 'Permitir'),
+        ('skip', 'Ignorar se em execução'),
+        ('queue_one', 'Enfileirar uma'),
+        ('replace', 'Substituir a atual'),
+    ]
     
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
     task_type = models.CharField(max_length=20, choices=TASK_TYPES, default='script')
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='medium')
+    concurrency_policy = models.CharField(max_length=10, choices=CONCURRENCY_CHOICES, default='allow')
     code = models.TextField(help_text="Código Python ou Comando Bash")
     
     # Agendamento
     enabled = models.BooleanField(default=True)
     schedule = models.OneToOneField(PeriodicTask, on_delete=models.SET_NULL, null=True, blank=True, related_name='easy_runner_task')
     
+    # Limites por execução (vazio = padrão do tipo: TASK_COMMAND_* ou SCRIPT_RUNNER_*)
+    timeout = models.PositiveIntegerField(null=True, blank=True, help_text="Tempo limite em segundos (tempo real)")
+    cpu_seconds = models.PositiveIntegerField(null=True, blank=True, help_text="Tempo máximo de CPU em segundos")
+    max_memory_mb = models.PositiveIntegerField(null=True, blank=True, help_text="Memória máxima em MB")
+
+    # Retenção dos logs desta tarefa (sobrepõe TASK_LOG_RETENTION_DAYS)
+    log_retention_days = models.PositiveIntegerField(null=True, blank=True, help_text="Dias de retenção dos logs (vazio = padrão)")
+    
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -31,19 +50,300 @@ class Task(models.Model):
     def __str__(self):
         return self.title
 
+class TaskBatch(models.Model):
+    """
+    Disparo em massa (POST /api/tasks/run_bulk/). O progresso é agregado a
+    partir dos TaskLogs ligados ao lote.
+    """
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    total = models.PositiveIntegerField(help_text="Execuções enviadas")
+
+    class Meta:
+        ordering = ['-created_at']
+
 class TaskLog(models.Model):
     STATUS_CHOICES = [
         ('running', 'Rodando'),
         ('success', 'Sucesso'),
         ('error', 'Erro'),
+        ('timeout', 'Tempo esgotado'),
     ]
     
     task = models.ForeignKey(Task, on_delete=models.CASCADE)
+    batch = models.ForeignKey(TaskBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='logs')
+    workflow_step = models.ForeignKey('WorkflowStepRun', on_delete=models.SET_NULL, null=True, blank=True, related_name='logs')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
     output = models.TextField(blank=True)
     error = models.TextField(blank=True)
     duration = models.FloatField(null=True, help_text="Duração em segundos")
+    # Saída completa no blob store (tasks/blobstore.py): sha256, que é também a chave, e tamanho em bytes
+    output_blob = models.CharField(max_length=64, blank=True)
+    output_size = models.BigIntegerField(null=True, blank=True)
+    error_blob = models.CharField(max_length=64, blank=True)
+    error_size = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Histórico por tarefa (TaskViewSet.logs, última execução)
+            models.Index(fields=['task', '-created_at']),
+            # Filtro por status no TaskLogViewSet
+            models.Index(fields=['status', '-created_at']),
+            # Listagem global e retenção (cleanup_old_logs)
+            models.Index(fields=['created_at']),
+        ]
+
+    def blob(self, stream='stdout'):
+        """(sha256, tamanho) do blob com a saída completa do stream, ou None."""
+        digest = self.output_blob if stream == 'stdout' else self.error_blob
+        if not digest:
+            return None
+        return digest, self.output_size if stream == 'stdout' else self.error_size
+
+    def read_output(self, stream='stdout', offset=0, limit=65536):
+        """
+        Lê a saída a partir de um offset em bytes (UTF-8), permitindo
+        acompanhar uma execução em andamento. Retorna (texto, próximo_offset).
+        """
+        blob = self.blob(stream)
+        if blob is not None:
+            with blobstore.get_store().open(blob[0]) as f:
+                f.seek(offset)
+                return _decode_partial(f.read(limit), offset)
+
+        chunks = self.chunks.filter(stream=stream)
+        start = chunks.filter(offset__lte=offset).order_by('-offset').values_list('offset', flat=True).first()
+        if start is None:
+            # Logs sem trechos (anteriores ao streaming): usa o campo completo
+            if chunks.exists():
+                start = 0
+            else:
+                data = (self.output if stream == 'stdout' else self.error).encode('utf-8')
+                return _decode_partial(data[offset:offset + limit], offset)
+
+        parts = []
+        size = 0
+        for chunk in chunks.filter(offset__gte=start).order_by('offset').iterator():
+            data = chunk.text.encode('utf-8')[max(offset + size - chunk.offset, 0):]
+            data = data[:limit - size]
+            parts.append(data)
+            size += len(data)
+            if size >= limit:
+                break
+        return _decode_partial(b"".join(parts), offset)
+
+    def iter_output(self, stream='stdout'):
+        """Saída completa do stream, um trecho por vez (para respostas em streaming)."""
+        blob = self.blob(stream)
+        if blob is not None:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            with blobstore.get_store().open(blob[0]) as f:
+                while data := f.read(65536):
+                    yield decoder.decode(data)
+            yield decoder.decode(b'', final=True)
+            return
+
+        chunks = self.chunks.filter(stream=stream).order_by('offset')
+        if not chunks.exists():
+            # Logs sem trechos (anteriores ao streaming): usa o campo completo
+            yield self.output if stream == 'stdout' else self.error
+            return
+        for chunk in chunks.iterator(chunk_size=50):
+            yield chunk.text
+
+def _decode_partial(data, offset):
+    """
+    Decodifica bytes que podem terminar no meio de um caractere; os bytes
+    incompletos ficam para a próxima leitura.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    text = decoder.decode(data)
+    pending = len(decoder.getstate()[0])
+    return text, offset + len(data) - pending
+
+class TaskLogChunk(models.Model):
+    """
+    Trecho da saída de uma execução, gravado enquanto a tarefa roda.
+    `offset` é a posição em bytes (UTF-8) do início do trecho no stream.
+    Trechos grandes ficam comprimidos em `compressed` (com `data` vazio);
+    use `text` para ler o conteúdo.
+    """
+    STREAM_CHOICES = [
+        ('stdout', 'Saída'),
+        ('stderr', 'Erro'),
+    ]
+
+    log = models.ForeignKey(TaskLog, on_delete=models.CASCADE, related_name='chunks')
+    stream = models.CharField(max_length=10, choices=STREAM_CHOICES)
+    offset = models.BigIntegerField()
+    data = models.TextField(blank=True)
+    compressed = models.BinaryField(null=True, blank=True, help_text="Conteúdo comprimido com zlib")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['offset']
+        indexes = [
+            models.Index(fields=['log', 'stream', 'offset']),
+        ]
+
+    @classmethod
+    def build(cls, log, stream, offset, data):
+        """Monta o trecho, comprimindo `data` se for grande o bastante."""
+        packed = compression.compress(data)
+        if packed is None:
+            return cls(log=log, stream=stream, offset=offset, data=data)
+        chunk = cls(log=log, stream=stream, offset=offset, data='', compressed=packed)
+        chunk._text = data
+        return chunk
+
+    @property
+    def text(self):
+        if self.compressed is None:
+            return self.data
+        if getattr(self, '_text', None) is None:
+            self._text = compression.decompress(self.compressed)
+        return self._text
+
+class TaskStatsHourly(models.Model):
+    """
+    Estatísticas de execução agregadas por tarefa e hora, atualizadas ao
+    fim de cada execução (ver tasks/stats.py). Alimenta /api/stats/ sem
+    varrer a tabela de logs.
+    """
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='hourly_stats')
+    hour = models.DateTimeField(help_text="Início da hora (UTC)")
+    success_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    timeout_count = models.PositiveIntegerField(default=0)
+    duration_sum = models.FloatField(default=0)
+    duration_histogram = models.JSONField(default=list, help_text="Contagem de execuções por faixa de duração (stats.DURATION_BUCKETS)")
+    # Execuções barradas pela política de concorrência da tarefa
+    skipped_count = models.PositiveIntegerField(default=0, help_text="Ignoradas: já havia uma em execução")
+    merged_count = models.PositiveIntegerField(default=0, help_text="Descartadas: já havia uma pendente")
+    replaced_count = models.PositiveIntegerField(default=0, help_text="Interrompidas por uma execução mais recente")
+    # Cache de bytecode das tarefas 'script' (ver tasks/bytecode.py)
+    bytecode_hits = models.PositiveIntegerField(default=0, help_text="Execuções com bytecode já em cache (memória ou disco)")
+    bytecode_misses = models.PositiveIntegerField(default=0, help_text="Execuções que precisaram compilar o código")
+    compile_seconds = models.FloatField(default=0, help_text="Tempo gasto compilando nas execuções sem cache")
+    compile_seconds_saved = models.FloatField(default=0, help_text="Tempo de compilação evitado pelos acertos do cache")
+
+    class Meta:
+        unique_together = [('task', 'hour')]
+        indexes = [
+            models.Index(fields=['hour']),
+        ]
+
+class ScheduleStatsHourly(models.Model):
+    """
+    Atraso dos agendamentos (do horário previsto ao envio pelo beat)
+    agregado por hora. Atualizado pelo HeapScheduler (ver tasks/scheduler.py).
+    """
+    hour = models.DateTimeField(unique=True, help_text="Início da hora (UTC)")
+    count = models.PositiveIntegerField(default=0)
+    lag_sum = models.FloatField(default=0)
+    lag_max = models.FloatField(default=0)
+    lag_histogram = models.JSONField(default=list, help_text="Contagem de envios por faixa de atraso (stats.DURATION_BUCKETS)")
+
+class ScheduleChange(models.Model):
+    """
+    Agendamento (PeriodicTask) criado, alterado ou removido. O HeapScheduler
+    lê as mudanças novas a cada poucos segundos e recarrega só esses
+    agendamentos, em vez da tabela inteira (ver tasks/scheduler.py). As
+    linhas já aplicadas são apagadas pelo próprio beat.
+    """
+    periodic_task_id = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class QueueStatsHourly(models.Model):
+    """
+    Tempo de espera na fila (do envio ao início da execução) agregado por
+    fila de prioridade e hora. Atualizado por execute_task (ver tasks/stats.py).
+    """
+    queue = models.CharField(max_length=50)
+    hour = models.DateTimeField(help_text="Início da hora (UTC)")
+    count = models.PositiveIntegerField(default=0)
+    wait_sum = models.FloatField(default=0)
+    wait_histogram = models.JSONField(default=list, help_text="Contagem de execuções por faixa de espera (stats.DURATION_BUCKETS)")
+
+    class Meta:
+        unique_together = [('queue', 'hour')]
+        indexes = [
+            models.Index(fields=['hour']),
+        ]
+
+class Workflow(models.Model):
+    """
+    Tarefas encadeadas em um grafo de dependências: cada passo roda depois
+    que todas as suas dependências terminam com sucesso e recebe a saída
+    delas (ver tasks/workflows.py).
+    """
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.title
+
+class WorkflowStep(models.Model):
+    workflow = models.ForeignKey(Workflow, on_delete=models.CASCADE, related_name='steps')
+    name = models.SlugField(max_length=100, help_text="Identifica o passo nas dependências e nas entradas dos passos seguintes")
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='workflow_steps')
+    depends_on = models.ManyToManyField('self', symmetrical=False, related_name='dependents', blank=True)
+
+    class Meta:
+        ordering = ['id']
+        unique_together = [('workflow', 'name')]
+
+    def __str__(self):
+        return f"{self.workflow.title}: {self.name}"
+
+class WorkflowRun(models.Model):
+    STATUS_CHOICES = [
+        ('running', 'Rodando'),
+        ('success', 'Sucesso'),
+        ('error', 'Erro'),
+    ]
+
+    workflow = models.ForeignKey(Workflow, on_delete=models.CASCADE, related_name='runs')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
     created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, help_text="Do disparo ao fim do último passo, em segundos")
+    critical_path = models.JSONField(default=list, help_text="Nomes dos passos da cadeia de dependências mais longa")
+    critical_path_duration = models.FloatField(null=True, help_text="Soma das durações dos passos do caminho crítico")
 
     class Meta:
         ordering = ['-created_at']
+
+class WorkflowStepRun(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Aguardando dependências'),
+        ('queued', 'Na fila'),
+        ('running', 'Rodando'),
+        ('success', 'Sucesso'),
+        ('error', 'Erro'),
+        ('timeout', 'Tempo esgotado'),
+        ('skipped', 'Ignorado'),
+        ('cancelled', 'Cancelado'),
+    ]
+
+    run = models.ForeignKey(WorkflowRun, on_delete=models.CASCADE, related_name='steps')
+    step = models.ForeignKey(WorkflowStep, on_delete=models.SET_NULL, null=True, related_name='runs')
+    name = models.CharField(max_length=100, help_text="Cópia de WorkflowStep.name, mantida se o passo for removido")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    waiting = models.PositiveIntegerField(default=0, help_text="Dependências que ainda não terminaram")
+    output = models.TextField(blank=True, help_text="Saída repassada aos passos seguintes")
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, help_text="Duração em segundos")
+
+    class Meta:
+        ordering = ['id']
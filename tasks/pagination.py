@@ -0,0 +1,41 @@
+from django.db.models import FloatField, Value
+from django.db.models.functions import Coalesce
+from rest_framework.pagination import CursorPagination
+
+
+class TaskLogCursorPagination(CursorPagination):
+    """
+    Paginação por cursor (keyset) para logs: cada página é uma consulta
+    `WHERE created_at < cursor ... LIMIT n` usando o índice, sem OFFSET e
+    sem COUNT(*) sobre a tabela inteira.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 10
+    page_size_query_param = 'limit'
+    max_page_size = 200
+
+    # O cursor não representa NULL: campos opcionais são ordenados por uma
+    # anotação com um valor no lugar do NULL (logs em execução não têm
+    # duration e ficam por último em -duration, primeiro em duration)
+    null_substitutes = {
+        'duration': ('duration_sort', Coalesce('duration', Value(-1.0), output_field=FloatField())),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        ordering = []
+        for field in super().get_ordering(request, queryset, view):
+            name = field.lstrip('-')
+            if name in self.null_substitutes:
+                field = field[:len(field) - len(name)] + self.null_substitutes[name][0]
+            ordering.append(field)
+        return tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        annotations = dict(
+            self.null_substitutes[field.lstrip('-')]
+            for field in super().get_ordering(request, queryset, view)
+            if field.lstrip('-') in self.null_substitutes
+        )
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        return super().paginate_queryset(queryset, request, view)
@@ -0,0 +1,130 @@
+"""
+Retenção de logs em lotes por faixa de id.
+
+Em vez de um único DELETE (que o Django expande carregando todas as
+linhas em memória), os logs expirados são removidos em janelas de
+`batch_size` ids com DELETEs diretos (_raw_delete), com pausa entre os
+lotes para não segurar o lock do banco. Como a varredura segue a ordem
+dos ids e cada lote é idempotente, uma execução interrompida continua de
+onde parou na próxima vez.
+
+Prazos por status vêm de TASK_LOG_RETENTION_DAYS; Task.log_retention_days
+sobrepõe o prazo para todos os logs daquela tarefa. No fim da varredura,
+os blobs de saída (tasks/blobstore.py) que nenhum log referencia mais são
+removidos.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import blobstore
+from .models import Task, TaskBatch, TaskLog, TaskLogChunk
+
+
+def build_policy(days=None, now=None):
+    """
+    Monta o filtro de logs expirados e o prazo mais recente entre as regras.
+    Com `days`, aplica o mesmo prazo a todos os logs (comportamento antigo).
+    """
+    now = now or timezone.now()
+    if days is not None:
+        cutoff = now - timedelta(days=days)
+        return Q(created_at__lt=cutoff), cutoff
+
+    overrides = dict(Task.objects.filter(log_retention_days__isnull=False).values_list('id', 'log_retention_days'))
+    policy = settings.TASK_LOG_RETENTION_DAYS
+    default_days = policy['default']
+
+    rules = Q()
+    cutoffs = []
+    for status, _ in TaskLog.STATUS_CHOICES:
+        cutoff = now - timedelta(days=policy.get(status, default_days))
+        rules |= Q(status=status, created_at__lt=cutoff) & ~Q(task_id__in=list(overrides))
+        cutoffs.append(cutoff)
+
+    for task_id, task_days in overrides.items():
+        cutoff = now - timedelta(days=task_days)
+        rules |= Q(task_id=task_id, created_at__lt=cutoff)
+        cutoffs.append(cutoff)
+
+    return rules, max(cutoffs)
+
+
+def delete_expired(days=None, batch_size=None, pause=None, max_seconds=None, start_id=None, progress=None):
+    """
+    Remove os logs expirados em lotes. Retorna métricas da execução;
+    `next_id` vem preenchido quando o tempo máximo acabou antes do fim.
+    """
+    batch_size = batch_size or settings.TASK_LOG_RETENTION_BATCH_SIZE
+    pause = settings.TASK_LOG_RETENTION_PAUSE if pause is None else pause
+    max_seconds = max_seconds or settings.TASK_LOG_RETENTION_MAX_SECONDS
+
+    rules, newest_cutoff = build_policy(days)
+    started = time.monotonic()
+    metrics = {'deleted': 0, 'chunks_deleted': 0, 'batches': 0, 'next_id': None}
+
+    candidates = TaskLog.objects.filter(created_at__lt=newest_cutoff)
+    if start_id:
+        candidates = candidates.filter(id__gte=start_id)
+    low = candidates.order_by('id').values_list('id', flat=True).first()
+    high = TaskLog.objects.order_by('-id').values_list('id', flat=True).first()
+
+    while low is not None and low <= high:
+        window = TaskLog.objects.filter(id__gte=low, id__lt=low + batch_size)
+        # Ids crescem com o tempo: se o início da janela já é mais novo que
+        # todos os prazos, não há mais nada para remover
+        first_created = window.order_by('id').values_list('created_at', flat=True).first()
+        if first_created is not None and first_created >= newest_cutoff:
+            break
+
+        expired = window.filter(rules)
+        with transaction.atomic():
+            metrics['chunks_deleted'] += TaskLogChunk.objects.filter(log__in=expired.values('id'))._raw_delete(connection.alias)
+            metrics['deleted'] += expired._raw_delete(connection.alias)
+        metrics['batches'] += 1
+        low += batch_size
+
+        elapsed = time.monotonic() - started
+        if progress:
+            progress({**metrics, 'current_id': low, 'max_id': high, 'elapsed': round(elapsed, 2)})
+        if elapsed >= max_seconds:
+            metrics['next_id'] = low
+            break
+        if pause:
+            time.sleep(pause)
+
+    if metrics['next_id'] is None:
+        # Lotes de run_bulk que ficaram sem nenhum log
+        metrics['task_batches_deleted'] = TaskBatch.objects.filter(created_at__lt=newest_cutoff, logs__isnull=True).delete()[0]
+        metrics['blobs_deleted'] = collect_blobs()
+
+    elapsed = time.monotonic() - started
+    metrics['elapsed'] = round(elapsed, 2)
+    metrics['rows_per_second'] = round(metrics['deleted'] / elapsed, 1) if elapsed else None
+    metrics['cutoff_date'] = str(newest_cutoff)
+    return metrics
+
+
+def collect_blobs():
+    """
+    Remove do blob store os blobs sem nenhum TaskLog que os referencie
+    (logs removidos ou arquivados). Blobs recentes ficam: o log que
+    aponta para eles pode ainda não ter sido gravado. Retorna quantos
+    foram removidos.
+    """
+    store = blobstore.get_store()
+    referenced = set()
+    refs = TaskLog.objects.filter(~Q(output_blob='') | ~Q(error_blob='')).values_list('output_blob', 'error_blob')
+    for output_blob, error_blob in refs.iterator(chunk_size=5000):
+        referenced.update((output_blob, error_blob))
+
+    deleted = 0
+    for digest, mtime in list(store.list()):
+        if digest not in referenced and not blobstore.is_recent(mtime):
+            store.delete(digest)
+            deleted += 1
+    return deleted
@@ -0,0 +1,294 @@
+"""
+Pool de interpretadores Python pré-aquecidos para tarefas do tipo 'script'.
+
+Cada processo do pool (tasks/script_worker.py) já nasce com os módulos
+comuns importados, recebe o código por pipe e devolve stdout/stderr em
+trechos separados. Limites de CPU e memória são aplicados no filho; o
+limite de tempo real é controlado aqui, matando o processo se estourar.
+Processos são reciclados após `max_runs` execuções. O bytecode dos scripts
+fica em cache (tasks/bytecode.py), em memória em cada filho e em disco em
+SCRIPT_BYTECODE_CACHE_DIR.
+"""
+import json
+import logging
+import os
+import queue
+import selectors
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Intervalo (segundos) entre verificações do pedido de cancelamento
+CANCEL_CHECK_INTERVAL = 0.5
+
+
+@dataclass
+class ScriptResult:
+    status: str
+    stdout: str
+    stderr: str
+    # Origem do bytecode ('memory', 'disk' ou 'miss') e segundos de compilação
+    # (gastos num 'miss', economizados num acerto); ver tasks/bytecode.py
+    cache: str = None
+    compile_time: float = 0.0
+    # stderr montado pelo pool (timeout, processo morto), que não passou por on_output
+    from_pool: bool = False
+
+
+class WorkerDied(Exception):
+    """O processo filho terminou antes de concluir a execução."""
+
+
+class ScriptWorker:
+    """
+    Um interpretador filho com o protocolo de mensagens em JSON por linha.
+    """
+
+    def __init__(self, preload, cache_dir="", cache_size=128):
+        self.runs = 0
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "tasks.script_worker", ",".join(preload), str(cache_dir), str(cache_size)],
+            cwd=str(settings.BASE_DIR),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            bufsize=0,
+        )
+        self._pending = b""
+        self._read_until_ready()
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def _read_messages(self, deadline=None, cancel=None):
+        """
+        Gera as mensagens do filho, respeitando o prazo (monotonic). Com
+        `cancel` sinalizado, interrompe como se o prazo tivesse estourado.
+        """
+        fd = self.process.stdout.fileno()
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            while True:
+                while b"\n" in self._pending:
+                    line, self._pending = self._pending.split(b"\n", 1)
+                    yield json.loads(line)
+
+                timeout = None
+                if deadline is not None:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        raise TimeoutError()
+                if cancel is not None:
+                    if cancel.is_set():
+                        raise TimeoutError()
+                    timeout = CANCEL_CHECK_INTERVAL if timeout is None else min(timeout, CANCEL_CHECK_INTERVAL)
+                    if not selector.select(timeout):
+                        continue
+                elif not selector.select(timeout):
+                    raise TimeoutError()
+
+                data = os.read(fd, 65536)
+                if not data:
+                    raise WorkerDied()
+                self._pending += data
+
+    def _read_until_ready(self):
+        for message in self._read_messages(time.monotonic() + 30):
+            if message["t"] == "ready":
+                return
+
+    def run(self, code, timeout=None, cpu_seconds=None, max_memory=None, on_output=None, cancel=None, inputs=None):
+        """
+        Executa `code` no filho. `on_output(stream, data)` recebe cada trecho
+        de saída ('stdout' ou 'stderr') assim que chega; `cancel`
+        (threading.Event) interrompe a execução. `inputs` vira a variável
+        global de mesmo nome no script.
+        """
+        self.runs += 1
+        request = {"code": code, "cpu_seconds": cpu_seconds, "max_memory": max_memory, "inputs": inputs}
+        try:
+            self.process.stdin.write((json.dumps(request) + "\n").encode("utf-8"))
+        except BrokenPipeError:
+            raise WorkerDied()
+
+        deadline = time.monotonic() + timeout if timeout else None
+        stdout, stderr = [], []
+        for message in self._read_messages(deadline, cancel):
+            kind = message["t"]
+            if kind == "out":
+                stdout.append(message["d"])
+                if on_output:
+                    on_output("stdout", message["d"])
+            elif kind == "err":
+                stderr.append(message["d"])
+                if on_output:
+                    on_output("stderr", message["d"])
+            elif kind == "done":
+                if message["error"]:
+                    stderr.append(message["error"])
+                    if on_output:
+                        on_output("stderr", message["error"])
+                if message.get("recycle"):
+                    self.close()
+                return ScriptResult(
+                    message["status"],
+                    "".join(stdout),
+                    "".join(stderr),
+                    cache=message.get("cache"),
+                    compile_time=message.get("compile_time") or 0.0,
+                )
+
+    def close(self):
+        if self.alive:
+            self.process.kill()
+        self.process.wait()
+        self.process.stdin.close()
+        self.process.stdout.close()
+
+
+class ScriptRunnerPool:
+    """
+    Mantém até `size` interpretadores prontos e distribui as execuções entre eles.
+    """
+
+    def __init__(
+        self,
+        size=1,
+        max_runs=100,
+        preload=(),
+        timeout=None,
+        cpu_seconds=None,
+        max_memory=None,
+        cache_dir="",
+        cache_size=128,
+    ):
+        self.size = size
+        self.max_runs = max_runs
+        self.preload = tuple(preload)
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.max_memory = max_memory
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def warm(self):
+        """Sobe todos os interpretadores de uma vez (pagando o cold start agora)."""
+        missing = self.size - self._idle.qsize()
+        for _ in range(max(missing, 0)):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        return ScriptWorker(self.preload, self.cache_dir, self.cache_size)
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._spawn()
+                if worker.alive:
+                    return worker
+                worker.close()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, worker):
+        try:
+            if worker.alive and worker.runs < self.max_runs:
+                self._idle.put(worker)
+            else:
+                worker.close()
+        finally:
+            self._slots.release()
+
+    def run(self, code, timeout=None, cpu_seconds=None, max_memory=None, on_output=None, cancel=None, inputs=None):
+        timeout = timeout or self.timeout
+        worker = self._acquire()
+        try:
+            return worker.run(
+                code,
+                timeout=timeout,
+                cpu_seconds=cpu_seconds or self.cpu_seconds,
+                max_memory=max_memory or self.max_memory,
+                on_output=on_output,
+                cancel=cancel,
+                inputs=inputs,
+            )
+        except TimeoutError:
+            worker.close()
+            return ScriptResult("timeout", "", f"Tempo limite de {timeout}s excedido", from_pool=True)
+        except WorkerDied:
+            worker.close()
+            logger.warning(f"Script worker died (exit code {worker.process.returncode})")
+            return ScriptResult(
+                "error",
+                "",
+                f"Processo de execução encerrado inesperadamente (código {worker.process.returncode})",
+                from_pool=True,
+            )
+        except BaseException:
+            # Execução interrompida no meio: o filho ainda tem mensagens pendentes
+            worker.close()
+            raise
+        finally:
+            self._release(worker)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Retorna o pool do processo atual, criando-o a partir das configurações.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ScriptRunnerPool(
+                size=settings.SCRIPT_RUNNER_POOL_SIZE,
+                max_runs=settings.SCRIPT_RUNNER_MAX_RUNS,
+                preload=settings.SCRIPT_RUNNER_PRELOAD,
+                timeout=settings.SCRIPT_RUNNER_TIMEOUT or None,
+                cpu_seconds=settings.SCRIPT_RUNNER_CPU_SECONDS or None,
+                max_memory=settings.SCRIPT_RUNNER_MAX_MEMORY_MB * 1024 * 1024 or None,
+                cache_dir=settings.SCRIPT_BYTECODE_CACHE_DIR,
+                cache_size=settings.SCRIPT_BYTECODE_CACHE_SIZE,
+            )
+        return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def _reset_after_fork():
+    # Processos filhos do Celery (prefork) não podem compartilhar os pipes do pai
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,443 @@
+"""
+Scheduler do Celery Beat para muitos agendamentos (tasks.scheduler:HeapScheduler).
+
+O DatabaseScheduler do django_celery_beat relê e reavalia a tabela
+PeriodicTask inteira a cada mudança, consulta o banco a cada tick e envia
+uma tarefa por tick; com dezenas de milhares de agendamentos, os ticks
+ficam lentos e as tarefas saem atrasadas. Aqui:
+
+- cada cron é compilado uma vez (CronExpression, conjuntos ordenados de
+  minutos/horas/dias) e o próximo horário sai por busca binária;
+- os próximos horários ficam em um min-heap: um tick só olha o topo e
+  envia de uma vez todos os agendamentos vencidos;
+- criar, alterar ou remover um PeriodicTask grava um ScheduleChange
+  (sinais em tasks/apps.py); a cada SCHEDULER_POLL_INTERVAL o beat lê só as
+  mudanças novas e recarrega esses agendamentos. Entradas antigas ficam no
+  heap marcadas como obsoletas e são descartadas ao chegar ao topo. Uma
+  releitura completa a cada SCHEDULER_FULL_SYNC_SECONDS cobre alterações
+  feitas sem sinais (ex.: queryset.update);
+- last_run_at/total_run_count são gravados em lote no sync, junto com o
+  atraso de cada envio (horário de envio menos o previsto) em
+  ScheduleStatsHourly, exibido em /api/stats/ como `schedule_lag`.
+
+Os PeriodicTask continuam sendo a fonte dos agendamentos (admin e
+TaskSerializer não mudam) e valem as mesmas regras do DatabaseScheduler:
+crontab no fuso do CrontabSchedule (dia do mês E dia da semana, como no
+Celery), intervalos, solar, clocked, start_time, expires e one_off. Um
+horário perdido com o beat parado é executado uma vez ao voltar.
+"""
+import bisect
+import heapq
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from celery.beat import Scheduler, SchedulingError
+from celery.schedules import crontab
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from django_celery_beat.models import (
+    ClockedSchedule, CrontabSchedule, IntervalSchedule, PeriodicTask, SolarSchedule,
+)
+from django_celery_beat.schedulers import ModelEntry
+from kombu.utils.json import loads
+
+from . import stats
+from .models import ScheduleChange
+
+logger = logging.getLogger(__name__)
+
+# Dias buscados por CronExpression.next_after antes de desistir (ex.: 30 de fevereiro)
+MAX_SEARCH_DAYS = 366 * 8
+
+FIELDS = (
+    'id', 'name', 'task', 'args', 'kwargs', 'queue', 'exchange', 'routing_key', 'priority', 'headers',
+    'expires', 'expire_seconds', 'one_off', 'start_time', 'last_run_at', 'date_changed',
+    'crontab_id', 'interval_id', 'solar_id', 'clocked_id',
+)
+
+
+class CronExpression:
+    """
+    Cron pré-compilado: os campos são expandidos uma vez pelo parser do
+    Celery (mesma sintaxe e semântica do crontab do DatabaseScheduler).
+    """
+
+    def __init__(self, minute='*', hour='*', day_of_month='*', month_of_year='*', day_of_week='*'):
+        spec = crontab(
+            minute=minute, hour=hour, day_of_month=day_of_month, month_of_year=month_of_year, day_of_week=day_of_week,
+        )
+        self.minutes = sorted(spec.minute)
+        self.hours = sorted(spec.hour)
+        self.days = frozenset(spec.day_of_month)
+        self.months = frozenset(spec.month_of_year)
+        # Celery: 0 = domingo
+        self.weekdays = frozenset(spec.day_of_week)
+
+    def _day_matches(self, day):
+        return day.day in self.days and (day.weekday() + 1) % 7 in self.weekdays
+
+    def next_after(self, moment):
+        """
+        Primeiro horário (datetime ingênuo, no fuso do cron) estritamente
+        depois de `moment`, ou None se o cron nunca dispara.
+        """
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = candidate.replace(hour=0, minute=0)
+        for _ in range(MAX_SEARCH_DAYS):
+            if day.month not in self.months:
+                # Pula para o primeiro dia do mês seguinte
+                day = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+                continue
+            if self._day_matches(day):
+                start = candidate if day.date() == candidate.date() else day
+                found = self._time_in_day(start)
+                if found is not None:
+                    return found
+            day += timedelta(days=1)
+        return None
+
+    def _time_in_day(self, start):
+        index = bisect.bisect_left(self.hours, start.hour)
+        if index == len(self.hours):
+            return None
+        hour = self.hours[index]
+        if hour == start.hour:
+            position = bisect.bisect_left(self.minutes, start.minute)
+            if position < len(self.minutes):
+                return start.replace(minute=self.minutes[position])
+            if index + 1 == len(self.hours):
+                return None
+            hour = self.hours[index + 1]
+        return start.replace(hour=hour, minute=self.minutes[0])
+
+
+class HeapEntry:
+    """Um PeriodicTask habilitado, no formato que Scheduler.apply_async usa."""
+
+    __slots__ = (
+        'id', 'name', 'task', 'args', 'kwargs', 'options', 'changed', 'one_off', 'start_time', 'expires',
+        'cron', 'tz', 'schedule', 'last_run_at', 'next_run', 'version',
+    )
+
+    def __repr__(self):
+        return f'<HeapEntry {self.name} next={self.next_run}>'
+
+
+class HeapScheduler(Scheduler):
+    """
+    Beat com os próximos horários em um min-heap e atualização incremental
+    a partir de ScheduleChange. Uso: celery beat -S tasks.scheduler:HeapScheduler
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._entries = {}
+        self._stale = 0
+        self._version = 0
+        self._last_change = 0
+        self._last_poll = 0.0
+        self._last_full_sync = 0.0
+        # Envios ainda não gravados: {id: [execuções, último envio]}, atrasos e entradas encerradas
+        self._fired = {}
+        self._lags = []
+        self._disabled = set()
+        # {id do CrontabSchedule: (CronExpression, fuso)} e crons compilados por expressão
+        self._crons = {}
+        self._compiled = {}
+        self.poll_interval = settings.SCHEDULER_POLL_INTERVAL
+        self.full_sync_every = settings.SCHEDULER_FULL_SYNC_SECONDS
+        self.sync_every = settings.SCHEDULER_SYNC_SECONDS
+        super().__init__(*args, **kwargs)
+
+    # Carga dos agendamentos
+
+    def setup_schedule(self):
+        # Agendamentos de CELERY_BEAT_SCHEDULE viram PeriodicTask, como no DatabaseScheduler
+        for name, fields in (self.app.conf.beat_schedule or {}).items():
+            try:
+                ModelEntry.from_entry(name, app=self.app, **fields)
+            except Exception as e:
+                logger.error(f"Cannot add beat_schedule entry {name}: {e}")
+        self._full_sync()
+
+    def _full_sync(self):
+        """Relê todos os agendamentos habilitados e reconstrói o heap."""
+        started = time.monotonic()
+        close_old_connections()
+        # Mudanças gravadas durante a leitura são aplicadas de novo no próximo poll
+        self._last_change = ScheduleChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        rows = list(PeriodicTask.objects.filter(enabled=True).values(*FIELDS))
+        schedules = self._load_schedules(rows)
+        now = timezone.now()
+
+        entries = {}
+        for row in rows:
+            current = self._entries.get(row['id'])
+            if (
+                current is not None
+                and current.changed == row['date_changed']
+                and current.cron is self._crons.get(row['crontab_id'], (None,))[0]
+            ):
+                entries[row['id']] = current
+                continue
+            entry = self._build(row, schedules, now, current)
+            if entry is not None:
+                entries[row['id']] = entry
+        self._entries = entries
+        self._rebuild_heap()
+        ScheduleChange.objects.filter(id__lte=self._last_change).delete()
+        self._last_full_sync = self._last_poll = time.monotonic()
+        logger.info(f"HeapScheduler loaded {len(entries)} schedules in {time.monotonic() - started:.2f}s")
+
+    def _apply_changes(self):
+        """Recarrega só os agendamentos que mudaram desde o último poll."""
+        changes = list(
+            ScheduleChange.objects.filter(id__gt=self._last_change).order_by('id').values_list('id', 'periodic_task_id')
+        )
+        self._last_poll = time.monotonic()
+        if not changes:
+            return 0
+        self._last_change = changes[-1][0]
+        ids = {periodic_task_id for _, periodic_task_id in changes}
+        rows = list(PeriodicTask.objects.filter(id__in=ids, enabled=True).values(*FIELDS))
+        schedules = self._load_schedules(rows)
+        now = timezone.now()
+
+        for row in rows:
+            ids.discard(row['id'])
+            current = self._entries.get(row['id'])
+            entry = self._build(row, schedules, now, current)
+            if current is not None:
+                self._stale += 1
+            if entry is None:
+                self._entries.pop(row['id'], None)
+            else:
+                self._entries[row['id']] = entry
+                heapq.heappush(self._heap, (entry.next_run, entry.id, entry.version))
+        # Removidos ou desabilitados
+        for periodic_task_id in ids:
+            if self._entries.pop(periodic_task_id, None) is not None:
+                self._stale += 1
+        if self._stale > len(self._entries):
+            self._rebuild_heap()
+        ScheduleChange.objects.filter(id__lte=self._last_change).delete()
+        logger.debug(f"HeapScheduler applied {len(changes)} schedule changes")
+        return len(changes)
+
+    def _load_schedules(self, rows):
+        """Objetos de agendamento usados pelas linhas, um por registro."""
+        schedules = {}
+        for field, model in (('interval_id', IntervalSchedule), ('solar_id', SolarSchedule), ('clocked_id', ClockedSchedule)):
+            ids = {row[field] for row in rows if row[field]}
+            if ids:
+                schedules[field] = {obj.id: obj.schedule for obj in model.objects.filter(id__in=ids)}
+        ids = {row['crontab_id'] for row in rows if row['crontab_id']}
+        for obj in CrontabSchedule.objects.filter(id__in=ids):
+            self._crons[obj.id] = (self._compile(obj), obj.timezone)
+        return schedules
+
+    def _compile(self, obj):
+        spec = (obj.minute, obj.hour, obj.day_of_month, obj.month_of_year, obj.day_of_week)
+        if spec not in self._compiled:
+            try:
+                self._compiled[spec] = CronExpression(*spec)
+            except Exception as e:
+                logger.error(f"Invalid crontab {obj.id} ({obj}): {e}")
+                self._compiled[spec] = None
+        return self._compiled[spec]
+
+    def _build(self, row, schedules, now, current=None):
+        entry = HeapEntry()
+        entry.id = row['id']
+        entry.name = row['name']
+        entry.task = row['task']
+        entry.changed = row['date_changed']
+        entry.one_off = row['one_off']
+        entry.start_time = row['start_time']
+        entry.expires = row['expires']
+        entry.cron = entry.tz = entry.schedule = None
+        try:
+            entry.args = loads(row['args'] or '[]')
+            entry.kwargs = loads(row['kwargs'] or '{}')
+            headers = loads(row['headers'] or '{}')
+        except ValueError as e:
+            logger.error(f"Ignoring schedule {entry.name}: invalid arguments ({e})")
+            return None
+        headers['periodic_task_name'] = entry.name
+        entry.options = {
+            option: row[option]
+            for option in ('queue', 'exchange', 'routing_key', 'priority')
+            if row[option] is not None
+        }
+        if row['expires'] or row['expire_seconds']:
+            entry.options['expires'] = row['expires'] or row['expire_seconds']
+        entry.options['headers'] = headers
+
+        if row['crontab_id']:
+            entry.cron, entry.tz = self._crons.get(row['crontab_id'], (None, None))
+        else:
+            for field in ('interval_id', 'solar_id', 'clocked_id'):
+                if row[field]:
+                    entry.schedule = schedules.get(field, {}).get(row[field])
+        if entry.cron is None and entry.schedule is None:
+            return None
+
+        # Um envio ainda não gravado no banco vale mais que o last_run_at lido
+        last_run_at = row['last_run_at'] or row['date_changed'] or now
+        if current is not None and current.last_run_at > last_run_at:
+            last_run_at = current.last_run_at
+        if entry.start_time is not None and row['last_run_at'] is None and entry.schedule is not None:
+            # Como no DatabaseScheduler: o primeiro envio acontece no start_time
+            last_run_at -= timedelta(days=365 * 30)
+        entry.last_run_at = last_run_at
+        entry.next_run = self._next_run(entry, last_run_at, now)
+        if entry.next_run is None:
+            return None
+        self._version += 1
+        entry.version = self._version
+        return entry
+
+    def _next_run(self, entry, after, now):
+        """Timestamp do próximo envio depois de `after` (pode ser passado: vence já)."""
+        if entry.cron is not None:
+            if entry.start_time is not None and entry.start_time > after:
+                after = entry.start_time - timedelta(minutes=1)
+            moment = after.astimezone(entry.tz).replace(tzinfo=None)
+            while True:
+                moment = entry.cron.next_after(moment)
+                if moment is None:
+                    return None
+                # Horário repetido na volta do horário de verão: o próximo real vem depois de `after`
+                when = moment.replace(tzinfo=entry.tz).timestamp()
+                if when > after.timestamp():
+                    break
+        else:
+            remaining = entry.schedule.remaining_estimate(after)
+            when = (now + remaining).timestamp()
+            if entry.start_time is not None:
+                when = max(when, entry.start_time.timestamp())
+        if entry.expires is not None and when >= entry.expires.timestamp():
+            return None
+        return when
+
+    def _rebuild_heap(self):
+        self._heap = [(entry.next_run, entry.id, entry.version) for entry in self._entries.values()]
+        heapq.heapify(self._heap)
+        self._stale = 0
+
+    # Ciclo do beat
+
+    def tick(self, *args, **kwargs):
+        """
+        Envia todos os agendamentos vencidos. Retorna os segundos até o
+        próximo horário (no máximo max_interval).
+        """
+        if self._heap is None:
+            self._full_sync()
+        monotonic = time.monotonic()
+        try:
+            if self.full_sync_every and monotonic - self._last_full_sync >= self.full_sync_every:
+                self._full_sync()
+            elif monotonic - self._last_poll >= self.poll_interval:
+                self._apply_changes()
+        except Exception as e:
+            # O banco fora do ar não para o beat: segue com os agendamentos em memória
+            logger.error(f"HeapScheduler failed to read schedule changes: {e}")
+            self._last_poll = monotonic
+
+        now = time.time()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            when, entry_id, version = heapq.heappop(heap)
+            entry = self._entries.get(entry_id)
+            if entry is None or entry.version != version:
+                self._stale = max(self._stale - 1, 0)
+                continue
+            self._fire(entry, when)
+        if not heap:
+            return self.max_interval
+        return min(max(heap[0][0] - time.time(), 0), self.max_interval)
+
+    def _fire(self, entry, when):
+        sent_at = timezone.now()
+        try:
+            self.apply_async(entry, producer=self.producer, advance=False)
+        except SchedulingError as e:
+            logger.error(f"Failed to send scheduled task {entry.name}: {e}")
+        else:
+            self._lags.append((sent_at, max(sent_at.timestamp() - when, 0)))
+            logger.info(f"Scheduler: Sending due task {entry.name} ({entry.task})")
+
+        fired = self._fired.setdefault(entry.id, [0, sent_at])
+        fired[0] += 1
+        fired[1] = sent_at
+        entry.last_run_at = sent_at
+        scheduled = datetime.fromtimestamp(when, dt_timezone.utc)
+        next_run = None if entry.one_off else self._next_run(entry, max(sent_at, scheduled), sent_at)
+        if next_run is None:
+            # one_off já enviado, expirado ou sem próximo horário
+            del self._entries[entry.id]
+            if entry.one_off or entry.expires is not None:
+                self._disabled.add(entry.id)
+            return
+        entry.next_run = next_run
+        heapq.heappush(self._heap, (next_run, entry.id, entry.version))
+
+    def sync(self):
+        """Grava em lote os envios (last_run_at, total_run_count) e os atrasos."""
+        fired, self._fired = self._fired, {}
+        lags, self._lags = self._lags, []
+        disabled, self._disabled = self._disabled, set()
+        try:
+            close_old_connections()
+            groups = defaultdict(list)
+            for periodic_task_id, (count, last_run_at) in fired.items():
+                groups[(count, last_run_at)].append(periodic_task_id)
+            for (count, last_run_at), ids in groups.items():
+                # update() não dispara sinais: o beat não recebe as próprias gravações como mudança
+                PeriodicTask.objects.filter(id__in=ids).update(
+                    last_run_at=last_run_at, total_run_count=F('total_run_count') + count
+                )
+            if disabled:
+                PeriodicTask.objects.filter(id__in=disabled).update(enabled=False)
+            if lags:
+                stats.record_schedule_lag(lags)
+        except Exception as e:
+            logger.error(f"HeapScheduler failed to save {len(fired)} schedule runs: {e}")
+            # Tenta de novo no próximo sync
+            for periodic_task_id, (count, last_run_at) in fired.items():
+                pending = self._fired.setdefault(periodic_task_id, [0, last_run_at])
+                pending[0] += count
+            self._lags = lags + self._lags
+            self._disabled |= disabled
+
+    @property
+    def info(self):
+        return f'    . schedules -> {len(self._entries)} (heap)'
+
+
+def record_change(sender, instance, **kwargs):
+    """
+    Receptor de post_save/post_delete de PeriodicTask. Gravações do próprio
+    beat (no_changes, como no django_celery_beat) não contam.
+    """
+    if not getattr(instance, 'no_changes', False):
+        ScheduleChange.objects.create(periodic_task_id=instance.id)
+
+
+def record_schedule_change(sender, instance, **kwargs):
+    """
+    Receptor de post_save dos tipos de agendamento (crontab, intervalo...):
+    o registro pode ser compartilhado por vários PeriodicTask.
+    """
+    field = {
+        CrontabSchedule: 'crontab',
+        IntervalSchedule: 'interval',
+        SolarSchedule: 'solar',
+        ClockedSchedule: 'clocked',
+    }[sender]
+    ids = PeriodicTask.objects.filter(**{field: instance}).values_list('id', flat=True)
+    ScheduleChange.objects.bulk_create([ScheduleChange(periodic_task_id=periodic_task_id) for periodic_task_id in ids])
@@ -0,0 +1,224 @@
+"""
+Processo filho do pool de execução de scripts (ver tasks/runner.py).
+
+Roda como `python -m tasks.script_worker <modulos_preload> [<dir_cache>
+<tamanho_cache>]` (cache de bytecode, ver tasks/bytecode.py). Recebe pedidos
+em JSON (um por linha) pelo stdin original e devolve mensagens em JSON (uma
+por linha) pelo stdout original. Os dois viram descritores privados; o
+script vê um stdin vazio (input() levanta EOFError) e o seu stdout/stderr
+vão em mensagens:
+
+    {"t": "ready"}                                  processo pronto
+    {"t": "out", "d": "..."}                        trecho de stdout do script
+    {"t": "err", "d": "..."}                        trecho de stderr do script
+    {"t": "done", "status": "...", "error": "...",  fim da execução; "cache" diz
+     "cache": "...", "compile_time": 0.0}          de onde veio o bytecode
+
+Não importa Django: o processo precisa ser leve e isolado do worker Celery.
+"""
+import builtins
+import importlib
+import io
+import json
+import os
+import resource
+import signal
+import sys
+import threading
+import traceback
+
+from tasks.bytecode import BytecodeCache
+
+# Tamanho máximo do buffer antes de enviar um trecho ao processo pai
+FLUSH_BYTES = 8192
+# Intervalo máximo entre envios, para que a saída apareça enquanto roda
+FLUSH_INTERVAL = 0.25
+
+
+class CPULimitExceeded(BaseException):
+    """Levantada pelo handler de SIGXCPU quando o script esgota o tempo de CPU."""
+
+
+class _ProtocolStream(io.TextIOBase):
+    """
+    Substitui sys.stdout/sys.stderr do script, enviando a saída ao processo
+    pai em trechos com buffer limitado.
+    """
+
+    def __init__(self, kind, channel):
+        self._kind = kind
+        self._channel = channel
+        self._buffer = []
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if not isinstance(text, str):
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        if text:
+            with self._lock:
+                self._buffer.append(text)
+                self._size += len(text)
+            if self._size >= FLUSH_BYTES:
+                self.flush()
+        return len(text)
+
+    def flush(self):
+        with self._lock:
+            data = "".join(self._buffer)
+            self._buffer = []
+            self._size = 0
+        if data:
+            _send(self._channel, {"t": self._kind, "d": data})
+
+
+_send_lock = threading.Lock()
+
+
+def _send(channel, message):
+    with _send_lock:
+        channel.write(json.dumps(message) + "\n")
+        channel.flush()
+
+
+def _flush_periodically(streams, stop):
+    """Envia o que estiver no buffer a cada FLUSH_INTERVAL enquanto o script roda."""
+    while not stop.wait(FLUSH_INTERVAL):
+        for stream in streams:
+            stream.flush()
+
+
+def _on_sigxcpu(signum, frame):
+    raise CPULimitExceeded()
+
+
+def _apply_limits(request):
+    """
+    Aplica limites de CPU e memória para esta execução.
+    Retorna os limites anteriores para restaurar ao final.
+    """
+    previous = {}
+    cpu_seconds = request.get("cpu_seconds")
+    if cpu_seconds:
+        # RLIMIT_CPU é acumulado no processo: soma ao tempo já consumido
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        previous[resource.RLIMIT_CPU] = (soft, hard)
+        limit = int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+
+    max_memory = request.get("max_memory")
+    if max_memory:
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        previous[resource.RLIMIT_AS] = (soft, hard)
+        if hard != resource.RLIM_INFINITY:
+            max_memory = min(max_memory, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, hard))
+    return previous
+
+
+def _restore_limits(previous):
+    for which, limits in previous.items():
+        resource.setrlimit(which, limits)
+
+
+def _run(request, channel, cache):
+    out = _ProtocolStream("out", channel)
+    err = _ProtocolStream("err", channel)
+    status = "success"
+    error = ""
+    recycle = False
+    code, origin, compile_time = None, None, 0.0
+
+    stop = threading.Event()
+    flusher = threading.Thread(target=_flush_periodically, args=((out, err), stop), daemon=True)
+    flusher.start()
+
+    old_stdin, old_stdout, old_stderr = sys.stdin, sys.stdout, sys.stderr
+    # Novo a cada execução: o script pode ter fechado ou trocado o anterior
+    sys.stdin = open(os.devnull, encoding="utf-8")
+    sys.stdout, sys.stderr = out, err
+    previous = _apply_limits(request)
+    try:
+        code, origin, compile_time = cache.get(request["code"])
+        # `inputs`: saídas dos passos anteriores, em workflows
+        exec(code, {"__builtins__": builtins, "__name__": "__main__", "inputs": request.get("inputs") or {}})
+    except CPULimitExceeded:
+        status = "error"
+        error = f"Limite de CPU excedido ({request.get('cpu_seconds')}s)"
+        recycle = True
+    except MemoryError:
+        status = "error"
+        error = "Limite de memória excedido"
+        recycle = True
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status = "error"
+            error = f"SystemExit: {e.code}"
+    except BaseException as e:
+        status = "error"
+        # Omite o frame deste módulo (e os da compilação, num erro de sintaxe):
+        # o usuário só precisa ver o próprio código
+        tb = e.__traceback__.tb_next if e.__traceback__ and code is not None else None
+        error = "".join(traceback.format_exception(type(e), e, tb))
+    finally:
+        _restore_limits(previous)
+        sys.stdin.close()
+        sys.stdin, sys.stdout, sys.stderr = old_stdin, old_stdout, old_stderr
+        stop.set()
+        flusher.join()
+        out.flush()
+        err.flush()
+
+    _send(
+        channel,
+        {
+            "t": "done",
+            "status": status,
+            "error": error,
+            "recycle": recycle,
+            "cache": origin,
+            "compile_time": compile_time,
+        },
+    )
+
+
+def main():
+    # O stdout original vira canal exclusivo do protocolo; escritas diretas no
+    # descritor 1 (ex.: os.system) vão para o stderr herdado do worker.
+    channel = os.fdopen(os.dup(1), "w", buffering=1, encoding="utf-8")
+    os.dup2(2, 1)
+    # Mesma coisa com os pedidos: leituras do descritor 0 (input(), processos
+    # filhos) encontram /dev/null em vez do pipe do protocolo. Os descritores
+    # duplicados não são herdados pelos processos que o script criar.
+    commands = os.fdopen(os.dup(0), "r", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    signal.signal(signal.SIGXCPU, _on_sigxcpu)
+
+    for name in filter(None, sys.argv[1].split(",") if len(sys.argv) > 1 else []):
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+    cache = BytecodeCache(
+        sys.argv[2] if len(sys.argv) > 2 else None,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 128,
+    )
+
+    _send(channel, {"t": "ready"})
+    for line in commands:
+        if not line.strip():
+            continue
+        _run(json.loads(line), channel, cache)
+
+
+if __name__ == "__main__":
+    main()
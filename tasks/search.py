@@ -0,0 +1,204 @@
+"""
+Busca textual na saída dos logs.
+
+- SQLite: tabela virtual FTS5 (tasks_tasklog_fts) mantida por triggers
+  em tasks_tasklog, com índice de prefixo para busca enquanto digita.
+- PostgreSQL: índice GIN sobre to_tsvector('simple', output || ' ' || error).
+- Outros bancos (ou TASK_LOG_SEARCH_BACKEND='none'): `icontains`.
+
+Os triggers/índices são criados pela migração 0008 e conferidos após cada
+`migrate`: o SQLite recria a tabela em algumas alterações de schema e
+descarta os triggers junto.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+from .models import Task, TaskLog
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'tasks_tasklog_fts'
+PG_INDEX = 'tasks_tasklog_search_idx'
+PG_VECTOR = "to_tsvector('simple', output || ' ' || error)"
+
+SQLITE_SCHEMA = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(output, error, prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON tasks_tasklog BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, output, error) VALUES (new.id, new.output, new.error);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF output, error ON tasks_tasklog BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, output, error) VALUES (new.id, new.output, new.error);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON tasks_tasklog BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+]
+
+POSTGRES_SCHEMA = [
+    f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON tasks_tasklog USING GIN ({PG_VECTOR})",
+]
+
+TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def backend(conn=connection):
+    """Retorna 'fts5', 'postgres' ou None (sem índice textual)."""
+    if settings.TASK_LOG_SEARCH_BACKEND == 'none':
+        return None
+    if conn.vendor == 'sqlite':
+        return 'fts5'
+    if conn.vendor == 'postgresql':
+        return 'postgres'
+    return None
+
+
+def ensure_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Recria a tabela FTS/índice e os triggers que estiverem faltando
+    (conectado ao post_migrate). Se os triggers tinham sumido, o índice
+    FTS é reconstruído a partir de tasks_tasklog.
+    """
+    conn = connections[using]
+    kind = backend(conn)
+    if kind is None or 'tasks_tasklog' not in conn.introspection.table_names():
+        return
+    with conn.cursor() as cursor:
+        if kind == 'postgres':
+            for statement in POSTGRES_SCHEMA:
+                cursor.execute(statement)
+            return
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+            [f'{FTS_TABLE}_%'],
+        )
+        if cursor.fetchone()[0] == 3:
+            return
+        for statement in SQLITE_SCHEMA:
+            cursor.execute(statement)
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}(rowid, output, error) SELECT id, output, error FROM tasks_tasklog")
+        logger.info("Rebuilt task log search index")
+
+
+def build_query(text, kind):
+    """
+    Converte o texto digitado em consulta do backend: todos os termos
+    precisam aparecer e o último é tratado como prefixo.
+    """
+    terms = TERM_PATTERN.findall(text)
+    if not terms:
+        return None
+    if kind == 'fts5':
+        quoted = ['"' + term.replace('"', '""') + '"' for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+    terms[-1] += ':*'
+    return ' & '.join(terms)
+
+
+def matching_ids(query, kind, text=None):
+    """
+    Subconsulta com os ids dos logs cuja saída casa com a consulta e, com
+    `text`, também os das tarefas cujo título o contém (ou do status igual).
+
+    Tudo vai em uma só lista de ids (UNION) em vez de condições com OR: assim
+    o banco pode percorrer o índice de created_at testando só o id e ler
+    apenas as linhas da página, sem varrer a tabela de logs.
+    """
+    if kind == 'fts5':
+        parts = [f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"]
+    else:
+        parts = [f"SELECT id FROM tasks_tasklog WHERE {PG_VECTOR} @@ to_tsquery('simple', %s)"]
+    params = [query]
+    if text is not None:
+        others = TaskLog.objects.filter(task_id__in=Task.objects.filter(title__icontains=text).values('id'))
+        if text in dict(TaskLog.STATUS_CHOICES):
+            others = others | TaskLog.objects.filter(status=text)
+        sql, others_params = others.order_by().values('id').query.sql_with_params()
+        parts.append(sql)
+        params.extend(others_params)
+    return RawSQL(' UNION '.join(parts), params)
+
+
+def filter_logs(queryset, text):
+    """
+    Filtra logs cujo output/error contém o texto, ou cujo título da
+    tarefa/status corresponde. Sem índice, usa `icontains` como antes.
+    """
+    text = text.strip()
+    if not text:
+        return queryset
+    kind = backend()
+    query = build_query(text, kind) if kind else None
+    if query is None:
+        others = Q(task__title__icontains=text) | Q(status=text)
+        return queryset.filter(others | Q(output__icontains=text) | Q(error__icontains=text))
+    ids = matching_ids(query, kind, text)
+    if kind == 'fts5':
+        # O "+" impede o SQLite de buscar log a log pela lista de ids e depois
+        # ordenar (lento para termos comuns): ele segue o índice de created_at
+        # e para ao completar a página
+        return queryset.filter(RawSQL(f"+tasks_tasklog.id IN ({ids.sql})", ids.params, output_field=BooleanField()))
+    return queryset.filter(id__in=ids)
+
+
+def ranked_logs(text, limit=50, queryset=None):
+    """
+    Logs mais relevantes para o texto (BM25 no SQLite, ts_rank no PostgreSQL),
+    restritos aos filtros de `queryset`. Cada log vem com o atributo `rank`.
+    """
+    queryset = TaskLog.objects.select_related('task') if queryset is None else queryset
+    kind = backend()
+    query = build_query(text, kind) if kind else None
+    if query is None:
+        logs = list(filter_logs(queryset, text)[:limit])
+        for log in logs:
+            log.rank = None
+        return logs
+
+    id_column = 'rowid' if kind == 'fts5' else 'id'
+    restrict, restrict_params = '', []
+    if queryset.query.has_filters():
+        subquery, restrict_params = queryset.order_by().values('id').query.sql_with_params()
+        restrict = f" AND {id_column} IN ({subquery})"
+
+    if kind == 'fts5':
+        # bm25() é menor quanto mais relevante
+        sql = (
+            f"SELECT rowid, -bm25({FTS_TABLE}) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s{restrict} "
+            f"ORDER BY bm25({FTS_TABLE}) LIMIT %s"
+        )
+    else:
+        sql = (
+            f"SELECT id, ts_rank({PG_VECTOR}, q) FROM tasks_tasklog, to_tsquery('simple', %s) q "
+            f"WHERE {PG_VECTOR} @@ q{restrict} ORDER BY 2 DESC LIMIT %s"
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [query, *restrict_params, limit])
+        ranks = cursor.fetchall()
+
+    logs = queryset.in_bulk([log_id for log_id, _ in ranks])
+    result = []
+    for log_id, rank in ranks:
+        if log_id in logs:
+            log = logs[log_id]
+            log.rank = round(rank, 4)
+            result.append(log)
+    return result
+
+
+class TaskLogSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter do DRF usando o índice textual em vez de LIKE '%termo%'.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        return filter_logs(queryset, text)
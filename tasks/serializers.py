@@ -1,14 +1,36 @@
 from rest_framework import serializers
-from .models import Task, TaskLog
+from django.db import transaction
+from .bytecode import BytecodeCache, compile_source
+from .models import Task, TaskLog, Workflow, WorkflowRun, WorkflowStep, WorkflowStepRun
+from .tasks import queue_for, schedule_headers
+from .workflows import topological_order
 from django_celery_beat.models import PeriodicTask, CrontabSchedule
 import json
+from django.conf import settings
 
 class TaskLogSerializer(serializers.ModelSerializer):
     task_title = serializers.CharField(source='task.title', read_only=True)
 
     class Meta:
         model = TaskLog
-        fields = ['id', 'task', 'task_title', 'status', 'output', 'error', 'duration', 'created_at']
+        fields = ['id', 'task', 'task_title', 'batch', 'status', 'output', 'error', 'output_size', 'error_size', 'duration', 'created_at']
+
+class TaskLogPreviewSerializer(TaskLogSerializer):
+    """
+    Usado nas listagens: output/error vêm cortados em TASK_LOG_PREVIEW_CHARS
+    (anotações de with_preview). `truncated` indica que a saída completa
+    deve ser lida em /api/logs/{id}/raw/.
+    """
+    output = serializers.CharField(source='output_preview', read_only=True)
+    error = serializers.CharField(source='error_preview', read_only=True)
+    truncated = serializers.SerializerMethodField()
+
+    class Meta(TaskLogSerializer.Meta):
+        fields = TaskLogSerializer.Meta.fields + ['truncated']
+
+    def get_truncated(self, obj):
+        limit = settings.TASK_LOG_PREVIEW_CHARS
+        return obj.output_length > limit or obj.error_length > limit
 
 class TaskSerializer(serializers.ModelSerializer):
     last_run = serializers.SerializerMethodField()
@@ -17,10 +39,20 @@ class TaskSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Task
-        fields = ['id', 'title', 'description', 'task_type', 'priority', 'code', 'enabled', 'created_by', 'created_at', 'last_run', 'cron_expression', 'schedule_display']
+        fields = ['id', 'title', 'description', 'task_type', 'priority', 'concurrency_policy', 'code', 'enabled', 'timeout', 'cpu_seconds', 'max_memory_mb', 'log_retention_days', 'created_by', 'created_at', 'last_run', 'cron_expression', 'schedule_display']
         read_only_fields = ['created_by', 'created_at']
 
     def get_last_run(self, obj):
+        # Valores anotados por TaskViewSet.get_queryset
+        if hasattr(obj, 'last_run_status'):
+            if obj.last_run_status is None:
+                return None
+            return {
+                'status': obj.last_run_status,
+                'date': obj.last_run_date,
+                'duration': obj.last_run_duration
+            }
+
         last_log = obj.tasklog_set.first()
         if last_log:
             return {
@@ -36,6 +68,25 @@ class TaskSerializer(serializers.ModelSerializer):
             return f"{c.minute} {c.hour} {c.day_of_month} {c.month_of_year} {c.day_of_week}"
         return None
 
+    def validate(self, attrs):
+        # Scripts são compilados ao salvar: erro de sintaxe volta aqui, não numa execução
+        self._compiled = None
+        task_type = attrs.get('task_type', self.instance.task_type if self.instance else 'script')
+        code = attrs.get('code', self.instance.code if self.instance else '')
+        if task_type == 'script' and code:
+            try:
+                self._compiled = (code, *compile_source(code))
+            except SyntaxError as e:
+                raise serializers.ValidationError({"code": f"Erro de sintaxe na linha {e.lineno}: {e.msg}"})
+            except ValueError as e:
+                raise serializers.ValidationError({"code": f"Código inválido: {e}"})
+        return attrs
+
+    def _prime_bytecode(self):
+        # Deixa o bytecode no cache em disco: a primeira execução já não compila
+        if getattr(self, '_compiled', None):
+            BytecodeCache(settings.SCRIPT_BYTECODE_CACHE_DIR, size=0).put(*self._compiled)
+
     def create(self, validated_data):
         cron_expr = validated_data.pop('cron_expression', None)
         user = self.context['request'].user
@@ -44,6 +95,7 @@ class TaskSerializer(serializers.ModelSerializer):
         
         if cron_expr:
             self._update_schedule(task, cron_expr)
+        self._prime_bytecode()
         
         return task
 
@@ -53,6 +105,12 @@ class TaskSerializer(serializers.ModelSerializer):
         
         if cron_expr is not None:
             self._update_schedule(task, cron_expr)
+        elif task.schedule and (task.schedule.queue, task.schedule.headers) != (queue_for(task.priority), schedule_headers(task)):
+            # Prioridade ou limites alterados: o agendamento passa a usar a nova fila e os novos limites
+            task.schedule.queue = queue_for(task.priority)
+            task.schedule.headers = schedule_headers(task)
+            task.schedule.save()
+        self._prime_bytecode()
             
         return task
 
@@ -80,6 +138,8 @@ class TaskSerializer(serializers.ModelSerializer):
         if task.schedule:
             task.schedule.crontab = schedule
             task.schedule.enabled = task.enabled
+            task.schedule.queue = queue_for(task.priority)
+            task.schedule.headers = schedule_headers(task)
             task.schedule.save()
         else:
             pt = PeriodicTask.objects.create(
@@ -87,8 +147,131 @@ class TaskSerializer(serializers.ModelSerializer):
                 name=f"task_{task.id}_{task.title}",
                 task='tasks.tasks.execute_task',
                 args=json.dumps([task.id]),
+                queue=queue_for(task.priority),
+                headers=schedule_headers(task),
                 enabled=task.enabled
             )
             task.schedule = pt
             task.save()
 
+
+
+class RunBulkFilterSerializer(serializers.Serializer):
+    priority = serializers.ChoiceField(choices=Task.PRIORITY_CHOICES, required=False)
+    task_type = serializers.ChoiceField(choices=Task.TASK_TYPES, required=False)
+    enabled = serializers.BooleanField(required=False)
+
+
+class RunBulkSerializer(serializers.Serializer):
+    """
+    Entrada de POST /api/tasks/run_bulk/: lista de ids OU filtro.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    filter = RunBulkFilterSerializer(required=False)
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError("Informe 'ids' ou 'filter' (apenas um).")
+        if len(attrs.get('ids', [])) > settings.TASK_BULK_RUN_MAX:
+            raise serializers.ValidationError({"ids": f"Máximo de {settings.TASK_BULK_RUN_MAX} tarefas por lote."})
+        return attrs
+
+
+class StepNamesField(serializers.ListField):
+    """Dependências de um passo, pelos nomes dos outros passos do workflow."""
+    child = serializers.SlugField()
+
+    def to_representation(self, value):
+        return [step.name for step in value.all()]
+
+
+class WorkflowStepSerializer(serializers.ModelSerializer):
+    depends_on = StepNamesField(required=False, default=list)
+
+    class Meta:
+        model = WorkflowStep
+        fields = ['id', 'name', 'task', 'depends_on']
+
+
+class WorkflowSerializer(serializers.ModelSerializer):
+    """
+    Workflow com os passos aninhados. Na edição, `steps` substitui a lista
+    inteira: passos com o mesmo nome são mantidos (e o histórico deles).
+    """
+    steps = WorkflowStepSerializer(many=True)
+
+    class Meta:
+        model = Workflow
+        fields = ['id', 'title', 'description', 'steps', 'created_by', 'created_at', 'updated_at']
+        read_only_fields = ['created_by', 'created_at', 'updated_at']
+
+    def validate_steps(self, steps):
+        if not steps:
+            raise serializers.ValidationError("Informe ao menos um passo.")
+        names = [step['name'] for step in steps]
+        if len(set(names)) != len(names):
+            raise serializers.ValidationError("Nomes de passos repetidos.")
+        for step in steps:
+            unknown = set(step['depends_on']) - set(names)
+            if unknown:
+                raise serializers.ValidationError(f"Passo '{step['name']}' depende de passos inexistentes: {', '.join(sorted(unknown))}.")
+        try:
+            topological_order({step['name']: step['depends_on'] for step in steps})
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return steps
+
+    def create(self, validated_data):
+        steps = validated_data.pop('steps')
+        validated_data['created_by'] = self.context['request'].user
+        with transaction.atomic():
+            workflow = super().create(validated_data)
+            self._save_steps(workflow, steps)
+        return workflow
+
+    def update(self, instance, validated_data):
+        steps = validated_data.pop('steps', None)
+        with transaction.atomic():
+            workflow = super().update(instance, validated_data)
+            if steps is not None:
+                self._save_steps(workflow, steps)
+        return workflow
+
+    def _save_steps(self, workflow, steps):
+        existing = {step.name: step for step in workflow.steps.all()}
+        saved = {}
+        for data in steps:
+            step = existing.pop(data['name'], None) or WorkflowStep(workflow=workflow, name=data['name'])
+            step.task = data['task']
+            step.save()
+            saved[step.name] = step
+        for step in existing.values():
+            step.delete()
+        for data in steps:
+            saved[data['name']].depends_on.set([saved[name] for name in data['depends_on']])
+
+
+class WorkflowStepRunSerializer(serializers.ModelSerializer):
+    task = serializers.IntegerField(source='step.task_id', read_only=True, default=None)
+    log = serializers.SerializerMethodField()
+
+    class Meta:
+        model = WorkflowStepRun
+        fields = ['id', 'name', 'task', 'status', 'log', 'started_at', 'finished_at', 'duration']
+
+    def get_log(self, obj):
+        # Logs pré-carregados por WorkflowRunViewSet (prefetch de steps__logs)
+        logs = obj.logs.all()
+        return logs[0].id if logs else None
+
+
+class WorkflowRunSerializer(serializers.ModelSerializer):
+    workflow_title = serializers.CharField(source='workflow.title', read_only=True)
+    steps = WorkflowStepRunSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = WorkflowRun
+        fields = [
+            'id', 'workflow', 'workflow_title', 'status', 'created_by', 'created_at', 'finished_at',
+            'duration', 'critical_path', 'critical_path_duration', 'steps',
+        ]
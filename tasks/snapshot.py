@@ -0,0 +1,122 @@
+"""
+Snapshot da tarefa enviado junto com a mensagem do Celery.
+
+Quem dispara a execução (TaskViewSet.run, run_bulk) já tem a tarefa em
+mãos; o snapshot leva código, tipo, limites e política de concorrência
+na própria mensagem e o worker não precisa ler a Task do banco. Códigos
+grandes vão só como referência (id + versão) e ficam em um cache LRU por
+processo, indexado por (task_id, updated_at): uma edição muda a versão e
+invalida o cache.
+
+Uma tarefa removida depois do envio aparece na gravação do TaskLog (chave
+estrangeira) e execute_task segue como tarefa não encontrada. Com a
+gravação agrupada (tasks/logwriter.py) o INSERT fica para depois: a
+execução roda e o log é descartado no flush.
+
+A execução usa a versão da tarefa no momento do envio. Exceção: código
+grande que não está no cache do processo é lido do banco, e se a tarefa
+foi editada depois do envio só existe o código atual. Nesse caso a
+execução roda o código (e o tipo) atual com os limites e a política de
+concorrência do snapshot, e registra um aviso.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def limits(task_type, timeout=None, cpu_seconds=None, max_memory_mb=None):
+    """
+    Limites da execução: os da tarefa ou, vazios, os padrões do tipo.
+    Retorna timeout e cpu_seconds em segundos e max_memory em bytes (None =
+    sem limite).
+    """
+    if task_type == 'command':
+        defaults = (settings.TASK_COMMAND_TIMEOUT, settings.TASK_COMMAND_CPU_SECONDS, settings.TASK_COMMAND_MAX_MEMORY_MB)
+    else:
+        defaults = (settings.SCRIPT_RUNNER_TIMEOUT, settings.SCRIPT_RUNNER_CPU_SECONDS, settings.SCRIPT_RUNNER_MAX_MEMORY_MB)
+    timeout = timeout or defaults[0]
+    cpu_seconds = cpu_seconds or defaults[1]
+    max_memory_mb = max_memory_mb or defaults[2]
+    return {
+        'timeout': timeout or None,
+        'cpu_seconds': cpu_seconds or None,
+        'max_memory': max_memory_mb * 1024 * 1024 if max_memory_mb else None,
+    }
+
+
+def task_limits(task_obj):
+    return limits(task_obj.task_type, task_obj.timeout, task_obj.cpu_seconds, task_obj.max_memory_mb)
+
+
+def build(task_obj):
+    """Monta o snapshot enviado nos kwargs de execute_task."""
+    snapshot = {
+        'version': task_obj.updated_at.isoformat(),
+        'task_type': task_obj.task_type,
+        'concurrency': task_obj.concurrency_policy,
+        **task_limits(task_obj),
+    }
+    if len(task_obj.code) <= settings.TASK_SNAPSHOT_MAX_CODE_CHARS:
+        snapshot['code'] = task_obj.code
+    return snapshot
+
+
+def _remember(key, code):
+    with _cache_lock:
+        _cache[key] = code
+        _cache.move_to_end(key)
+        while len(_cache) > settings.TASK_SNAPSHOT_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def resolve(task_id, snapshot):
+    """
+    Retorna os dados da execução (task_type, code, concurrency, timeout,
+    cpu_seconds e max_memory), ou None se a tarefa não existe mais. Sem
+    snapshot (mensagens do beat ou anteriores a este modo), lê a tarefa do
+    banco como antes.
+    """
+    if snapshot:
+        # Mensagens anteriores à política de concorrência e aos limites por tarefa
+        snapshot = {'concurrency': 'allow', 'cpu_seconds': None, 'max_memory': None, **snapshot}
+        if 'code' in snapshot:
+            return snapshot
+
+        key = (task_id, snapshot['version'])
+        with _cache_lock:
+            code = _cache.get(key)
+            if code is not None:
+                _cache.move_to_end(key)
+        if code is not None:
+            return {**snapshot, 'code': code}
+
+    task = Task.objects.filter(id=task_id).values(
+        'task_type', 'code', 'concurrency_policy', 'timeout', 'cpu_seconds', 'max_memory_mb', 'updated_at'
+    ).first()
+    if task is None:
+        return None
+    version = task['updated_at'].isoformat()
+    _remember((task_id, version), task['code'])
+    if snapshot:
+        if version != snapshot['version']:
+            # O código da versão enviada não existe mais: roda o atual
+            logger.warning(
+                f"Task {task_id} changed after the run was sent (sent {snapshot['version']}, current {version}); "
+                "running the current code with the sent limits and concurrency policy"
+            )
+        return {**snapshot, 'task_type': task['task_type'], 'code': task['code']}
+    return {
+        'task_type': task['task_type'],
+        'code': task['code'],
+        'concurrency': task['concurrency_policy'],
+        **limits(task['task_type'], task['timeout'], task['cpu_seconds'], task['max_memory_mb']),
+    }
@@ -0,0 +1,301 @@
+"""
+Estatísticas do dashboard mantidas de forma incremental.
+
+Cada execução finalizada soma 1 ao agregado (tarefa, hora) em
+TaskStatsHourly; as durações vão para um histograma de faixas fixas, que
+pode ser somado entre linhas e permite estimar p50/p95. As consultas do
+dashboard leem apenas os agregados e ficam em cache até a próxima execução
+finalizada (ver tasks/caching.py) ou por STATS_CACHE_TTL segundos.
+
+O tempo de espera na fila (do envio da mensagem ao início da execução)
+segue o mesmo esquema em QueueStatsHourly, por fila de prioridade.
+
+O atraso dos agendamentos (do horário previsto ao envio pelo beat, ver
+tasks/scheduler.py) fica em ScheduleStatsHourly.
+
+Execuções de scripts também somam os acertos e as falhas do cache de
+bytecode (tasks/bytecode.py) e o tempo de compilação gasto e economizado.
+"""
+import bisect
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from . import caching
+from .models import QueueStatsHourly, ScheduleStatsHourly, Task, TaskStatsHourly
+
+# Limites superiores (segundos) das faixas do histograma; a última faixa é "acima de 1h"
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+WINDOWS = {
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+    'all': None,
+}
+
+
+def bucket_index(duration):
+    return bisect.bisect_left(DURATION_BUCKETS, duration)
+
+
+def record_run(task_id, status, duration, finished_at=None, queue=None, queue_wait=None, bytecode=None):
+    """
+    Soma uma execução finalizada ao agregado da hora correspondente e,
+    quando conhecido, o tempo que a mensagem esperou na fila `queue`.
+    `bytecode` é (origem, segundos) do cache de bytecode, em scripts.
+    """
+    hour = (finished_at or timezone.now()).replace(minute=0, second=0, microsecond=0)
+    with transaction.atomic():
+        row, _ = TaskStatsHourly.objects.select_for_update().get_or_create(task_id=task_id, hour=hour)
+        if status == 'success':
+            row.success_count += 1
+        elif status == 'timeout':
+            row.timeout_count += 1
+        else:
+            row.error_count += 1
+        row.duration_sum += duration or 0
+
+        histogram = row.duration_histogram or [0] * (len(DURATION_BUCKETS) + 1)
+        histogram[bucket_index(duration or 0)] += 1
+        row.duration_histogram = histogram
+        if bytecode is not None:
+            origin, seconds = bytecode
+            if origin == 'miss':
+                row.bytecode_misses += 1
+                row.compile_seconds += seconds
+            else:
+                row.bytecode_hits += 1
+                row.compile_seconds_saved += seconds
+        row.save()
+
+        if queue and queue_wait is not None:
+            row, _ = QueueStatsHourly.objects.select_for_update().get_or_create(queue=queue, hour=hour)
+            row.count += 1
+            row.wait_sum += queue_wait
+            histogram = row.wait_histogram or [0] * (len(DURATION_BUCKETS) + 1)
+            histogram[bucket_index(queue_wait)] += 1
+            row.wait_histogram = histogram
+            row.save()
+
+    caching.invalidate('stats')
+
+
+def record_schedule_lag(lags):
+    """
+    Soma os atrasos dos envios do beat: lista de (horário do envio, segundos).
+    """
+    per_hour = {}
+    for sent_at, lag in lags:
+        per_hour.setdefault(sent_at.replace(minute=0, second=0, microsecond=0), []).append(lag)
+    with transaction.atomic():
+        for hour, values in per_hour.items():
+            row, _ = ScheduleStatsHourly.objects.select_for_update().get_or_create(hour=hour)
+            row.count += len(values)
+            row.lag_sum += sum(values)
+            row.lag_max = max(row.lag_max, *values)
+            histogram = row.lag_histogram or [0] * (len(DURATION_BUCKETS) + 1)
+            for lag in values:
+                histogram[bucket_index(lag)] += 1
+            row.lag_histogram = histogram
+            row.save()
+
+    caching.invalidate('stats')
+
+
+def record_concurrency(task_id, outcome):
+    """
+    Conta uma execução barrada pela política de concorrência:
+    'skipped', 'merged' ou 'replaced' (ver tasks/concurrency.py).
+    """
+    hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+    field = f"{outcome}_count"
+    row, _ = TaskStatsHourly.objects.get_or_create(task_id=task_id, hour=hour)
+    TaskStatsHourly.objects.filter(pk=row.pk).update(**{field: F(field) + 1})
+
+    caching.invalidate('stats')
+
+
+def percentile(histogram, q):
+    """
+    Estima o percentil `q` (0-1) interpolando dentro da faixa do histograma.
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        if count and seen + count >= target:
+            lower = DURATION_BUCKETS[index - 1] if index > 0 else 0
+            upper = DURATION_BUCKETS[index] if index < len(DURATION_BUCKETS) else lower
+            return round(lower + (upper - lower) * (target - seen) / count, 3)
+        seen += count
+    return float(DURATION_BUCKETS[-1])
+
+
+def _merge_histograms(histograms):
+    merged = [0] * (len(DURATION_BUCKETS) + 1)
+    for histogram in histograms:
+        for index, count in enumerate(histogram or []):
+            merged[index] += count
+    return merged
+
+
+def _summarize(success, errors, timeouts, duration_sum, histogram):
+    total = success + errors + timeouts
+    return {
+        'total_executions': total,
+        'successful_executions': success,
+        'failed_executions': errors,
+        'timeout_executions': timeouts,
+        'success_rate': round((success / total) * 100, 1) if total else 0,
+        'avg_duration': round(duration_sum / total, 3) if total else None,
+        'p50_duration': percentile(histogram, 0.5),
+        'p95_duration': percentile(histogram, 0.95),
+    }
+
+
+def queue_latency(since=None):
+    """
+    Espera na fila por prioridade: execuções, média, p50 e p95 (segundos).
+    """
+    rows = QueueStatsHourly.objects.all()
+    if since is not None:
+        rows = rows.filter(hour__gte=since)
+
+    per_queue = {}
+    for queue, count, wait_sum, histogram in rows.values_list('queue', 'count', 'wait_sum', 'wait_histogram').iterator():
+        entry = per_queue.setdefault(queue, [0, 0.0, []])
+        entry[0] += count
+        entry[1] += wait_sum
+        entry[2].append(histogram)
+
+    latency = {}
+    for queue, (count, wait_sum, histograms) in sorted(per_queue.items()):
+        merged = _merge_histograms(histograms)
+        latency[queue] = {
+            'executions': count,
+            'avg_wait': round(wait_sum / count, 3) if count else None,
+            'p50_wait': percentile(merged, 0.5),
+            'p95_wait': percentile(merged, 0.95),
+        }
+    return latency
+
+
+def schedule_lag(since=None):
+    """
+    Atraso dos envios do beat: envios, média, p50, p95 e máximo (segundos).
+    """
+    rows = ScheduleStatsHourly.objects.all()
+    if since is not None:
+        rows = rows.filter(hour__gte=since)
+    count, lag_sum, lag_max, histograms = 0, 0.0, 0.0, []
+    for row_count, row_sum, row_max, histogram in rows.values_list('count', 'lag_sum', 'lag_max', 'lag_histogram').iterator():
+        count += row_count
+        lag_sum += row_sum
+        lag_max = max(lag_max, row_max)
+        histograms.append(histogram)
+    merged = _merge_histograms(histograms)
+    # A interpolação dentro da faixa pode passar do maior atraso registrado
+    p50, p95 = (percentile(merged, q) for q in (0.5, 0.95))
+    return {
+        'dispatched': count,
+        'avg_lag': round(lag_sum / count, 3) if count else None,
+        'p50_lag': min(p50, round(lag_max, 3)) if count else None,
+        'p95_lag': min(p95, round(lag_max, 3)) if count else None,
+        'max_lag': round(lag_max, 3) if count else None,
+    }
+
+
+# Colunas de TaskStatsHourly somadas no banco (o histograma, em JSON, é somado aqui)
+RUN_TOTALS = {
+    'success': 'success_count',
+    'errors': 'error_count',
+    'timeouts': 'timeout_count',
+    'duration_sum': 'duration_sum',
+}
+CONCURRENCY_TOTALS = {'skipped': 'skipped_count', 'merged': 'merged_count', 'replaced': 'replaced_count'}
+BYTECODE_TOTALS = {
+    'hits': 'bytecode_hits',
+    'misses': 'bytecode_misses',
+    'compile_seconds': 'compile_seconds',
+    'compile_seconds_saved': 'compile_seconds_saved',
+}
+
+
+def _sums(columns):
+    # default: janela sem linhas soma 0, não None
+    return {name: Sum(column, default=0) for name, column in columns.items()}
+
+
+def compute_stats(window='all', task_id=None, breakdown=False):
+    rows = TaskStatsHourly.objects.all()
+    since = None
+    if WINDOWS[window] is not None:
+        since = (timezone.now() - WINDOWS[window]).replace(minute=0, second=0, microsecond=0)
+        rows = rows.filter(hour__gte=since)
+    if task_id is not None:
+        rows = rows.filter(task_id=task_id)
+
+    totals = rows.aggregate(**_sums(RUN_TOTALS), **_sums(CONCURRENCY_TOTALS), **_sums(BYTECODE_TOTALS))
+    concurrency = {name: totals[name] for name in CONCURRENCY_TOTALS}
+    bytecode = {name: totals[name] for name in BYTECODE_TOTALS}
+
+    if breakdown:
+        per_task = {
+            entry.pop('task_id'): entry
+            for entry in rows.values('task_id').annotate(**_sums(RUN_TOTALS)).order_by('task_id')
+        }
+        histograms = {task: [] for task in per_task}
+        for task, histogram in rows.values_list('task_id', 'duration_histogram').iterator():
+            # setdefault: linha de outra tarefa gravada entre as duas consultas
+            histograms.setdefault(task, []).append(histogram)
+        histograms = {task: _merge_histograms(task_histograms) for task, task_histograms in histograms.items()}
+        histogram = _merge_histograms(histograms.values())
+    else:
+        histogram = _merge_histograms(rows.values_list('duration_histogram', flat=True).iterator())
+
+    lookups = bytecode['hits'] + bytecode['misses']
+    bytecode['hit_rate'] = round((bytecode['hits'] / lookups) * 100, 1) if lookups else 0
+    bytecode['compile_seconds'] = round(bytecode['compile_seconds'], 4)
+    bytecode['compile_seconds_saved'] = round(bytecode['compile_seconds_saved'], 4)
+
+    counts = Task.objects.aggregate(total=Count('id'), active=Count('id', filter=Q(enabled=True)))
+    data = {
+        'window': window,
+        'total_tasks': counts['total'],
+        'active_tasks': counts['active'],
+        **_summarize(*(totals[name] for name in RUN_TOTALS), histogram),
+        # Execuções barradas pela política de concorrência das tarefas
+        'concurrency': concurrency,
+        # Cache de bytecode das tarefas 'script'
+        'bytecode': bytecode,
+    }
+    if task_id is not None:
+        data['task'] = task_id
+    else:
+        data['queue_latency'] = queue_latency(since)
+        data['schedule_lag'] = schedule_lag(since)
+    if breakdown:
+        data['tasks'] = [
+            {'task': task, **_summarize(*(entry[name] for name in RUN_TOTALS), histograms[task])}
+            for task, entry in per_task.items()
+        ]
+    return data
+
+
+def get_stats(window='all', task_id=None, breakdown=False):
+    """
+    Estatísticas do dashboard, servidas do cache até a próxima execução
+    finalizada ou por STATS_CACHE_TTL segundos (as janelas deslizam).
+    """
+    return caching.get_or_set(
+        f"stats:{window}:{task_id}:{int(breakdown)}",
+        ('stats',),
+        lambda: compute_stats(window, task_id, breakdown),
+        settings.STATS_CACHE_TTL,
+    )
@@ -0,0 +1,300 @@
+"""
+Gravação incremental da saída das tarefas em TaskLogChunk.
+
+A saída é lida em trechos e acumulada em um buffer limitado por stream;
+o buffer é gravado no banco quando passa de `flush_bytes` ou quando
+`flush_interval` segundos se passam desde a última gravação. Trechos
+grandes são comprimidos (tasks/compression.py). Apenas o início e o fim
+da saída (até `inline_limit` caracteres no total, `inline_tail` deles do
+fim) ficam em memória para preencher TaskLog.output/TaskLog.error no fim
+da execução.
+
+Com o blob store ligado (TASK_LOG_BLOB_MIN_BYTES), cada stream também vai
+para um arquivo temporário enquanto é calculado o sha256; no fim, os
+streams grandes são gravados como blob (tasks/blobstore.py).
+"""
+import codecs
+from collections import deque
+import functools
+import hashlib
+import logging
+import os
+import resource
+import selectors
+import signal
+import subprocess
+import tempfile
+import time
+
+from django.conf import settings
+
+from app_api import metrics
+
+from . import blobstore, events
+from .compression import TRUNCATED_MARKER
+from .models import TaskLogChunk
+
+logger = logging.getLogger(__name__)
+
+
+class LogStreamWriter:
+    """
+    Recebe trechos de stdout/stderr e os persiste em TaskLogChunk.
+    Com `log=None` apenas mantém a cópia em memória (fallback sem banco).
+    Com `log_writer` (tasks/logwriter.py), os trechos entram na gravação
+    agrupada do worker em vez de um bulk_create a cada flush. Com
+    `full_limit`, também guarda o stdout completo até esse número de
+    caracteres (saída de passo de workflow, ver full_output).
+    """
+
+    def __init__(
+        self, log, flush_bytes=None, flush_interval=None, inline_limit=None, inline_tail=None, log_writer=None, full_limit=None
+    ):
+        self.log = log
+        self.log_writer = log_writer
+        self.flush_bytes = flush_bytes or settings.TASK_LOG_STREAM_FLUSH_BYTES
+        self.flush_interval = flush_interval or settings.TASK_LOG_STREAM_FLUSH_INTERVAL
+        self.inline_limit = inline_limit or settings.TASK_LOG_INLINE_MAX_CHARS
+        self.inline_tail = min(settings.TASK_LOG_INLINE_TAIL_CHARS if inline_tail is None else inline_tail, self.inline_limit)
+        self._pending = {'stdout': [], 'stderr': []}
+        self._pending_size = 0
+        self._offsets = {'stdout': 0, 'stderr': 0}
+        self._head = {'stdout': [], 'stderr': []}
+        self._head_size = {'stdout': 0, 'stderr': 0}
+        self._tail = {'stdout': deque(), 'stderr': deque()}
+        self._tail_size = {'stdout': 0, 'stderr': 0}
+        self._total = {'stdout': 0, 'stderr': 0}
+        self.full_limit = full_limit
+        self._full = []
+        self._last_flush = time.monotonic()
+        # Cópia completa de cada stream para o blob store (só em disco depois do limite)
+        self.blob_min_bytes = settings.TASK_LOG_BLOB_MIN_BYTES if log is not None else 0
+        self._spool = {}
+        self._hash = {}
+        self.blobs = {}
+
+    def write(self, stream, text):
+        if not text:
+            return
+        self._pending[stream].append(text)
+        self._pending_size += len(text)
+        self._keep_inline(stream, text)
+        if stream == 'stdout' and self.full_limit is not None and self._full is not None:
+            if self._total['stdout'] <= self.full_limit:
+                self._full.append(text)
+            else:
+                # Passou do limite: a cópia completa não serve mais
+                self._full = None
+        if self._pending_size >= self.flush_bytes:
+            self.flush()
+        else:
+            self.tick()
+
+    def tick(self):
+        """Grava o buffer se o intervalo de flush já passou."""
+        if self._pending_size and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        chunks = []
+        for stream, parts in self._pending.items():
+            if not parts:
+                continue
+            data = "".join(parts)
+            chunks.append(TaskLogChunk.build(self.log, stream, self._offsets[stream], data))
+            encoded = data.encode('utf-8')
+            self._offsets[stream] += len(encoded)
+            if self.blob_min_bytes:
+                self._spool_write(stream, encoded)
+            self._pending[stream] = []
+        self._pending_size = 0
+        self._last_flush = time.monotonic()
+        if chunks and self.log is not None and self.log_writer is not None:
+            self.log_writer.add_chunks(chunks)
+        elif chunks and self.log is not None:
+            try:
+                with metrics.log_write('chunks'):
+                    TaskLogChunk.objects.bulk_create(chunks)
+            except Exception as e:
+                # A execução continua; a cópia em memória ainda vai para o TaskLog
+                logger.error(f"Failed to write output chunks for TaskLog {self.log.id}: {e}")
+            for chunk in chunks:
+                events.publish_output(self.log, chunk.stream, chunk.offset, chunk.text)
+
+    def _keep_inline(self, stream, text):
+        self._total[stream] += len(text)
+        room = self.inline_limit - self.inline_tail - self._head_size[stream]
+        if room > 0:
+            self._head[stream].append(text[:room])
+            self._head_size[stream] += min(len(text), room)
+            text = text[room:]
+        if not text or not self.inline_tail:
+            return
+        # Fim da saída: descarta os trechos mais antigos que não fazem mais falta
+        tail = self._tail[stream]
+        tail.append(text)
+        self._tail_size[stream] += len(text)
+        while self._tail_size[stream] - len(tail[0]) >= self.inline_tail:
+            self._tail_size[stream] -= len(tail.popleft())
+
+    def inline(self, stream):
+        """Cópia (início e fim, se passou do limite) da saída, para TaskLog.output/error."""
+        head = "".join(self._head[stream])
+        tail = "".join(self._tail[stream])
+        omitted = self._total[stream] - self.inline_limit
+        if omitted <= 0:
+            return head + tail
+        if self.log_writer is not None and self.log is not None:
+            # O aviso aponta para o id do log, que só existe após o INSERT
+            self.log_writer.wait(self.log, timeout=5)
+        marker = TRUNCATED_MARKER.format(omitted=omitted, id=self.log.id if self.log is not None else '')
+        return head + marker + (tail[-self.inline_tail:] if self.inline_tail else '')
+
+    def full_output(self):
+        """stdout completo (com `full_limit`), ou None se passou do limite."""
+        if self.full_limit is None or self._full is None:
+            return None
+        return "".join(self._full)
+
+    def _spool_write(self, stream, data):
+        if stream not in self._spool:
+            self._spool[stream] = tempfile.SpooledTemporaryFile(max_size=self.blob_min_bytes)
+            self._hash[stream] = hashlib.sha256()
+        self._spool[stream].write(data)
+        self._hash[stream].update(data)
+
+    def _store_blobs(self):
+        for stream, spool in self._spool.items():
+            size = self._offsets[stream]
+            try:
+                if size >= self.blob_min_bytes:
+                    digest = self._hash[stream].hexdigest()
+                    spool.seek(0)
+                    blobstore.get_store().put(digest, spool)
+                    self.blobs[stream] = (digest, size)
+            except Exception as e:
+                # Os trechos continuam no banco
+                logger.error(f"Failed to store {stream} blob for TaskLog {self.log.id}: {e}")
+            finally:
+                spool.close()
+        self._spool = {}
+
+    def blob_fields(self):
+        """Campos do TaskLog para os streams gravados no blob store."""
+        fields = {}
+        for stream, prefix in (('stdout', 'output'), ('stderr', 'error')):
+            if stream in self.blobs:
+                fields[f'{prefix}_blob'], fields[f'{prefix}_size'] = self.blobs[stream]
+        return fields
+
+    def discard_chunks(self):
+        """
+        Remove os trechos dos streams que foram para o blob store. Chamado
+        depois de gravar o TaskLog com as referências, para que a leitura
+        não fique sem nenhuma das duas fontes.
+        """
+        if not self.blobs or self.log is None:
+            return
+        streams = list(self.blobs)
+        if self.log_writer is not None:
+            self.log_writer.drop_chunks(self.log, streams)
+            return
+        try:
+            TaskLogChunk.objects.filter(log=self.log, stream__in=streams).delete()
+        except Exception as e:
+            logger.error(f"Failed to delete output chunks for TaskLog {self.log.id}: {e}")
+
+    def close(self):
+        self.flush()
+        self._store_blobs()
+        return self.inline('stdout'), self.inline('stderr')
+
+
+def _limit_resources(cpu_seconds, max_memory):
+    """
+    Roda no processo filho antes do exec (preexec_fn): só chamadas simples,
+    sem locks, por causa das threads do worker. Os limites valem para o
+    shell e são herdados pelos processos que ele criar.
+    """
+    if cpu_seconds:
+        # SIGXCPU no limite; o SIGKILL do limite rígido fica 1s depois
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    if max_memory:
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+
+
+def run_command(command, writer, timeout=None, cancel=None, cpu_seconds=None, max_memory=None, env=None):
+    """
+    Executa um comando shell lendo stdout/stderr em trechos à medida que são
+    produzidos. Retorna o código de saída ou None se o tempo limite estourar
+    ou se `cancel` (threading.Event) for sinalizado. `cpu_seconds` e
+    `max_memory` (bytes) viram rlimits do processo; `env` é somado ao
+    ambiente do worker. O shell roda em uma sessão própria, para que o
+    tempo limite e o cancelamento matem também os processos que ele criar.
+    """
+    preexec_fn = None
+    if cpu_seconds or max_memory:
+        preexec_fn = functools.partial(_limit_resources, cpu_seconds, max_memory)
+    process = subprocess.Popen(
+        command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, preexec_fn=preexec_fn,
+        start_new_session=True, env={**os.environ, **env} if env else None,
+    )
+    try:
+        return _follow(process, writer, timeout, cancel)
+    except BaseException:
+        # Ex.: SoftTimeLimitExceeded do Celery no meio da leitura
+        _kill(process)
+        raise
+
+
+def _follow(process, writer, timeout, cancel):
+    decoders = {
+        process.stdout.fileno(): ('stdout', codecs.getincrementaldecoder('utf-8')(errors='replace')),
+        process.stderr.fileno(): ('stderr', codecs.getincrementaldecoder('utf-8')(errors='replace')),
+    }
+    deadline = time.monotonic() + timeout if timeout else None
+
+    with selectors.DefaultSelector() as selector:
+        for fd in decoders:
+            selector.register(fd, selectors.EVENT_READ)
+
+        while selector.get_map():
+            if cancel is not None and cancel.is_set():
+                return _kill(process)
+            wait = writer.flush_interval
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return _kill(process)
+                wait = min(wait, remaining)
+
+            for key, _ in selector.select(wait):
+                stream, decoder = decoders[key.fd]
+                data = os.read(key.fd, 65536)
+                if not data:
+                    selector.unregister(key.fd)
+                    writer.write(stream, decoder.decode(b'', final=True))
+                    continue
+                writer.write(stream, decoder.decode(data))
+            writer.tick()
+
+    if cancel is not None and cancel.is_set():
+        return _kill(process)
+    try:
+        returncode = process.wait(timeout=deadline - time.monotonic() if deadline else None)
+    except subprocess.TimeoutExpired:
+        return _kill(process)
+    process.stdout.close()
+    process.stderr.close()
+    return returncode
+
+
+def _kill(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+    process.stdout.close()
+    process.stderr.close()
+    return None
@@ -1,107 +1,424 @@
-from celery import shared_task
-import subprocess
+from celery import group, shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.signals import worker_process_init, worker_process_shutdown
+from contextlib import contextmanager
+import json
+import os
+import signal
+import tempfile
 import time
-import sys
-import io
 import logging
 from django.utils import timezone
 from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError
+from app_api import metrics
+from app_api.celery import DEFAULT_QUEUE, PRIORITY_QUEUES
+from . import archive, async_commands, caching, concurrency, events, retention, stats, workflows
+from .logwriter import get_log_writer, close_log_writer
 from .models import Task, TaskLog
+from .runner import get_pool, close_pool
+from .snapshot import build as build_snapshot, resolve as resolve_snapshot, task_limits
+from .streaming import LogStreamWriter, run_command
 
 # Configuração de logger de fallback
 logger = logging.getLogger(__name__)
 
+@worker_process_init.connect
+def warm_script_runner(**kwargs):
+    """
+    Sobe os interpretadores do pool junto com cada processo do worker,
+    para que a primeira tarefa 'script' não pague o cold start.
+    """
+    try:
+        get_pool().warm()
+    except Exception as e:
+        logger.error(f"Failed to warm script runner pool: {e}")
+
+@worker_process_shutdown.connect
+def stop_script_runner(**kwargs):
+    close_pool()
+    async_commands.close_executor()
+    # Grava os logs que ainda estão na fila do modo agrupado
+    close_log_writer()
+
 @shared_task(bind=True)
-def cleanup_old_logs(self, days=30):
+def cleanup_old_logs(self, days=None, batch_size=None, max_seconds=None, start_id=None):
     """
-    Remove logs de execução mais antigos que 'days'.
+    Remove logs de execução expirados, em lotes (ver tasks/retention.py).
     
     Args:
-        days (int): Número de dias de retenção (padrão: 30)
+        days (int): Prazo único para todos os logs; sem ele valem as políticas
+            por status (TASK_LOG_RETENTION_DAYS) e por tarefa (Task.log_retention_days)
+        batch_size (int): Ids por lote (padrão: TASK_LOG_RETENTION_BATCH_SIZE)
+        max_seconds (int): Tempo máximo desta execução; o restante é reagendado
+        start_id (int): Id inicial, usado ao continuar uma execução anterior
     
     Returns:
-        dict: Contagem de logs deletados
+        dict: Logs removidos e métricas de progresso/vazão
     """
-    cutoff_date = timezone.now() - timedelta(days=days)
-    deleted_count, _ = TaskLog.objects.filter(created_at__lt=cutoff_date).delete()
-    
-    return {"deleted": deleted_count, "cutoff_date": str(cutoff_date)}
+    def progress(meta):
+        logger.info(f"cleanup_old_logs: {meta['deleted']} logs deleted, at id {meta['current_id']}/{meta['max_id']}")
+        try:
+            self.update_state(state='PROGRESS', meta=meta)
+        except Exception:
+            pass  # Sem result backend configurado
+
+    result = retention.delete_expired(days, batch_size=batch_size, max_seconds=max_seconds, start_id=start_id, progress=progress)
+    if result['deleted']:
+        caching.invalidate('tasks', 'logs')
+
+    if result['next_id'] and not self.request.is_eager:
+        # Tempo esgotado: continua em outra execução a partir do último lote
+        self.apply_async(kwargs={'days': days, 'batch_size': batch_size, 'max_seconds': max_seconds, 'start_id': result['next_id']})
+
+    return result
+
+@shared_task(bind=True)
+def archive_old_logs(self, days=None, retention_months=None):
+    """
+    Move logs antigos para as tabelas mensais de arquivo e descarta
+    (DROP TABLE) os meses que passaram da retenção.
+
+    Args:
+        days (int): Idade mínima para arquivar (padrão: TASK_LOG_ARCHIVE_AFTER_DAYS)
+        retention_months (int): Meses mantidos no arquivo (padrão: TASK_LOG_ARCHIVE_RETENTION_MONTHS)
+
+    Returns:
+        dict: Logs arquivados e partições removidas
+    """
+    days = days or settings.TASK_LOG_ARCHIVE_AFTER_DAYS
+    retention_months = retention_months or settings.TASK_LOG_ARCHIVE_RETENTION_MONTHS
+
+    archived = archive.archive_logs(timezone.now() - timedelta(days=days))
+    if archived:
+        caching.invalidate('tasks', 'logs')
+
+    cutoff = archive.month_start(timezone.now())
+    for _ in range(retention_months):
+        cutoff = (cutoff - timedelta(days=1)).replace(day=1)
+    dropped = archive.drop_partitions(cutoff)
+
+    return {"archived": archived, "dropped_partitions": dropped}
+
+def queue_for(priority):
+    """Fila do Celery correspondente a Task.priority."""
+    return priority if priority in PRIORITY_QUEUES else DEFAULT_QUEUE
+
+def run_kwargs(task_obj, **kwargs):
+    """Kwargs de execute_task, com o snapshot da tarefa se o modo estiver ativo."""
+    if settings.TASK_SNAPSHOT_ENABLED:
+        kwargs['snapshot'] = build_snapshot(task_obj)
+    return kwargs
+
+def time_limits(task_obj):
+    """
+    soft_time_limit/time_limit do Celery para a tarefa: o tempo limite dela
+    mais TASK_TIME_LIMIT_GRACE (soft) ou o dobro da folga (hard). São a rede
+    de proteção caso o worker trave fora do processo filho, que já é
+    encerrado no tempo limite.
+    """
+    timeout = task_limits(task_obj)['timeout']
+    if not timeout:
+        return {}
+    grace = settings.TASK_TIME_LIMIT_GRACE
+    return {'soft_time_limit': timeout + grace, 'time_limit': timeout + 2 * grace}
+
+def schedule_headers(task_obj):
+    """
+    PeriodicTask.headers do agendamento da tarefa: o beat repassa os headers
+    à mensagem, e `timelimit` leva os limites de time_limits.
+    """
+    limits = time_limits(task_obj)
+    if not limits:
+        return '{}'
+    return json.dumps({'timelimit': [limits['time_limit'], limits['soft_time_limit']]})
+
+def admit_runs(tasks):
+    """
+    Separa as tarefas que podem ser enviadas das que já têm uma execução
+    pendente na fila (política de concorrência, ver tasks/concurrency.py).
+    Retorna (enviar, descartadas); as descartadas contam como 'merged'.
+    """
+    admitted, merged = [], []
+    for task_obj in tasks:
+        (admitted if concurrency.admit(task_obj) else merged).append(task_obj)
+    for task_obj in merged:
+        stats.record_concurrency(task_obj.id, 'merged')
+    return admitted, merged
+
+def withdraw_runs(tasks):
+    """Desfaz admit_runs das tarefas cuja mensagem não chegou a ser enviada."""
+    concurrency.withdraw(tasks)
+
+def enqueue_task(task_obj, **options):
+    """
+    Envia execute_task para a fila da prioridade da tarefa. Retorna None se
+    a tarefa já tinha uma execução pendente (ver admit_runs).
+    """
+    if not admit_runs([task_obj])[0]:
+        return None
+    try:
+        return execute_task.apply_async(
+            args=[task_obj.id], kwargs=run_kwargs(task_obj), queue=queue_for(task_obj.priority),
+            **{**time_limits(task_obj), **options}
+        )
+    except Exception:
+        withdraw_runs([task_obj])
+        raise
+
+def enqueue_batch(tasks, batch):
+    """
+    Envia uma execução de cada tarefa, ligadas ao lote `batch`. O group
+    publica todas as mensagens com um único producer (uma conexão com o
+    broker), cada uma na fila da prioridade da sua tarefa. As tarefas já
+    devem ter passado por admit_runs; se o envio falhar, as marcas de
+    pendente delas são desfeitas.
+    """
+    try:
+        signatures = [
+            execute_task.si(task_obj.id, **run_kwargs(task_obj, batch_id=batch.id)).set(
+                queue=queue_for(task_obj.priority), **time_limits(task_obj)
+            )
+            for task_obj in tasks
+        ]
+        return group(signatures).apply_async()
+    except Exception:
+        withdraw_runs(tasks)
+        raise
+
+def enqueue_steps(step_runs):
+    """
+    Envia os passos de workflow prontos (tasks/workflows.py), cada um com
+    as saídas das suas dependências em `inputs`. Não passam por admit_runs:
+    toda execução do workflow precisa de todos os passos.
+    """
+    if not step_runs:
+        return None
+    signatures = [
+        execute_task.si(
+            step_run.step.task_id,
+            **run_kwargs(step_run.step.task, workflow_step=step_run.id, inputs=step_run.inputs),
+        ).set(queue=queue_for(step_run.step.task.priority), **time_limits(step_run.step.task))
+        for step_run in step_runs
+    ]
+    return group(signatures).apply_async()
+
+def finish_step(step_run_id, status, output='', duration=None):
+    """Registra o fim de um passo de workflow e envia os que ficaram prontos."""
+    try:
+        enqueue_steps(workflows.step_finished(step_run_id, status, output, duration))
+    except Exception as e:
+        logger.error(f"Failed to advance workflow step {step_run_id}: {e}")
+
+def task_not_found(task_id, workflow_step=None):
+    """Fim de uma execução cuja tarefa não existe mais (passos de workflow terminam com erro)."""
+    logger.error(f"CRITICAL: Task {task_id} not found during execution.")
+    if workflow_step:
+        finish_step(workflow_step, 'error')
+    return f"Task {task_id} not found"
+
+@contextmanager
+def inputs_file(inputs):
+    """
+    Arquivo JSON com as entradas de um passo de workflow, para comandos
+    (variável WORKFLOW_INPUTS). Removido ao fim da execução.
+    """
+    if inputs is None:
+        yield None
+        return
+    fd, path = tempfile.mkstemp(prefix='workflow-inputs-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(inputs, f)
+        yield path
+    finally:
+        os.unlink(path)
 
 @shared_task(bind=True)
-def execute_task(self, task_id):
+def execute_task(self, task_id, batch_id=None, snapshot=None, workflow_step=None, inputs=None):
     """
     Executa o código da tarefa (Python ou Shell) e salva o log.
     Inclui mecanismo de fallback para logging crítico.
+
+    Com `snapshot` (ver tasks/snapshot.py) a tarefa não é lida do banco;
+    com TASK_LOG_WRITER_FLUSH_MS as gravações do log são agrupadas
+    (ver tasks/logwriter.py). A política de concorrência da tarefa pode
+    ignorar, adiar ou interromper execuções (ver tasks/concurrency.py).
+    Execuções que passam do tempo limite terminam com status 'timeout'.
+    Com `workflow_step`, a execução é um passo de workflow que recebe as
+    saídas das dependências em `inputs` (ver tasks/workflows.py).
     """
-    try:
-        task_obj = Task.objects.get(id=task_id)
-    except Task.DoesNotExist:
-        logger.error(f"CRITICAL: Task {task_id} not found during execution.")
-        return f"Task {task_id} not found"
+    # Espera na fila: horário carimbado no envio (app_api.celery.stamp_enqueued_at)
+    enqueued_at = getattr(self.request, 'enqueued_at', None)
+    queue_wait = max(time.time() - enqueued_at, 0) if enqueued_at else None
+    queue = (self.request.delivery_info or {}).get('routing_key')
+
+    resolved = resolve_snapshot(task_id, snapshot)
+    if resolved is None:
+        return task_not_found(task_id, workflow_step)
+    task_type, code, timeout = resolved['task_type'], resolved['code'], resolved['timeout']
+
+    guard = concurrency.RunGuard(task_id, resolved['concurrency'], self.request.id)
+    decision = guard.enter()
+    if decision == concurrency.WAIT:
+        # queue_one: tenta de novo quando a execução atual tiver terminado
+        raise self.retry(countdown=settings.TASK_CONCURRENCY_RETRY_SECONDS, max_retries=None)
+    if decision in (concurrency.SKIP, concurrency.MERGE):
+        outcome = 'skipped' if decision == concurrency.SKIP else 'merged'
+        try:
+            stats.record_concurrency(task_id, outcome)
+        except Exception as e:
+            logger.error(f"Failed to update stats for Task {task_id}: {e}")
+        logger.info(f"Task {task_id} {outcome}: another run is in progress")
+        if workflow_step:
+            finish_step(workflow_step, 'skipped')
+        return f"Task {task_id} {outcome}"
+    if decision == concurrency.REPLACE:
+        try:
+            stats.record_concurrency(task_id, 'replaced')
+        except Exception as e:
+            logger.error(f"Failed to update stats for Task {task_id}: {e}")
 
     # Cria log inicial
+    log_writer = get_log_writer()
     try:
-        log = TaskLog.objects.create(task=task_obj, status='running')
+        if log_writer is not None:
+            log = log_writer.start(task_id=task_id, batch_id=batch_id, workflow_step_id=workflow_step, status='running')
+        else:
+            with metrics.log_write('create'):
+                log = TaskLog.objects.create(task_id=task_id, batch_id=batch_id, workflow_step_id=workflow_step, status='running')
+            events.publish_state(log)
+            caching.invalidate('tasks', 'logs')
     except Exception as e:
+        # Com snapshot a tarefa não foi lida do banco: se foi removida depois
+        # do envio, o INSERT do log falha pela chave estrangeira
+        if isinstance(e, IntegrityError) and not Task.objects.filter(pk=task_id).exists():
+            guard.exit()
+            return task_not_found(task_id, workflow_step)
         logger.error(f"CRITICAL: Failed to create TaskLog for Task {task_id}: {e}")
         # Fallback: Tenta continuar mesmo sem log no banco (não recomendado, mas evita crash total)
         log = None
 
+    if workflow_step:
+        try:
+            workflows.step_started(workflow_step)
+        except Exception as e:
+            logger.error(f"Failed to mark workflow step {workflow_step} as running: {e}")
     start_time = time.time()
     
-    stdout = ""
-    stderr = ""
+    # Saída gravada em trechos enquanto a tarefa roda
+    # Passo de workflow: o stdout completo vai como entrada dos passos seguintes
+    full_limit = settings.WORKFLOW_INPUT_MAX_CHARS if workflow_step else None
+    writer = LogStreamWriter(log, log_writer=log_writer, full_limit=full_limit)
     status = "success"
+    # Origem do bytecode e tempo de compilação (só scripts), para as estatísticas
+    bytecode = None
 
     try:
-        if task_obj.task_type == 'script':
-            # Executa código Python em ambiente isolado (básico)
+        if task_type == 'script':
+            # Executa código Python em um interpretador do pool (processo separado)
             # AVISO: Em produção real, usar sandbox como Docker ou RestrictedPython
-            old_stdout = sys.stdout
-            redirected_output = sys.stdout = io.StringIO()
-            
-            try:
-                exec(task_obj.code, {'__builtins__': __builtins__}, {})
-                stdout = redirected_output.getvalue()
-            except Exception as e:
-                stderr = str(e)
-                status = "error"
-            finally:
-                sys.stdout = old_stdout
-
-        elif task_obj.task_type == 'command':
-            # Executa comando Shell
-            process = subprocess.run(
-                task_obj.code, 
-                shell=True, 
-                capture_output=True, 
-                text=True,
-                timeout=60 # Limite de 1 min por padrão
+            result = get_pool().run(
+                code,
+                timeout=timeout,
+                cpu_seconds=resolved['cpu_seconds'],
+                max_memory=resolved['max_memory'],
+                on_output=writer.write,
+                cancel=guard.cancelled,
+                inputs=inputs,
             )
-            stdout = process.stdout
-            stderr = process.stderr
-            if process.returncode != 0:
+            status = result.status
+            if result.cache:
+                bytecode = (result.cache, result.compile_time)
+            if result.from_pool and not guard.cancelled.is_set():
+                writer.write('stderr', result.stderr)
+
+        elif task_type == 'command':
+            # Executa comando Shell (no event loop compartilhado com COMMAND_EXECUTOR='async')
+            runner = async_commands.run_command if settings.COMMAND_EXECUTOR == 'async' else run_command
+            with inputs_file(inputs) as path:
+                returncode = runner(
+                    code,
+                    writer,
+                    timeout=timeout,
+                    cancel=guard.cancelled,
+                    cpu_seconds=resolved['cpu_seconds'],
+                    max_memory=resolved['max_memory'],
+                    env={'WORKFLOW_INPUTS': path} if path else None,
+                )
+            if returncode is None:
+                if not guard.cancelled.is_set():
+                    writer.write('stderr', f"Tempo limite de {timeout}s excedido")
+                status = "timeout"
+            elif returncode in (-signal.SIGXCPU, 128 + signal.SIGXCPU):
+                # Morto pelo RLIMIT_CPU (direto ou em um processo do shell)
+                writer.write('stderr', f"Limite de CPU excedido ({resolved['cpu_seconds']}s)")
+                status = "error"
+            elif returncode != 0:
                 status = "error"
 
+    except SoftTimeLimitExceeded:
+        writer.write('stderr', "Tempo limite do worker excedido (soft_time_limit)")
+        status = "timeout"
+        logger.error(f"Task {task_id} hit the Celery soft time limit")
+
     except Exception as e:
-        stderr = f"System Error: {str(e)}"
+        writer.write('stderr', f"System Error: {str(e)}")
         status = "error"
         logger.error(f"Task {task_id} Execution Failed: {e}")
+    finally:
+        guard.exit()
+
+    if guard.cancelled.is_set():
+        writer.write('stderr', "Execução interrompida: substituída por uma execução mais recente")
+        status = "error"
+
+    step_output = ''
+    if workflow_step and status == 'success':
+        step_output = writer.full_output()
+        if step_output is None:
+            writer.write('stderr', f"Saída grande demais para entrada de workflow (limite de {full_limit} caracteres)")
+            status = "error"
+            logger.error(f"Task {task_id} output too large for workflow input (step {workflow_step})")
+
+    stdout, stderr = writer.close()
 
     # Atualiza log final
     duration = time.time() - start_time
     
     if log:
         try:
-            log.status = status
-            log.output = stdout
-            log.error = stderr
-            log.duration = duration
-            log.save()
+            # Referências dos streams que foram para o blob store
+            blob_fields = writer.blob_fields()
+            if log_writer is not None:
+                log_writer.finish(log, status=status, output=stdout, error=stderr, duration=duration, **blob_fields)
+            else:
+                log.status = status
+                log.output = stdout
+                log.error = stderr
+                log.duration = duration
+                for name, value in blob_fields.items():
+                    setattr(log, name, value)
+                with metrics.log_write('finish'):
+                    log.save()
+                events.publish_state(log)
+                caching.invalidate('tasks', 'logs')
+            writer.discard_chunks()
         except Exception as e:
             logger.critical(f"FAILED TO SAVE TASK LOG for Task {task_id}. Status: {status}. Error: {e}")
     else:
         # Fallback se log não foi criado: Logar no sistema
         logger.info(f"Task {task_id} finished (NO DB LOG). Status: {status}. Duration: {duration}s")
 
+    try:
+        stats.record_run(task_id, status, duration, queue=queue, queue_wait=queue_wait, bytecode=bytecode)
+    except Exception as e:
+        logger.error(f"Failed to update stats for Task {task_id}: {e}")
+    # A fila de execute_task é a prioridade da tarefa (ver queue_for)
+    metrics.observe_run(task_type, queue, status, duration)
+
+    if workflow_step:
+        finish_step(workflow_step, status, step_output or '', duration)
+
     return f"Task {task_id} finished with {status}"
@@ -0,0 +1,148 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, override_settings
+from django_celery_beat.models import CrontabSchedule, PeriodicTask
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIClient
+
+from tasks import events
+from tasks.models import Task, TaskLog
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class TaskListQueriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tests')
+        crontab = CrontabSchedule.objects.create(minute='*/5')
+        for i in range(30):
+            task = Task.objects.create(title=f'task {i}', task_type='command', code='echo ok', created_by=cls.user)
+            if i % 2:
+                task.schedule = PeriodicTask.objects.create(
+                    name=f'task_{task.id}', task='tasks.tasks.execute_task', crontab=crontab
+                )
+                task.save(update_fields=['schedule'])
+            older = TaskLog.objects.create(task=task, status='error', duration=3.0)
+            TaskLog.objects.filter(pk=older.pk).update(created_at=older.created_at - timedelta(hours=1))
+            TaskLog.objects.create(task=task, status='success', duration=1.5)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def list_tasks(self, page_size):
+        with mock.patch.object(PageNumberPagination, 'page_size', page_size):
+            response = self.client.get('/api/tasks/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), page_size)
+        return response.data['results']
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        # COUNT da paginação e a página, com última execução e agendamento na mesma consulta
+        for page_size in (5, 25):
+            with self.subTest(page_size=page_size), self.assertNumQueries(2):
+                self.list_tasks(page_size)
+
+    def test_list_includes_last_run_and_schedule(self):
+        results = self.list_tasks(5)
+        for task in results:
+            self.assertEqual(task['last_run']['status'], 'success')
+            self.assertEqual(task['last_run']['duration'], 1.5)
+        self.assertEqual({task['schedule_display'] for task in results}, {None, '*/5 * * * *'})
+
+
+class PendingWithdrawTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tests')
+        cls.task = Task.objects.create(
+            title='skip', task_type='command', code='echo ok', concurrency_policy='skip', created_by=cls.user
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.redis = mock.Mock()
+        self.redis.set.return_value = True
+        patcher = mock.patch('tasks.concurrency._get_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_run_withdraws_pending_when_publish_fails(self):
+        with mock.patch('tasks.tasks.execute_task.apply_async', side_effect=ConnectionError('broker')):
+            with self.assertRaises(ConnectionError):
+                self.client.post(f'/api/tasks/{self.task.id}/run/')
+        self.redis.delete.assert_called_once_with(f'easypython:task:{self.task.id}:pending')
+
+    def test_run_bulk_withdraws_pending_when_publish_fails(self):
+        with mock.patch('tasks.tasks.group') as group:
+            group.return_value.apply_async.side_effect = ConnectionError('broker')
+            with self.assertRaises(ConnectionError):
+                self.client.post('/api/tasks/run_bulk/', {'ids': [self.task.id]}, format='json')
+        self.redis.delete.assert_called_once_with(f'easypython:task:{self.task.id}:pending')
+
+
+class EventsTicketTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tests')
+
+    def test_ticket_requires_authentication(self):
+        self.assertEqual(APIClient().post('/api/events/ticket/').status_code, 401)
+
+    def test_ticket_opens_stream_until_it_expires(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/events/ticket/')
+        self.assertEqual(response.status_code, 200)
+        query = {'ticket': [response.data['ticket']]}
+        self.assertEqual(events._authenticate(query), response.data['expires_at'])
+        with mock.patch('tasks.events.time.time', return_value=response.data['expires_at']):
+            self.assertIsNone(events._authenticate(query))
+
+    def test_ticket_does_not_outlive_the_token(self):
+        ticket, expires = events.issue_ticket(self.user, token_expires=1)
+        self.assertEqual(expires, 1)
+        self.assertIsNone(events._authenticate({'ticket': [ticket]}))
+
+    def test_stream_rejects_tampered_ticket(self):
+        ticket, _ = events.issue_ticket(self.user)
+        self.assertIsNone(events._authenticate({'ticket': [ticket + 'x']}))
+        self.assertIsNone(events._authenticate({'token': [ticket]}))
+
+
+class MetricsAccessTests(TestCase):
+    def test_metrics_only_for_allowed_addresses(self):
+        client = APIClient()
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8']):
+            self.assertEqual(client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+            self.assertEqual(client.get('/metrics', REMOTE_ADDR='192.168.0.10').status_code, 404)
+        with override_settings(METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 404)
+
+
+# A listagem de logs consulta o banco em outra thread (app_api/async_utils.py)
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class TaskLogCursorTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tests')
+        task = Task.objects.create(title='logs', task_type='command', code='echo ok', created_by=self.user)
+        for duration in (2.0, None, 1.0, 3.0, None):
+            TaskLog.objects.create(task=task, status='running' if duration is None else 'success', duration=duration)
+
+    def pages(self, ordering):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url, durations = f'/api/logs/?ordering={ordering}&limit=2', []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            durations += [log['duration'] for log in response.data['results']]
+            url = response.data['next']
+        return durations
+
+    def test_duration_ordering_keeps_running_logs(self):
+        self.assertEqual(self.pages('-duration'), [3.0, 2.0, 1.0, None, None])
+        self.assertEqual(self.pages('duration'), [None, None, 1.0, 2.0, 3.0])
@@ -1,17 +1,69 @@
-from rest_framework import viewsets, permissions, filters
-from rest_framework.decorators import action, api_view, permission_classes
+import logging
+import re
+
+from adrf import viewsets as async_viewsets
+from adrf.decorators import api_view as async_api_view
+from rest_framework import viewsets, permissions, filters, status
+from rest_framework.decorators import action, permission_classes
 from rest_framework.response import Response
-from django.db.models import Count, Q
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from app_api.async_utils import in_thread
+from django.db.models import Count, Q, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Length, Substr
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Task, TaskLog
-from .serializers import TaskSerializer, TaskLogSerializer
-from .tasks import execute_task
+from .models import Task, TaskBatch, TaskLog, Workflow, WorkflowRun, WorkflowStepRun
+from .serializers import (
+    TaskSerializer, TaskLogSerializer, TaskLogPreviewSerializer, RunBulkSerializer, WorkflowSerializer, WorkflowRunSerializer,
+)
+from .pagination import TaskLogCursorPagination
+from .tasks import admit_runs, withdraw_runs, enqueue_task, enqueue_batch, enqueue_steps
+from . import blobstore, caching, events, search, stats, workflows
+
+logger = logging.getLogger(__name__)
+
+# Tamanho (bytes) das leituras incrementais de saída
+OUTPUT_DEFAULT_LIMIT = 65536
+OUTPUT_MAX_LIMIT = 1048576
+
+# Um único intervalo: bytes=inicio-fim, bytes=inicio- ou bytes=-sufixo
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+MISSING_BLOB_DETAIL = 'Saída não encontrada no armazenamento de blobs.'
+
+
+def with_preview(queryset):
+    """
+    Listagens não trazem output/error inteiros do banco: só o começo
+    (TASK_LOG_PREVIEW_CHARS) e o tamanho, para TaskLogPreviewSerializer.
+    """
+    limit = settings.TASK_LOG_PREVIEW_CHARS
+    return queryset.defer('output', 'error').annotate(
+        output_preview=Substr('output', 1, limit),
+        error_preview=Substr('error', 1, limit),
+        output_length=Length('output'),
+        error_length=Length('error'),
+    )
 
 class TaskViewSet(viewsets.ModelViewSet):
     queryset = Task.objects.all().order_by('-created_at')
     serializer_class = TaskSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        # Última execução e agendamento carregados na mesma consulta da listagem
+        # (evita 3 consultas extras por tarefa no TaskSerializer)
+        last_log = TaskLog.objects.filter(task=OuterRef('pk')).order_by('-created_at')
+        return super().get_queryset().select_related('schedule__crontab').annotate(
+            last_run_status=Subquery(last_log.values('status')[:1]),
+            last_run_date=Subquery(last_log.values('created_at')[:1]),
+            last_run_duration=Subquery(last_log.values('duration')[:1]),
+        )
+
+    @caching.cached_response('tasks')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
@@ -21,19 +73,111 @@ class TaskViewSet(viewsets.ModelViewSet):
         Endpoint para disparar a tarefa manualmente via Celery.
         """
         task = self.get_object()
-        # Dispara tarefa assíncrona
-        execute_task.delay(task.id)
+        # Dispara tarefa assíncrona na fila da prioridade da tarefa
+        if enqueue_task(task) is None:
+            return Response({'status': 'merged', 'message': 'A tarefa já tem uma execução pendente.'})
         return Response({'status': 'queued', 'message': 'Tarefa enviada para execução.'})
 
+    @action(detail=False, methods=['post'])
+    def run_bulk(self, request):
+        """
+        Dispara várias tarefas de uma vez, por lista de ids ou filtro
+        (priority, task_type, enabled). Retorna o id do lote para
+        acompanhar o progresso em /api/tasks/batches/{id}/.
+        """
+        serializer = RunBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data.get('ids')
+
+        # Campos usados no roteamento e no snapshot enviado na mensagem
+        tasks = Task.objects.only(
+            'id', 'priority', 'task_type', 'code', 'concurrency_policy', 'timeout', 'cpu_seconds', 'max_memory_mb', 'updated_at'
+        )
+        if ids is not None:
+            tasks = list(tasks.filter(id__in=ids))
+        else:
+            tasks = list(tasks.filter(**serializer.validated_data['filter']).order_by('id')[:settings.TASK_BULK_RUN_MAX + 1])
+            if len(tasks) > settings.TASK_BULK_RUN_MAX:
+                return Response(
+                    {'detail': f'O filtro seleciona mais de {settings.TASK_BULK_RUN_MAX} tarefas.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        if not tasks:
+            return Response({'detail': 'Nenhuma tarefa encontrada.'}, status=status.HTTP_404_NOT_FOUND)
+
+        found = {task.id for task in tasks}
+        # Tarefas que já têm execução pendente ficam fora do lote
+        tasks, merged = admit_runs(tasks)
+        batch = None
+        if tasks:
+            try:
+                batch = TaskBatch.objects.create(created_by=request.user, total=len(tasks))
+            except Exception:
+                withdraw_runs(tasks)
+                raise
+            enqueue_batch(tasks, batch)
+
+        return Response({
+            'batch': batch.id if batch else None,
+            'status': 'queued' if batch else 'merged',
+            'queued': len(tasks),
+            'merged': [task.id for task in merged],
+            'not_found': [task_id for task_id in dict.fromkeys(ids or []) if task_id not in found],
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path=r'batches/(?P<batch_id>\d+)')
+    def batch(self, request, batch_id=None):
+        """
+        Progresso agregado de um lote disparado por run_bulk.
+        """
+        batch = TaskBatch.objects.filter(id=batch_id).first()
+        if batch is None:
+            return Response({'detail': 'Lote não encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+
+        counts = batch.logs.aggregate(
+            started=Count('id'),
+            running=Count('id', filter=Q(status='running')),
+            success=Count('id', filter=Q(status='success')),
+            error=Count('id', filter=Q(status='error')),
+            timeout=Count('id', filter=Q(status='timeout')),
+        )
+        finished = counts['success'] + counts['error'] + counts['timeout']
+        return Response({
+            'batch': batch.id,
+            'created_at': batch.created_at,
+            'total': batch.total,
+            'queued': max(batch.total - counts['started'], 0),
+            'running': counts['running'],
+            'success': counts['success'],
+            'error': counts['error'],
+            'timeout': counts['timeout'],
+            'progress': round(finished / batch.total * 100, 1) if batch.total else 100.0,
+            'complete': finished >= batch.total,
+        })
+
     @action(detail=True, methods=['get'])
+    @caching.cached_response('logs')
     def logs(self, request, pk=None):
         """
         Retorna o histórico de execuções desta tarefa.
         """
         task = self.get_object()
-        logs = TaskLog.objects.filter(task=task)[:50] # Aumentado para 50
-        serializer = TaskLogSerializer(logs, many=True)
-        return Response(serializer.data)
+        paginator = TaskLogCursorPagination()
+        paginator.page_size = 50
+        logs = paginator.paginate_queryset(with_preview(TaskLog.objects.filter(task=task).select_related('task')), request, view=self)
+        serializer = TaskLogPreviewSerializer(logs, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def output(self, request, pk=None):
+        """
+        Acompanha a saída da execução mais recente desta tarefa a partir de um offset.
+        """
+        task = self.get_object()
+        log = TaskLog.objects.filter(task=task).first()
+        if log is None:
+            return Response({'detail': 'Nenhuma execução encontrada.'}, status=status.HTTP_404_NOT_FOUND)
+        return output_response(log, request)
 
     @action(detail=True, methods=['delete'])
     def clear_logs(self, request, pk=None):
@@ -42,46 +186,264 @@ class TaskViewSet(viewsets.ModelViewSet):
         """
         task = self.get_object()
         deleted_count, _ = TaskLog.objects.filter(task=task).delete()
+        caching.invalidate('tasks', 'logs')
         return Response({'status': 'success', 'message': f'{deleted_count} logs removidos.'})
 
-class TaskLogViewSet(viewsets.ReadOnlyModelViewSet):
+class TaskLogViewSet(async_viewsets.ReadOnlyModelViewSet):
     """
     ViewSet para visualizar logs globais com filtros.
+    A listagem é assíncrona (ver app_api/async_utils.py); as demais ações
+    continuam síncronas.
     """
-    queryset = TaskLog.objects.all().order_by('-created_at')
+    queryset = TaskLog.objects.select_related('task').order_by('-created_at')
     serializer_class = TaskLogSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['status', 'task__task_type', 'task']
-    search_fields = ['task__title', 'status', 'output']
+    pagination_class = TaskLogCursorPagination
+    # ?search= usa o índice textual (FTS5/tsvector) sobre output e error
+    filter_backends = [DjangoFilterBackend, search.TaskLogSearchFilter, filters.OrderingFilter]
+    filterset_fields = ['status', 'task__task_type', 'task', 'batch']
+    search_fields = ['task__title', 'status', 'output', 'error']
     ordering_fields = ['created_at', 'duration']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'search'):
+            queryset = with_preview(queryset)
+        return queryset
 
-@api_view(['GET'])
-@permission_classes([permissions.IsAuthenticated])
-def dashboard_stats(request):
-    """
-    Retorna estatísticas para o dashboard.
-    """
-    total_tasks = Task.objects.count()
-    active_tasks = Task.objects.filter(enabled=True).count()
-    
-    # Logs das últimas 24h ou geral
-    total_executions = TaskLog.objects.count()
-    failed_executions = TaskLog.objects.filter(status='error').count()
-    
-    # Calcular taxa de sucesso
-    success_rate = 0
-    if total_executions > 0:
-        success_count = TaskLog.objects.filter(status='success').count()
-        success_rate = round((success_count / total_executions) * 100, 1)
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return TaskLogPreviewSerializer
+        return super().get_serializer_class()
+
+    @caching.cached_response('logs')
+    async def list(self, request, *args, **kwargs):
+        # Filtros, busca e paginação são ORM síncrono: rodam em uma thread do pool
+        return await in_thread(super().list)(request, *args, **kwargs)
+
+    @action(detail=True, methods=['get'])
+    def output(self, request, pk=None):
+        """
+        Retorna a saída do log a partir de um offset em bytes.
+        Parâmetros: stream (stdout|stderr), offset, limit.
+        """
+        return output_response(self.get_object(), request)
+
+    @action(detail=True, methods=['get'])
+    def raw(self, request, pk=None):
+        """
+        Saída completa do log como texto. Saídas no blob store são servidas
+        do arquivo, com suporte a Range; as demais vão em streaming a partir
+        dos trechos (descomprimidos um a um). Parâmetro: stream (stdout|stderr).
+        """
+        stream = request.query_params.get('stream', 'stdout')
+        if stream not in ('stdout', 'stderr'):
+            return Response({'detail': 'stream deve ser stdout ou stderr.'}, status=status.HTTP_400_BAD_REQUEST)
+        log = self.get_object()
+        blob = log.blob(stream)
+        if blob is not None:
+            response = blob_response(request, *blob)
+        else:
+            response = StreamingHttpResponse(log.iter_output(stream), content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'inline; filename="log-{log.id}-{stream}.txt"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Busca ordenada por relevância na saída dos logs.
+        Parâmetros: q (o último termo vale como prefixo) e limit.
+        """
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({'detail': 'Informe o parâmetro q.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), settings.TASK_LOG_SEARCH_MAX_RESULTS)
+        except ValueError:
+            return Response({'detail': 'limit deve ser um inteiro.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Filtros de status/tarefa continuam valendo (?status=error&task=3)
+        queryset = DjangoFilterBackend().filter_queryset(request, self.get_queryset(), self)
+        logs = search.ranked_logs(text, limit, queryset)
+        data = TaskLogPreviewSerializer(logs, many=True).data
+        for item, log in zip(data, logs):
+            item['rank'] = log.rank
+        return Response({'backend': search.backend(), 'results': data})
+
+
+def output_response(log, request):
+    """
+    Monta a resposta de leitura incremental da saída de um log.
+    O cliente repete a chamada com `offset=next_offset` até `complete` ser true.
+    """
+    stream = request.query_params.get('stream', 'stdout')
+    if stream not in ('stdout', 'stderr'):
+        return Response({'detail': 'stream deve ser stdout ou stderr.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        offset = max(int(request.query_params.get('offset', 0)), 0)
+        limit = min(max(int(request.query_params.get('limit', OUTPUT_DEFAULT_LIMIT)), 1), OUTPUT_MAX_LIMIT)
+    except ValueError:
+        return Response({'detail': 'offset e limit devem ser inteiros.'}, status=status.HTTP_400_BAD_REQUEST)
 
+    try:
+        data, next_offset = log.read_output(stream, offset, limit)
+    except FileNotFoundError:
+        logger.error(f"Output blob {log.blob(stream)[0]} of TaskLog {log.id} not found in the blob store")
+        return Response({'detail': MISSING_BLOB_DETAIL}, status=status.HTTP_404_NOT_FOUND)
     return Response({
-        'total_tasks': total_tasks,
-        'active_tasks': active_tasks,
-        'total_executions': total_executions,
-        'failed_executions': failed_executions,
-        'success_rate': success_rate,
-        # 'workers_online': 1 # Placeholder, difícil obter sem conexão direta com Celery Control
+        'log': log.id,
+        'status': log.status,
+        'stream': stream,
+        'offset': offset,
+        'next_offset': next_offset,
+        'data': data,
+        'complete': log.status != 'running' and next_offset == offset,
     })
 
+
+class WorkflowViewSet(viewsets.ModelViewSet):
+    """
+    Workflows: tarefas encadeadas por dependências (ver tasks/workflows.py).
+    """
+    queryset = Workflow.objects.prefetch_related('steps__depends_on').order_by('-created_at')
+    serializer_class = WorkflowSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    @action(detail=True, methods=['post'])
+    def run(self, request, pk=None):
+        """
+        Dispara uma execução do workflow. Os passos sem dependências vão
+        para a fila na hora; os demais, quando as dependências terminarem.
+        """
+        workflow = self.get_object()
+        run, ready = workflows.start(workflow, request.user)
+        enqueue_steps(ready)
+        return Response(
+            {'run': run.id, 'status': 'queued', 'message': 'Workflow enviado para execução.'},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+    @action(detail=True, methods=['get'])
+    def runs(self, request, pk=None):
+        """
+        Histórico de execuções deste workflow.
+        """
+        workflow = self.get_object()
+        page = self.paginate_queryset(workflow_runs().filter(workflow=workflow))
+        return self.get_paginated_response(WorkflowRunSerializer(page, many=True).data)
+
+
+def workflow_runs():
+    """Execuções com os passos e o log de cada passo carregados de uma vez."""
+    logs = TaskLog.objects.only('id', 'workflow_step_id').order_by('-id')
+    steps = WorkflowStepRun.objects.select_related('step').prefetch_related(Prefetch('logs', queryset=logs))
+    return WorkflowRun.objects.select_related('workflow').prefetch_related(Prefetch('steps', queryset=steps)).order_by('-created_at')
+
+
+class WorkflowRunViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Execuções de workflows: estado de cada passo, duração total e caminho crítico.
+    """
+    queryset = workflow_runs()
+    serializer_class = WorkflowRunSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filterset_fields = ['workflow', 'status']
+
+
+class _RangeFile:
+    """
+    Lê no máximo `length` bytes a partir da posição atual do arquivo.
+    Mantém fileno(): o gunicorn faz sendfile a partir da posição do
+    descritor, limitado pelo Content-Length.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def blob_response(request, digest, size):
+    """
+    Serve um blob de saída, inteiro ou o intervalo pedido no cabeçalho
+    Range (um só; outros formatos recebem o conteúdo inteiro).
+    """
+    start, end = 0, size - 1
+    match = RANGE_PATTERN.match(request.headers.get('Range', '').strip())
+    partial = bool(match and (match.group(1) or match.group(2)))
+    if partial:
+        if match.group(1):
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(int(match.group(2)), size - 1)
+        else:
+            start = max(size - int(match.group(2)), 0)
+        if start > end:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    try:
+        file = blobstore.get_store().open(digest)
+    except FileNotFoundError:
+        # Referência no TaskLog sem o arquivo (blob removido ou volume trocado)
+        logger.error(f"Output blob {digest} not found in the blob store")
+        return Response({'detail': MISSING_BLOB_DETAIL}, status=status.HTTP_404_NOT_FOUND)
+    file.seek(start)
+    response = FileResponse(
+        _RangeFile(file, end - start + 1),
+        status=status.HTTP_206_PARTIAL_CONTENT if partial else status.HTTP_200_OK,
+        content_type='text/plain; charset=utf-8',
+    )
+    response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    # O conteúdo de um blob nunca muda: o hash serve de ETag
+    response['ETag'] = f'"{digest}"'
+    if partial:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+@async_api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@caching.cached_response('stats')
+async def dashboard_stats(request):
+    """
+    Retorna estatísticas para o dashboard a partir dos agregados por hora.
+    Parâmetros: window (24h|7d|30d|all), task (id) e breakdown=1 (por tarefa).
+    """
+    window = request.query_params.get('window', 'all')
+    if window not in stats.WINDOWS:
+        return Response({'detail': f"window deve ser um de: {', '.join(stats.WINDOWS)}."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        task_id = int(request.query_params['task']) if request.query_params.get('task') else None
+    except ValueError:
+        return Response({'detail': 'task deve ser um inteiro.'}, status=status.HTTP_400_BAD_REQUEST)
+    breakdown = request.query_params.get('breakdown') in ('1', 'true')
+
+    return Response(await in_thread(stats.get_stats)(window, task_id, breakdown))
+
+
+@async_api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+async def events_ticket(request):
+    """
+    Emite um ticket de curta duração para /api/events/ (ver
+    tasks/events.py), que não vale como JWT nas demais rotas.
+    """
+    token_expires = request.auth.get('exp') if request.auth is not None else None
+    ticket, expires = events.issue_ticket(request.user, token_expires)
+    return Response({'ticket': ticket, 'expires_at': expires})
@@ -0,0 +1,204 @@
+"""
+Execução de workflows (grafos de dependência entre tarefas).
+
+Um WorkflowRun cria um WorkflowStepRun por passo, com `waiting` igual ao
+número de dependências. Os passos sem dependência são enviados juntos
+(tasks.enqueue_steps, um group como no run_bulk). Quando o execute_task
+de um passo termina, step_finished grava o resultado e decrementa
+`waiting` dos dependentes; os que chegam a zero são enviados na hora. Assim
+cada passo começa assim que as suas dependências terminam e ramos
+independentes rodam em paralelo em workers diferentes, sem a espera por
+nível de um chain de groups (que também não representa qualquer grafo).
+
+Cada passo recebe a saída (stdout) das dependências: scripts na variável
+global `inputs` ({nome do passo: saída}); comandos em um arquivo JSON
+indicado pela variável de ambiente WORKFLOW_INPUTS. A saída repassada é
+a completa, não a cópia truncada do TaskLog; um passo com stdout maior que
+WORKFLOW_INPUT_MAX_CHARS termina com erro.
+
+Um passo que não termina com sucesso cancela todos os que dependem dele,
+direta ou indiretamente, e a execução termina com erro. No fim, o
+caminho crítico (a cadeia de dependências com a maior soma de durações)
+fica registrado no WorkflowRun ao lado da duração total.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import WorkflowRun, WorkflowStep, WorkflowStepRun
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ('success', 'error', 'timeout', 'skipped', 'cancelled')
+
+
+def topological_order(dependencies):
+    """
+    Ordena os passos ({nome: [dependências]}) de forma que cada um venha
+    depois das suas dependências. ValueError se houver ciclo.
+    """
+    order = []
+    state = {}
+
+    def visit(name, path):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            cycle = path[path.index(name):] + [name]
+            raise ValueError(f"Dependência circular: {' -> '.join(cycle)}")
+        state[name] = 'visiting'
+        for dependency in dependencies[name]:
+            visit(dependency, path + [name])
+        state[name] = 'done'
+        order.append(name)
+
+    for name in dependencies:
+        visit(name, [])
+    return order
+
+
+def _edges(workflow_id):
+    """{id do passo: [ids das dependências]} do workflow."""
+    edges = defaultdict(list)
+    through = WorkflowStep.depends_on.through.objects.filter(from_workflowstep__workflow_id=workflow_id)
+    for step_id, dependency_id in through.values_list('from_workflowstep_id', 'to_workflowstep_id'):
+        edges[step_id].append(dependency_id)
+    return edges
+
+
+def start(workflow, user=None):
+    """
+    Cria a execução do workflow. Retorna (run, passos prontos para envio).
+    """
+    steps = list(workflow.steps.select_related('task'))
+    edges = _edges(workflow.id)
+    with transaction.atomic():
+        run = WorkflowRun.objects.create(workflow=workflow, created_by=user)
+        step_runs = WorkflowStepRun.objects.bulk_create([
+            WorkflowStepRun(
+                run=run,
+                step=step,
+                name=step.name,
+                waiting=len(edges[step.id]),
+                status='pending' if edges[step.id] else 'queued',
+            )
+            for step in steps
+        ])
+    ready = [step_run for step_run in step_runs if step_run.status == 'queued']
+    for step_run in ready:
+        step_run.inputs = {}
+    return run, ready
+
+
+def step_started(step_run_id):
+    WorkflowStepRun.objects.filter(id=step_run_id, status='queued').update(status='running', started_at=timezone.now())
+
+
+def step_finished(step_run_id, status, output='', duration=None):
+    """
+    Registra o fim de um passo e libera os dependentes. Retorna os passos
+    que ficaram prontos, com `inputs` preenchido, para o chamador enviar.
+    """
+    with transaction.atomic():
+        run_id = WorkflowStepRun.objects.filter(id=step_run_id).values_list('run_id', flat=True).first()
+        if run_id is None:
+            return []
+        # Serializa o fim dos passos da mesma execução
+        run = WorkflowRun.objects.select_for_update().get(id=run_id)
+        step_run = WorkflowStepRun.objects.get(id=step_run_id)
+        if step_run.status in FINISHED:
+            # Mensagem repetida (ex.: reentrega após queda do worker)
+            return []
+
+        now = timezone.now()
+        step_run.status = status
+        step_run.output = output if status == 'success' else ''
+        step_run.finished_at = now
+        step_run.started_at = step_run.started_at or now
+        step_run.duration = duration
+        step_run.save(update_fields=['status', 'output', 'started_at', 'finished_at', 'duration'])
+
+        step_runs = list(run.steps.select_related('step__task'))
+        by_step = {other.step_id: other for other in step_runs if other.step_id is not None}
+        edges = _edges(run.workflow_id)
+        dependents = defaultdict(list)
+        for step_id, dependencies in edges.items():
+            for dependency_id in dependencies:
+                dependents[dependency_id].append(step_id)
+
+        ready = []
+        if status == 'success':
+            for step_id in dependents[step_run.step_id]:
+                other = by_step.get(step_id)
+                if other is None or other.status != 'pending':
+                    continue
+                other.waiting -= 1
+                if other.waiting == 0:
+                    other.status = 'queued'
+                    ready.append(other)
+                other.save(update_fields=['waiting', 'status'])
+        else:
+            # Cancela tudo o que depende (direta ou indiretamente) deste passo
+            queue = list(dependents[step_run.step_id])
+            while queue:
+                other = by_step.get(queue.pop())
+                if other is not None and other.status == 'pending':
+                    other.status = 'cancelled'
+                    other.finished_at = now
+                    other.save(update_fields=['status', 'finished_at'])
+                    queue.extend(dependents[other.step_id])
+
+        if all(other.status in FINISHED for other in step_runs):
+            _finish_run(run, step_runs, edges, now)
+
+    for other in ready:
+        other.inputs = {
+            by_step[dependency_id].name: by_step[dependency_id].output
+            for dependency_id in edges[other.step_id]
+            if dependency_id in by_step
+        }
+    return ready
+
+
+def critical_path(step_runs, edges):
+    """
+    Cadeia de dependências com a maior soma de durações, entre os passos
+    que chegaram a rodar. Retorna (nomes dos passos, soma das durações).
+    """
+    by_step = {
+        step_run.step_id: step_run
+        for step_run in step_runs
+        if step_run.step_id is not None and step_run.duration is not None
+    }
+    order = topological_order({step_id: [d for d in edges[step_id] if d in by_step] for step_id in by_step})
+    best = {}
+    previous = {}
+    for step_id in order:
+        before = max(edges[step_id], key=lambda d: best.get(d, 0), default=None)
+        previous[step_id] = before if before in best else None
+        best[step_id] = (best[before] if before in best else 0) + by_step[step_id].duration
+    if not best:
+        return [], 0
+    step_id = max(best, key=best.get)
+    total = best[step_id]
+    path = []
+    while step_id is not None:
+        path.append(by_step[step_id].name)
+        step_id = previous[step_id]
+    return path[::-1], total
+
+
+def _finish_run(run, step_runs, edges, now):
+    path, total = critical_path(step_runs, edges)
+    run.status = 'success' if all(step_run.status == 'success' for step_run in step_runs) else 'error'
+    run.finished_at = now
+    run.duration = (now - run.created_at).total_seconds()
+    run.critical_path = path
+    run.critical_path_duration = round(total, 3)
+    run.save(update_fields=['status', 'finished_at', 'duration', 'critical_path', 'critical_path_duration'])
+    logger.info(
+        f"Workflow run {run.id} finished with {run.status} in {run.duration:.2f}s "
+        f"(critical path {run.critical_path_duration:.2f}s: {' -> '.join(path)})"
+    )